@@ -0,0 +1,352 @@
+# Last- und Benchmark-Suite für den Labeling-Ablauf
+#
+# Treibt die App über Streamlits AppTest durch ID -> Intro -> Initialisierung -> N x Speichern/
+# Überspringen/Zurück. Als Sheet dient das Backend "fake_gsheets" (einstellbare Latenz, vorbefüllt),
+# die Tweet-Vorschauen kommen von einem lokalen oEmbed-Mock (ebenfalls mit Latenz).
+#
+# Aufruf im Projektordner:
+#   python benchmarks/bench_labeling.py --out bench.json
+#   python benchmarks/bench_labeling.py --quick --out bench.json --compare alt.json
+#
+# Szenarien (einzeln abwählbar über --skip):
+#   clicks      p50/p95 pro Klick (Speichern, Überspringen, Zurück) in einer Session
+#   init        Initialisierungszeit gegen Sheet-Größe (Standard: 1k, 10k, 100k, 1M Zeilen)
+#   memory      Spitzen- und verbleibender Speicher pro Session (tracemalloc)
+#   throughput  Speichervorgänge pro Sekunde mit vielen gleichzeitigen Labelern
+#
+# AppTest ist nicht threadsicher (eine globale Test-Runtime pro Lauf). Gleichzeitige Labeler laufen
+# daher in eigenen Threads, ihre Skript-Läufe aber nacheinander – wie Sessions, die sich auf einem
+# Server den GIL teilen. Die gemessene Klick-Latenz enthält diese Wartezeit; Hintergrund-Threads der
+# App (Writer, Prefetch, Verbindung) laufen echt parallel.
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from labeler_storage import FakeWorksheet
+from mock_endpoints import OEmbedMock, write_input_csv, prefill_rows
+
+APP_PATH = os.path.join(REPO_DIR, "image_labeler.py")
+INTRO_BUTTON_PREFIX = "✅" # "✅ Verstanden, starte das Labeling!"
+ACTIONS = {"save": "save_next_bottom", "skip": "skip_next_top", "back": "back_bottom"}
+
+_run_lock = threading.Lock() # Serialisiert AppTest-Läufe (siehe oben)
+
+
+def run(element_or_app):
+    """`.run()` unter dem globalen Lauf-Lock."""
+    with _run_lock: return element_or_app.run()
+
+
+# === Messhilfen ===
+def percentiles(values):
+    """p50/p95/Mittel/Max in Millisekunden."""
+    if not values: return {"n": 0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {"n": len(values), "p50_ms": pick(0.50) * 1000, "p95_ms": pick(0.95) * 1000,
+            "mean_ms": statistics.fmean(values) * 1000, "max_ms": ordered[-1] * 1000}
+
+
+class UiSleepMeter:
+    """Zählt die time.sleep()-Zeit, die die App selbst im Skript-Thread verbringt (Hinweis-Pausen).
+
+    Das Verhalten der App bleibt unverändert; die Pausen werden nur gemessen, damit Init-Zeiten mit
+    und ohne sie verglichen werden können.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._sleep = time.sleep
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        meter = self
+        def sleep(seconds):
+            if sys._getframe(1).f_code.co_filename == APP_PATH:
+                with meter._lock: meter.seconds += seconds
+            meter._sleep(seconds)
+        time.sleep = sleep
+        return self
+
+    def __exit__(self, *exc):
+        time.sleep = self._sleep
+
+
+class BenchEnv:
+    """Frische Prozess-Umgebung für ein Szenario: eigene Caches, eigener State-Ordner, eigenes Fake-Sheet."""
+
+    counter = 0
+
+    def __init__(self, workdir, args, oembed, sheet_rows=None):
+        BenchEnv.counter += 1
+        self.input_path = os.path.join(workdir, "input.csv")
+        self.name = f"bench-{BenchEnv.counter}"
+        self.state_dir = os.path.join(workdir, f"state-{BenchEnv.counter}")
+        self.args = args
+        self.oembed = oembed
+        st.cache_resource.clear(); st.cache_data.clear() # Sonst teilen sich die Szenarien Verbindung, Index und Scheduler
+        FakeWorksheet.shared(self.name).rows = sheet_rows if sheet_rows is not None else []
+
+    def secrets(self):
+        return {
+            "storage": {"backend": "fake_gsheets", "fake_sheet": self.name, "fake_latency_ms": self.args.sheets_latency_ms,
+                        "reads_per_minute": 100000, "writes_per_minute": 100000},
+            "labeler": {"local_state_dir": self.state_dir, "input_file": self.input_path, "oembed_endpoint": self.oembed.endpoint, "sidebar_refresh_seconds": 0},
+        }
+
+    def new_session(self):
+        at = AppTest.from_file(APP_PATH, default_timeout=self.args.timeout)
+        for section, values in self.secrets().items(): at.secrets[section] = values
+        return at
+
+    def pending_writes(self):
+        """Zeilen, die noch im Journal der Write-Behind-Queue stehen."""
+        journal = os.path.join(self.state_dir, "save_journal.sqlite")
+        if not os.path.exists(journal): return 0
+        conn = sqlite3.connect(journal)
+        try: return conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+        finally: conn.close()
+
+    def wait_for_writes(self, timeout=60.0):
+        """Wartet, bis die App alles ins Fake-Sheet geschrieben hat. Gibt die Wartezeit zurück."""
+        start = time.perf_counter()
+        while self.pending_writes() and time.perf_counter() - start < timeout: time.sleep(0.05)
+        return time.perf_counter() - start
+
+
+# === Session-Ablauf ===
+def start_session(at, labeler_id):
+    """ID eingeben, Intro bestätigen, bis zur fertigen Initialisierung laufen. Gibt (Init-Sekunden, UI-Pausen) zurück."""
+    run(at)
+    run(at.text_input(key="labeler_id_widget").input(labeler_id))
+    intro_button = next(b for b in at.button if b.label.startswith(INTRO_BUTTON_PREFIX))
+    with UiSleepMeter() as meter:
+        start = time.perf_counter()
+        run(intro_button.click())
+        while not at.session_state["initialized"] and not at.exception: run(at)
+        elapsed = time.perf_counter() - start
+    if at.exception: raise RuntimeError(f"App-Fehler bei der Initialisierung: {at.exception[0].value}")
+    return elapsed, meter.seconds
+
+
+def click(at, action):
+    """Führt eine Aktion aus und gibt die Dauer des Reruns zurück (None, wenn der Button fehlt)."""
+    button = next((b for b in at.button if b.key == ACTIONS[action]), None)
+    if button is None: return None
+    start = time.perf_counter()
+    run(button.click())
+    elapsed = time.perf_counter() - start
+    if at.exception: raise RuntimeError(f"App-Fehler bei '{action}': {at.exception[0].value}")
+    return elapsed
+
+
+def action_sequence(n_clicks, seed, save_share=0.7, skip_share=0.15):
+    """Reproduzierbare Klickfolge; Rest nach Speichern/Überspringen ist "Zurück"."""
+    rng = random.Random(seed)
+    sequence = []
+    for _ in range(n_clicks):
+        r = rng.random()
+        sequence.append("save" if r < save_share else "skip" if r < save_share + skip_share else "back")
+    return sequence
+
+
+# === Szenarien ===
+def bench_clicks(workdir, args, oembed):
+    env = BenchEnv(workdir, args, oembed)
+    at = env.new_session()
+    init_seconds, ui_sleep = start_session(at, "bench-clicks")
+    latencies = {action: [] for action in ACTIONS}
+    for action in action_sequence(args.clicks, args.seed):
+        elapsed = click(at, action)
+        if elapsed is not None: latencies[action].append(elapsed)
+    result = {action: percentiles(values) for action, values in latencies.items()}
+    result["all"] = percentiles([v for values in latencies.values() for v in values])
+    result["init_seconds"] = init_seconds; result["init_ui_sleep_seconds"] = ui_sleep
+    result["flush_wait_seconds"] = env.wait_for_writes()
+    return result
+
+
+def bench_init(workdir, args, oembed, input_urls):
+    results = []
+    labelers = [f"labeler{i}" for i in range(args.labelers_in_sheet)] + ["bench-init"]
+    for size in args.sheet_sizes:
+        rows = prefill_rows(size, input_urls, labelers, seed=args.seed)
+        env = BenchEnv(workdir, args, oembed, sheet_rows=rows)
+        del rows
+        init_seconds, ui_sleep = start_session(env.new_session(), "bench-init")
+        # Zweite Session im selben Prozess: Index und URL-Tabelle sind warm, nur noch neue Zeilen werden gelesen
+        warm_seconds, warm_sleep = start_session(env.new_session(), labelers[0])
+        results.append({"sheet_rows": size, "cold_seconds": init_seconds, "cold_without_ui_sleep_seconds": init_seconds - ui_sleep,
+                        "warm_seconds": warm_seconds, "warm_without_ui_sleep_seconds": warm_seconds - warm_sleep})
+        print(f"  init: {size:>8} Zeilen -> kalt {init_seconds - ui_sleep:.3f}s, warm {warm_seconds - warm_sleep:.3f}s (ohne UI-Pausen)")
+        FakeWorksheet.shared(env.name).rows = []
+    return results
+
+
+def bench_memory(workdir, args, oembed):
+    env = BenchEnv(workdir, args, oembed)
+    results = []
+    tracemalloc.start()
+    try:
+        for i in range(args.memory_sessions):
+            before, _ = tracemalloc.get_traced_memory(); tracemalloc.reset_peak()
+            at = env.new_session()
+            start_session(at, f"bench-mem-{i}")
+            for action in action_sequence(args.memory_clicks, args.seed + i): click(at, action)
+            current, peak = tracemalloc.get_traced_memory()
+            results.append({"peak_bytes": peak - before, "retained_bytes": current - before})
+            del at
+    finally: tracemalloc.stop()
+    return {"sessions": results,
+            "peak_bytes_max": max(r["peak_bytes"] for r in results),
+            "retained_bytes_median": statistics.median(r["retained_bytes"] for r in results)}
+
+
+def bench_throughput(workdir, args, oembed):
+    results = []
+    for n_labelers in args.concurrency:
+        env = BenchEnv(workdir, args, oembed)
+        latencies, errors, lock = [], [], threading.Lock()
+        barrier = threading.Barrier(n_labelers + 1)
+
+        def labeler(i):
+            try:
+                at = env.new_session()
+                start_session(at, f"bench-load-{i}")
+                barrier.wait()
+                own = [click(at, "save") for _ in range(args.saves_per_labeler)]
+                with lock: latencies.extend(v for v in own if v is not None)
+            except Exception as e:
+                with lock: errors.append(f"{type(e).__name__}: {e}")
+                barrier.abort()
+
+        threads = [threading.Thread(target=labeler, args=(i,), name=f"bench-labeler-{i}") for i in range(n_labelers)]
+        for t in threads: t.start()
+        try: barrier.wait()
+        except threading.BrokenBarrierError: pass
+        start = time.perf_counter()
+        for t in threads: t.join()
+        click_seconds = time.perf_counter() - start
+        flush_seconds = env.wait_for_writes()
+        saves = len(latencies)
+        results.append({"labelers": n_labelers, "saves": saves, "errors": errors,
+                        "saves_per_second": saves / click_seconds if click_seconds else 0.0,
+                        "saves_per_second_incl_flush": saves / (click_seconds + flush_seconds) if click_seconds else 0.0,
+                        "click_latency": percentiles(latencies),
+                        "sheet_rows_after": len(FakeWorksheet.shared(env.name).rows) - 1})
+        print(f"  durchsatz: {n_labelers:>3} Labeler -> {results[-1]['saves_per_second']:.1f} Speichervorgänge/s, p95 {results[-1]['click_latency'].get('p95_ms', 0):.0f} ms")
+    return results
+
+
+# === Vergleich ===
+def flatten(data, prefix=""):
+    """Verschachteltes JSON -> {"a.b.c": Zahl} (nur Zahlen, Listen über ihren Index bzw. 'sheet_rows'/'labelers')."""
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items(): flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            label = value.get("sheet_rows", value.get("labelers", i)) if isinstance(value, dict) else i
+            flat.update(flatten(value, f"{prefix}{label}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool): flat[prefix.rstrip(".")] = data
+    return flat
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f: baseline = json.load(f)
+    old, new = flatten(baseline.get("results", {})), flatten(current.get("results", {}))
+    print(f"\nVergleich mit {baseline_path}:")
+    keys = [key for key in sorted(set(old) & set(new)) if any(token in key for token in ("p50_ms", "p95_ms", "seconds", "per_second", "bytes"))]
+    if not keys: print("  (keine gemeinsamen Kennzahlen – andere Szenarien oder Größen?)")
+    for key in keys:
+        delta = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"  {key:<60} {old[key]:>12.2f} -> {new[key]:>12.2f} ({delta:+.1f} %)")
+
+
+def git_revision():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception: return None
+
+
+def parse_int_list(value):
+    return [int(float(v)) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks für den Labeling-Ablauf (AppTest + Mocks).")
+    parser.add_argument("--out", default="bench.json", help="Ergebnis-Datei (JSON)")
+    parser.add_argument("--compare", default=None, help="Älteres Ergebnis zum Vergleich")
+    parser.add_argument("--quick", action="store_true", help="Kleine Größen für einen schnellen Durchlauf")
+    parser.add_argument("--skip", default="", help="Kommagetrennte Szenarien, die ausgelassen werden (clicks,init,memory,throughput)")
+    parser.add_argument("--items", type=int, default=20000, help="URLs in der synthetischen Input-Datei")
+    parser.add_argument("--clicks", type=int, default=200, help="Klicks im Szenario 'clicks'")
+    parser.add_argument("--sheet-sizes", type=parse_int_list, default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--labelers-in-sheet", type=int, default=30, help="Verschiedene Labeler im vorbefüllten Sheet")
+    parser.add_argument("--memory-sessions", type=int, default=5)
+    parser.add_argument("--memory-clicks", type=int, default=30)
+    parser.add_argument("--concurrency", type=parse_int_list, default=[1, 4, 16], help="Gleichzeitige Labeler pro Durchsatz-Lauf")
+    parser.add_argument("--saves-per-labeler", type=int, default=30)
+    parser.add_argument("--sheets-latency-ms", type=float, default=80.0, help="Latenz pro Fake-Sheets-Aufruf")
+    parser.add_argument("--oembed-latency-ms", type=float, default=150.0, help="Latenz pro oEmbed-Abruf")
+    parser.add_argument("--oembed-error-rate", type=float, default=0.02)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout pro AppTest-Lauf in Sekunden")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.items, args.clicks, args.sheet_sizes = 2000, 40, [1_000, 10_000]
+        args.memory_sessions, args.memory_clicks, args.concurrency, args.saves_per_labeler = 2, 10, [1, 4], 10
+    skip = {s.strip() for s in args.skip.split(",") if s.strip()}
+
+    resolve = lambda path: path if os.path.isabs(path) else os.path.join(REPO_DIR, path)
+    out_path, compare_path = resolve(args.out), resolve(args.compare) if args.compare else None
+    if compare_path and not os.path.exists(compare_path): print(f"Vergleichsdatei '{compare_path}' nicht gefunden."); return 1
+
+    # Die App bekommt Input-Datei und State-Ordner über die Secrets; das Arbeitsverzeichnis bleibt unverändert
+    workdir = tempfile.mkdtemp(prefix="labeler-bench-")
+    results = {}
+    try:
+        input_urls = write_input_csv(os.path.join(workdir, "input.csv"), args.items, seed=args.seed)
+        print(f"Arbeitsordner: {workdir} ({args.items} URLs)")
+        with OEmbedMock(args.oembed_latency_ms, args.oembed_error_rate, seed=args.seed) as oembed:
+            if "clicks" not in skip: print("Szenario: clicks"); results["clicks"] = bench_clicks(workdir, args, oembed)
+            if "init" not in skip: print("Szenario: init"); results["init_vs_sheet_size"] = bench_init(workdir, args, oembed, input_urls)
+            if "memory" not in skip: print("Szenario: memory"); results["memory_per_session"] = bench_memory(workdir, args, oembed)
+            if "throughput" not in skip: print("Szenario: throughput"); results["throughput"] = bench_throughput(workdir, args, oembed)
+            oembed_requests = oembed.requests
+    finally:
+        st.cache_resource.clear() # Writer-Threads und SQLite-Verbindungen der App vor dem Aufräumen freigeben
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {"created": datetime.now().isoformat(timespec="seconds"), "git": git_revision(), "python": platform.python_version(),
+                 "streamlit": st.__version__, "platform": platform.platform(), "oembed_requests": oembed_requests,
+                 "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare")}},
+        "results": results,
+    }
+    with open(out_path, "w", encoding="utf-8") as f: json.dump(report, f, indent=2)
+    print(f"Ergebnisse: {out_path}")
+    if "clicks" in results: print(f"Klick-Latenz gesamt: p50 {results['clicks']['all']['p50_ms']:.0f} ms, p95 {results['clicks']['all']['p95_ms']:.0f} ms")
+    if compare_path: compare(report, compare_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
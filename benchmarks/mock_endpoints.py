@@ -0,0 +1,99 @@
+# Mocks und synthetische Daten für die Benchmarks
+#
+# - OEmbedMock:      lokaler HTTP-Server, der oEmbed-Antworten mit einstellbarer Latenz liefert
+# - write_input_csv: Input-Datei mit synthetischen Tweet-URLs (inkl. /photo/N-Varianten und Duplikaten)
+# - prefill_rows:    Ergebniszeilen für ein vorbefülltes Fake-Sheet (1k bis 1M Zeilen)
+#
+# Das Sheet selbst wird über das Backend "fake_gsheets" der App gemockt (labeler_storage.FakeWorksheet).
+import csv
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from labeler_storage import HEADER, COL_TS, COL_LBL, COL_URL, COL_CATS, COL_COMMENT
+from labeler_codebook import ALL_CATEGORIES_KEYS
+
+
+class OEmbedMock:
+    """oEmbed-Endpunkt auf 127.0.0.1 mit `latency_ms` Verzögerung und `error_rate` Anteil 404-Antworten.
+
+    Als Kontextmanager verwenden; `endpoint` ist die URL für `[labeler] oembed_endpoint`.
+    """
+
+    def __init__(self, latency_ms=150.0, error_rate=0.0, seed=0):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with mock._lock: mock.requests += 1; fail = mock._rng.random() < mock.error_rate
+                time.sleep(mock.latency)
+                if fail: self.send_response(404); self.end_headers(); return
+                tweet_url = parse_qs(urlparse(self.path).query).get("url", [""])[0]
+                body = json.dumps({"html": f'<blockquote class="twitter-tweet"><a href="{tweet_url}">{tweet_url}</a></blockquote>'}).encode()
+                self.send_response(200); self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(body)))
+                self.end_headers(); self.wfile.write(body)
+
+            def log_message(self, *args): pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="oembed-mock", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown(); self._server.server_close()
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/oembed"
+
+
+def synthetic_urls(n_items, seed=0):
+    """`n_items` verschiedene Tweet-URLs (Status-IDs eindeutig, Nutzernamen wiederholen sich)."""
+    rng = random.Random(seed)
+    return [f"https://x.com/user{rng.randrange(5000)}/status/{1_700_000_000_000_000_000 + i}" for i in range(n_items)]
+
+
+def write_input_csv(path, n_items, variant_share=0.05, seed=0):
+    """Schreibt eine Input-Datei wie input.csv: eine URL pro Zeile, dazu Varianten/Duplikate. Gibt die Basis-URLs zurück."""
+    rng = random.Random(seed)
+    urls = synthetic_urls(n_items, seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for url in urls:
+            writer.writerow([url])
+            if rng.random() < variant_share: writer.writerow([f"{url}/photo/{rng.randint(1, 4)}" if rng.random() < 0.5 else f"{url}?s=20"])
+    return urls
+
+
+def prefill_rows(n_rows, urls, labelers, seed=0):
+    """Header + `n_rows` Ergebniszeilen zufälliger Labeler für zufällige URLs.
+
+    Strings werden wiederverwendet (Zeitstempel, Labeler, Kategorien), damit auch 1M Zeilen in
+    den Speicher passen.
+    """
+    rng = random.Random(seed)
+    timestamp = "2025-01-01 12:00:00 CET+0100"
+    category_pool = ["; ".join(sorted(rng.sample(ALL_CATEGORIES_KEYS, rng.randint(0, 2)))) for _ in range(64)]
+    positions = {col: HEADER.index(col) for col in (COL_TS, COL_LBL, COL_URL, COL_CATS, COL_COMMENT)}
+    rows = [list(HEADER)]
+    for _ in range(n_rows):
+        row = [""] * len(HEADER)
+        row[positions[COL_TS]] = timestamp
+        row[positions[COL_LBL]] = labelers[rng.randrange(len(labelers))]
+        row[positions[COL_URL]] = urls[rng.randrange(len(urls))]
+        row[positions[COL_CATS]] = category_pool[rng.randrange(len(category_pool))]
+        rows.append(row)
+    return rows
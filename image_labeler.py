@@ -1,236 +1,644 @@
 # Importiere notwendige Bibliotheken
 import streamlit as st
-import pandas as pd
 import os
-import random
-import requests
-from urllib.parse import urlparse
 import time
-import re
-import gspread # Für Google Sheets
-from google.oauth2.service_account import Credentials # Für Authentifizierung
+_script_start = time.perf_counter() # Für den Kaltstart-Bericht
 from datetime import datetime # Für Zeitstempel
-import pytz # Für Zeitzonen
 import streamlit.components.v1 as components # Für HTML Einbettung
-import hashlib # Für Seed-Generierung
+import atexit # Für letzten Flush der Schreib-Queue
+import logging # Meldungen der labeler_*-Module
+from concurrent.futures import ThreadPoolExecutor # Verbindungsaufbau im Hintergrund
+from labeler_storage import make_backend, WRITE_MODES, HEADER, COL_LBL, COL_URL, TIMEZONE, TIMESTAMP_FORMAT, is_sheets_api_error, is_sheet_not_found # Austauschbares Speicher-Backend + Ergebnis-Spalten
+from labeler_writer import WriteBehindQueue # Asynchrones Speichern
+from labeler_progress import ProgressIndex # Inkrementeller Fortschritts-Index
+from labeler_codebook import CATEGORIES, ALL_CATEGORIES_KEYS, SUBCATEGORY_TOOLTIPS, MAIN_CATEGORY_HEADERS_HTML, tags_html, checkbox_key # Codebook + vorberechnete Anzeige
+from labeler_startup import StartupReport # Kaltstart-Bericht
+from labeler_metrics import MetricsRegistry # Spans/Zähler für Betrieb (Admin-Seite, Prometheus, JSONL)
+# Erst nach der ID-Eingabe gebraucht und daher lazy importiert (numpy, requests, gspread):
+# labeler_urls, labeler_scheduler, labeler_embed sowie gspread/google-auth im Sheets-Backend.
+_imports_done = time.perf_counter()
 
 # --- DIES MUSS DER ERSTE STREAMLIT-BEFEHL SEIN ---
 st.set_page_config(layout="wide", page_title="Dataset Labeler)")
 # --- ENDE DES ERSTEN STREAMLIT-BEFEHLS ---
 
 # === Pfad zur Standard-CSV-Datei ===
-DEFAULT_CSV_PATH = "input.csv"
-
-# === Google Sheets Setup ===
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets','https://www.googleapis.com/auth/drive']
-COL_TS = "Timestamp"
-COL_LBL = "Labeler_ID"
-COL_URL = "URL"
-COL_CATS = "Kategorien"
-COL_COMMENT = "Kommentar"
-HEADER = [COL_TS, COL_LBL, COL_URL, COL_CATS, COL_COMMENT]
-TIMEZONE = pytz.timezone("Europe/Berlin")
-
-# === Google Sheets Verbindung ===
+# === Optionale Einstellungen (Abschnitt [labeler] in st.secrets) ===
+def get_secret_section(section):
+    """Abschnitt aus st.secrets als dict; leer, wenn er (oder die ganze secrets.toml) fehlt."""
+    try: return dict(st.secrets.get(section, {}))
+    except Exception: return {}
+
+def get_setting(key, default):
+    """Liest `st.secrets["labeler"][key]`, fällt bei fehlenden Secrets auf `default` zurück."""
+    return get_secret_section("labeler").get(key, default)
+
+LOCAL_STATE_DIR = get_setting("local_state_dir", ".labeler_state") # Lokale Journale/Caches
+DEFAULT_CSV_PATH = get_setting("input_file", "input.csv") # Relativ zum Arbeitsordner oder absolut
+
+# === Kaltstart-Bericht (prozessweit) ===
 @st.cache_resource
-def connect_gsheet():
-    """Stellt Verbindung zu Google Sheets her und gibt das Worksheet-Objekt zurück."""
-    try:
-        if "google_sheets" not in st.secrets or "credentials_dict" not in st.secrets["google_sheets"] or "sheet_name" not in st.secrets["google_sheets"]:
-            st.error("Google Sheets Secrets ('google_sheets.credentials_dict', 'google_sheets.sheet_name') fehlen oder sind unvollständig.")
-            st.stop(); return None, False, None
-        creds_dict = st.secrets["google_sheets"]["credentials_dict"]
-        sheet_name = st.secrets["google_sheets"]["sheet_name"]
-        creds = Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-        gc = gspread.authorize(creds)
-        worksheet = gc.open(sheet_name).sheet1
-        header_written = False
-        all_vals = worksheet.get_all_values()
-        if not all_vals or all_vals[0] != HEADER:
-            st.sidebar.warning(f"Header in '{sheet_name}' wird korrigiert...")
-            try:
-                if not all_vals or len(all_vals[0]) != len(HEADER) or all(c == '' for c in all_vals[0]):
-                     worksheet.insert_row(HEADER, 1, value_input_option='USER_ENTERED')
-                else:
-                    cell_list = [gspread.Cell(1, i + 1, value) for i, value in enumerate(HEADER)]
-                    worksheet.update_cells(cell_list, value_input_option='USER_ENTERED')
-                try:
-                    if len(worksheet.get_all_values()) > 1 and all(v == '' for v in worksheet.row_values(2)):
-                        worksheet.delete_rows(2)
-                except IndexError: pass
-                header_written = True
-                st.sidebar.success(f"Header in '{sheet_name}' aktualisiert.")
-            except Exception as he: st.sidebar.error(f"Konnte Header nicht schreiben: {he}")
-        return worksheet, header_written, sheet_name
-    except KeyError as e: st.error(f"Secret '{e}' fehlt."); st.stop(); return None, False, None
-    except gspread.exceptions.SpreadsheetNotFound: st.error(f"Google Sheet '{st.secrets.get('google_sheets', {}).get('sheet_name', '???')}' nicht gefunden."); st.stop(); return None, False, None
-    except gspread.exceptions.APIError as e: st.error(f"Google API Fehler (Verbindung): {e}."); st.stop(); return None, False, None
-    except Exception as e: st.error(f"Fehler bei GSheets Verbindung: {e}"); st.stop(); return None, False, None
-
-worksheet, header_written_flag, connected_sheet_name = connect_gsheet()
+def get_startup_report():
+    return StartupReport()
 
-# === Einstellungen ===
+startup_report = get_startup_report()
+startup_report.record("App-Module importieren", _imports_done - _script_start) # Nur der erste Lauf im Prozess zählt
+
+# Einmal pro Prozess (basicConfig tut nichts, sobald der Root-Logger Handler hat)
+logging.basicConfig(level=get_setting("log_level", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+# === Metriken (prozessweit) ===
+@st.cache_resource
+def get_metrics():
+    """Registry für Spans und Zähler; optional als JSONL-Protokoll und Prometheus-Textdatei exportiert."""
+    registry = MetricsRegistry(jsonl_path=get_setting("metrics_jsonl_path", None))
+    registry.start_exporter(interval=float(get_setting("metrics_export_interval", 15)), textfile_path=get_setting("metrics_textfile_path", None))
+    atexit.register(registry.flush_jsonl)
+    return registry
+
+metrics = get_metrics()
+
+def current_labeler():
+    """Labeler der laufenden Session als Metrik-Label (None vor der ID-Eingabe)."""
+    return st.session_state.get("labeler_id") or None
+
+# === Speicher-Verbindung ([storage] backend = "gsheets" | "sqlite" | "fake_gsheets") ===
+def open_storage(storage_config, google_config, report):
+    """Baut die Verbindung auf und prüft den Header (Hintergrund-Thread, daher keine st.*-Aufrufe)."""
+    with report.phase("Speicher: verbinden", background=True), metrics.span("connect_storage", backend=storage_config.get("backend", "gsheets")):
+        storage_obj = make_backend(storage_config, google_config, HEADER)
+    header_written, header_error = False, None
+    with report.phase("Speicher: Header prüfen (nur Zeile 1)", background=True):
+        try: header_written = storage_obj.ensure_header()
+        except Exception as he: header_error = str(he)
+    return storage_obj, header_written, header_error
+
+def warm_up_imports(report):
+    """Lädt die Module vor, die erst nach der ID-Eingabe gebraucht werden."""
+    with report.phase("Module vorladen (numpy, requests, URL-Tabelle, Scheduler, Vorschau)", background=True):
+        import labeler_urls, labeler_scheduler, labeler_embed
 
-# Detailliertes Codebook für Kategorien und Tooltips
-# Die 'desc' Felder bei den Hauptkategorien werden nicht mehr für Tooltips benötigt, können aber bleiben.
-CATEGORIES = {
-    "Health": {
-        "title": "1. Health",
-        "desc": "Posts related to health, well-being, and the healthcare system.",
-        "sub": {
-            "Lifestyle": { "title": "1.1 Lifestyle", "definition": "...", "include": "...", "exclude": "..." }, # Inhalte gekürzt für Lesbarkeit
-            "Mental Health": { "title": "1.2 Mental Health", "definition": "...", "include": "...", "exclude": "..." },
-            "Physical Health": { "title": "1.3 Physical Health", "definition": "...", "include": "...", "exclude": "..." },
-            "Healthcare System": { "title": "1.4 Healthcare System", "definition": "...", "include": "...", "exclude": "..." }
-        }
-    },
-    "Social": {
-         "title": "2. Social",
-         "desc": "Posts related to societal issues like education, family, relationships, and employment.",
-         "sub": {
-            "Education": { "title": "2.1 Education", "definition": "...", "include": "...", "exclude": "..." },
-            "Family/Relationships": { "title": "2.2 Family & Relationships", "definition": "...", "include": "...", "exclude": "..." },
-            "Employment": { "title": "2.3 Employment", "definition": "...", "include": "...", "exclude": "..." }
-        }
-    },
-    "Environment": {
-        "title": "3. Environment",
-        "desc": "Posts related to the environment, climate, energy sector, and disasters.",
-        "sub": {
-            "Environmental Policies": { "title": "3.1 Environmental Policies", "definition": "...", "include": "...", "exclude": "..." },
-            "Energy Sector": { "title": "3.2 Energy Sector", "definition": "...", "include": "...", "exclude": "..." },
-            "Natural/Man-made Disasters": { "title": "3.3 Natural/Man-made Disasters", "definition": "...", "include": "...", "exclude": "..." }
-        }
-    }
-}
-
-# Fülle die gekürzten Definitionen wieder auf (aus der vorherigen Version kopiert)
-# Health
-CATEGORIES["Health"]["sub"]["Lifestyle"]["definition"] = "Includes content providing information on maintaining a healthy lifestyle. This includes content related to nutrition, physical activity, wellness routines, and preventive behaviors aimed at general health improvement."
-CATEGORIES["Health"]["sub"]["Lifestyle"]["include"] = "workout challenges, meal prep ideas, healthy eating advice."
-CATEGORIES["Health"]["sub"]["Lifestyle"]["exclude"] = "content primarily focused on diagnosed medical conditions or mental health disorders."
-CATEGORIES["Health"]["sub"]["Mental Health"]["definition"] = "Includes content related to mental health issues and psychological well-being in general. Covers content about awareness, coping strategies, therapy, and prevention."
-CATEGORIES["Health"]["sub"]["Mental Health"]["include"] = "stress-reducing techniques, therapy experiences, posts explaining burnout."
-CATEGORIES["Health"]["sub"]["Mental Health"]["exclude"] = "content where mental health is incidental or implied but not explicitly discussed."
-CATEGORIES["Health"]["sub"]["Physical Health"]["definition"] = "Covers content about physical illnesses, medical conditions, treatment, and disease prevention."
-CATEGORIES["Health"]["sub"]["Physical Health"]["include"] = "COVID-19 updates, flu vaccine info, cancer awareness."
-CATEGORIES["Health"]["sub"]["Physical Health"]["exclude"] = "health policy, issues related to mental health."
-CATEGORIES["Health"]["sub"]["Healthcare System"]["definition"] = "Refers to content focused on the structure, accessibility, funding, or reform of healthcare services. Includes criticisms, suggestions and policy discussions."
-CATEGORIES["Health"]["sub"]["Healthcare System"]["include"] = "waiting time issues, insurance access, critiques of public/private healthcare."
-CATEGORIES["Health"]["sub"]["Healthcare System"]["exclude"] = "employment-focused healthcare issues (see 2.3)."
-# Social
-CATEGORIES["Social"]["sub"]["Education"]["definition"] = "Includes content related to educational systems, school curricula, education policy, higher and additional education, teachers, schoolkids, university students as well as buildings like schools and universities. Covers topics such as school reform, special education, and access to education."
-CATEGORIES["Social"]["sub"]["Education"]["include"] = "photos of the learning process, debates on university tuition, special needs programs."
-CATEGORIES["Social"]["sub"]["Education"]["exclude"] = "posts only about family or children without an educational component."
-CATEGORIES["Social"]["sub"]["Family/Relationships"]["definition"] = "Covers posts discussing romantic, familial, and parenting relationships, including expressions of love, support, or conflict. Focus is on interpersonal dynamics."
-CATEGORIES["Social"]["sub"]["Family/Relationships"]["include"] = "anniversary posts, family arguments, dating experiences."
-CATEGORIES["Social"]["sub"]["Family/Relationships"]["exclude"] = "content focused on mental health issues in relationships."
-CATEGORIES["Social"]["sub"]["Employment"]["definition"] = "Refers to content related to labor markets, job conditions, pensions, and workplace policies. Includes discussions about employment policy, job loss and depictions of work processes and working equipment."
-CATEGORIES["Social"]["sub"]["Employment"]["include"] = "posts about minimum wage, hiring processes, job training programs."
-CATEGORIES["Social"]["sub"]["Employment"]["exclude"] = "healthcare workforce-specific content, issues overlapping with lifestyle/mental health (e.g. work-life balance)."
-# Environment
-CATEGORIES["Environment"]["sub"]["Environmental Policies"]["definition"] = "Includes content about environmental regulation, governmental decisions, and political discourse related to environmental protection. Can reference specific political actors or parties associated with environment issues."
-CATEGORIES["Environment"]["sub"]["Environmental Policies"]["include"] = "climate legislation, carbon tax debates, political campaigns on green policy."
-CATEGORIES["Environment"]["sub"]["Environmental Policies"]["exclude"] = "posts about energy or disasters unless policy is the primary focus."
-CATEGORIES["Environment"]["sub"]["Energy Sector"]["definition"] = "Covers content on natural and renewable energy (e.g., solar, wind, fossil fuels), including innovation, infrastructure, and research, without explicit political discussion."
-CATEGORIES["Environment"]["sub"]["Energy Sector"]["include"] = "solar panel technology, energy storage solutions."
-CATEGORIES["Environment"]["sub"]["Energy Sector"]["exclude"] = "political critique, disasters."
-CATEGORIES["Environment"]["sub"]["Natural/Man-made Disasters"]["definition"] = "Includes content about environmental hazards and disaster events, such as floods, wildfires, pollution, or industrial accidents. May reference causes or consequences of climate change."
-CATEGORIES["Environment"]["sub"]["Natural/Man-made Disasters"]["include"] = "coverage of wildfires, oil spills, climate-induced droughts."
-CATEGORIES["Environment"]["sub"]["Natural/Man-made Disasters"]["exclude"] = "content not referencing any kind of disaster."
-
-
-# Flache Liste aller internen Subkategorien-Keys
-ALL_CATEGORIES_KEYS = [sub_cat_key for main_data in CATEGORIES.values() for sub_cat_key in main_data["sub"]]
-
-# Farben
-CATEGORY_COLORS = { "Health": "dodgerblue", "Social": "mediumseagreen", "Environment": "darkorange" }
-SUBCATEGORY_COLORS = {
-    "Lifestyle": "skyblue", "Mental Health": "lightcoral", "Physical Health": "mediumaquamarine", "Healthcare System": "steelblue",
-    "Education": "sandybrown", "Family/Relationships": "lightpink", "Employment": "khaki",
-    "Environmental Policies": "mediumseagreen", "Energy Sector": "gold", "Natural/Man-made Disasters": "slategray",
-    "DEFAULT_COLOR": "grey"
-}
+@st.cache_resource
+def get_background_executor():
+    """Prozessweite Hintergrund-Threads: Verbindungsaufbau und Vorladen beim Start, danach z.B. der Übereinstimmungs-Neuaufbau."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="labeler-startup")
+
+@st.cache_resource
+def start_storage_connection():
+    """Startet Verbindungsaufbau und Vorladen einmal pro Prozess im Hintergrund, parallel zur ID-/Intro-Seite."""
+    storage_config = get_secret_section("storage")
+    google_config = get_secret_section("google_sheets") if storage_config.get("backend", "gsheets") == "gsheets" else {}
+    executor = get_background_executor()
+    future = executor.submit(open_storage, storage_config, google_config, startup_report)
+    executor.submit(warm_up_imports, startup_report)
+    return future
+
+def connect_storage():
+    """Wartet auf die Verbindung aus `start_storage_connection()` und gibt (Backend, Header geschrieben, Name) zurück."""
+    storage_config = get_secret_section("storage")
+    google_config = get_secret_section("google_sheets")
+    if storage_config.get("backend", "gsheets") == "gsheets" and ("credentials_dict" not in google_config or "sheet_name" not in google_config):
+        st.error("Google Sheets Secrets ('google_sheets.credentials_dict', 'google_sheets.sheet_name') fehlen oder sind unvollständig.")
+        st.stop(); return None, False, None
+    future = start_storage_connection()
+    try:
+        with startup_report.phase("Warten auf Speicher-Verbindung"):
+            storage_obj, header_written, header_error = future.result()
+    except Exception as e:
+        start_storage_connection.clear() # Beim nächsten Lauf neu verbinden statt den Fehler zu cachen
+        if isinstance(e, KeyError): st.error(f"Secret '{e}' fehlt.")
+        elif is_sheet_not_found(e): st.error(f"Google Sheet '{google_config.get('sheet_name', '???')}' nicht gefunden.")
+        elif is_sheets_api_error(e): st.error(f"Google API Fehler (Verbindung): {e}.")
+        else: st.error(f"Fehler bei Verbindung zum Speicher: {e}")
+        st.stop(); return None, False, None
+    if header_error: st.sidebar.error(f"Konnte Header nicht schreiben: {header_error}")
+    return storage_obj, header_written, storage_obj.describe()
+
+start_storage_connection() # Läuft, während die ID-/Intro-Seite angezeigt wird
+
+# === Write-Behind-Queue (prozessweit, von allen Sessions geteilt) ===
+@st.cache_resource
+def get_write_queue():
+    """Startet den Hintergrund-Writer, der gespeicherte Labels gebündelt ins Backend schreibt."""
+    storage_obj, _, _ = connect_storage()
+    write_mode = get_secret_section("storage").get("write_mode", "upsert")
+    if write_mode not in WRITE_MODES: st.warning(f"Unbekannter write_mode '{write_mode}', verwende 'upsert'."); write_mode = "upsert"
+    def flush_fn(rows):
+        with metrics.span("storage_flush", mode=write_mode): storage_obj.append_rows(rows)
+        metrics.count("rows_flushed", len(rows))
+    if write_mode == "upsert":
+        # Korrekturen über "Zurück" überschreiben die vorhandene Zeile statt eine neue anzuhängen
+        progress_index = get_progress_index()
+        lbl_idx, url_idx = HEADER.index(COL_LBL), HEADER.index(COL_URL)
+        last_flush_failed = [False]
+        def flush_fn(rows):
+            with metrics.span("storage_flush", mode=write_mode):
+                # Zeilen anderer Replikas kennen, bevor entschieden wird (rate-limitiert). Nach einem Fehler immer:
+                # ein abgebrochenes Anhängen kann schon im Sheet stehen und wird dann überschrieben statt doppelt angehängt
+                progress_index.refresh(force=last_flush_failed[0])
+                last_flush_failed[0] = True
+                progress_index.record_rows(storage_obj.upsert_rows(rows, lbl_idx, url_idx, progress_index.row_for))
+                last_flush_failed[0] = False
+            metrics.count("rows_flushed", len(rows))
+    queue = WriteBehindQueue(
+        os.path.join(LOCAL_STATE_DIR, "save_journal.sqlite"),
+        flush_fn,
+        batch_size=int(get_setting("write_batch_size", 100)),
+        flush_interval=float(get_setting("write_flush_interval", 2.0)),
+    )
+    atexit.register(queue.close, 5.0)
+    metrics.add_collector("write_queue", lambda: {"pending_rows": queue.pending_count(), "flush_errors": int(bool(queue.last_error)),
+                                                  "flush_failures": queue.flush_failures,
+                                                  "flush_retries": queue.retries, "failed_rows": queue.dead_lettered})
+    metrics.add_collector("storage_api", storage_obj.stats)
+    return queue
 
+# === Einstellungen ===
+# Codebook, Farben und Tooltips liegen in labeler_codebook.py (einmal pro Prozess vorberechnet)
 
 # === Hilfsfunktionen ===
 # (Datenbank, URL-Handling, etc. bleiben gleich)
-@st.cache_data(ttl=300)
+@st.cache_resource
+def get_progress_index():
+    """Prozessweiter Index Labeler -> URLs; liest nur die Spalten Labeler_ID/URL und nur neue Zeilen."""
+    storage_obj, _, _ = connect_storage()
+    if not storage_obj: return None
+    return ProgressIndex(storage_obj, HEADER.index(COL_LBL), HEADER.index(COL_URL),
+                         min_refresh_interval=float(get_setting("progress_refresh_interval", 5.0)))
+
 def get_processed_urls_by_labeler(target_labeler_id):
-    processed_urls = set(); worksheet_obj, _, sheet_name_local = connect_gsheet()
-    if not worksheet_obj: st.warning(f"Keine GSheet-Verbindung f. Fortschritt '{target_labeler_id}'."); return processed_urls
+    processed_urls = set(); _, _, sheet_name_local = connect_storage(); progress_index = get_progress_index()
+    if not progress_index: st.warning(f"Keine Speicher-Verbindung f. Fortschritt '{target_labeler_id}'."); return processed_urls
     if not target_labeler_id: st.warning("Leere Labeler ID f. Fortschritt."); return processed_urls
-    print(f"DEBUG: Rufe verarbeitete URLs f. '{target_labeler_id}' aus '{sheet_name_local}' ab...")
+    print(f"DEBUG: Rufe verarbeitete URLs f. '{target_labeler_id}' aus '{sheet_name_local}' ab (ab Zeile {progress_index.next_row})...")
     try:
-        all_data = worksheet_obj.get_all_values()
-        if not all_data or len(all_data) < 1: return processed_urls
-        header_row = all_data[0]
-        try: labeler_col_index, url_col_index = header_row.index(COL_LBL), header_row.index(COL_URL)
-        except ValueError as e: st.error(f"Fehler: Spalte '{e}' fehlt im Header '{sheet_name_local}': {header_row}."); return processed_urls
-        for row in all_data[1:]:
-            if len(row) > max(labeler_col_index, url_col_index) and row[labeler_col_index] and row[url_col_index]:
-                if row[labeler_col_index].strip() == target_labeler_id: processed_urls.add(row[url_col_index].strip())
+        with metrics.span("get_processed_urls_by_labeler", labeler=target_labeler_id): processed_urls = progress_index.urls_for(target_labeler_id)
         print(f"DEBUG: {len(processed_urls)} verarbeitete URLs f. '{target_labeler_id}' gefunden.")
-    except gspread.exceptions.APIError as e: st.warning(f"GSheet API Fehler (Fortschritt): {e}")
-    except Exception as e: st.warning(f"Fehler (Fortschritt): {e}")
+    except Exception as e:
+        st.warning(f"GSheet API Fehler (Fortschritt): {e}" if is_sheets_api_error(e) else f"Fehler (Fortschritt): {e}")
+        processed_urls = progress_index.urls_for(target_labeler_id, refresh=False)
     return processed_urls
 
-@st.cache_data
+URL_TABLES_DIR = os.path.join(LOCAL_STATE_DIR, "url_tables") # Vorgebaute, memory-mapped URL-Tabellen
+
+@st.cache_resource
+def _load_url_table(file_path, mtime_ns, size):
+    # mtime/Größe sind Teil des Cache-Schlüssels: eine geänderte Datei wird neu eingelesen
+    from labeler_urls import build_url_table
+    metrics.count("cache_misses", cache="url_table")
+    with startup_report.phase("URL-Tabelle laden/bauen"): table = build_url_table(file_path, URL_TABLES_DIR)
+    print(f"DEBUG: {len(table)} unique Items geladen ({table.collapsed} Duplikate/Varianten zusammengefasst).")
+    return table
+
 def load_urls_from_input_csv(file_path, source_name="Standarddatei"):
-    urls = [];
-    if not file_path or not isinstance(file_path, str): st.error("Kein gültiger Pfad."); return urls
-    if not os.path.exists(file_path): st.error(f"Datei '{file_path}' nicht gefunden."); return urls
+    """Gibt die prozessweit geteilte URL-Tabelle zur Input-Datei zurück (None bei Fehlern).
+
+    Die Datei wird gestreamt, Varianten desselben Tweets (/photo/N, ?s=20, ...) werden zu einem Item
+    zusammengefasst; der Varianten-Index liegt in `table.variants_path`.
+    """
+    if not file_path or not isinstance(file_path, str): st.error("Kein gültiger Pfad."); return None
+    if not os.path.exists(file_path): st.error(f"Datei '{file_path}' nicht gefunden."); return None
     try:
-        try: df = pd.read_csv(file_path, header=None, usecols=[0], skip_blank_lines=False, encoding='utf-8', skipinitialspace=True)
-        except UnicodeDecodeError: st.warning(f"UTF-8 Fehler bei '{source_name}', versuche latin-1..."); df = pd.read_csv(file_path, header=None, usecols=[0], skip_blank_lines=False, encoding='latin-1', skipinitialspace=True)
-        if df.empty: st.warning(f"Input '{source_name}' leer."); return urls
-        url_series_raw = df.iloc[:, 0]; url_series_str = url_series_raw.astype(str)
-        url_series_nonan = url_series_str.replace('nan', pd.NA).dropna(); url_series_stripped = url_series_nonan.str.strip()
-        url_series_noempty = url_series_stripped[url_series_stripped != '']
-        url_pattern = r'^https?://\S+$'; url_series_filtered = url_series_noempty[url_series_noempty.str.match(url_pattern)]
-        urls = url_series_filtered.unique().tolist(); print(f"DEBUG: {len(urls)} unique URLs geladen.")
-    except Exception as e: st.error(f"Fehler Lesen/Verarbeiten '{source_name}': {e}")
-    return urls
-
-def save_categorization_gsheet(worksheet_obj, labeler_id, url, categories_keys_str, comment):
-    if not worksheet_obj: st.error("Keine Sheet-Verbindung zum Speichern."); return False
-    if not labeler_id: st.error("Labeler ID fehlt beim Speichern."); return False
-    if not url: st.error("URL fehlt beim Speichern."); return False
+        with metrics.span("load_urls_from_input_csv"):
+            stat = os.stat(file_path)
+            table = _load_url_table(file_path, stat.st_mtime_ns, stat.st_size)
+        metrics.count("cache_lookups", cache="url_table")
+        if len(table) == 0: st.warning(f"Input '{source_name}' leer.")
+        return table
+    except Exception as e: st.error(f"Fehler Lesen/Verarbeiten '{source_name}': {e}"); return None
+
+TARGET_LABELS_PER_URL = int(get_setting("target_labels_per_url", 3)) # Ziel-Redundanz k; 0 = jeder Labeler bekommt alle URLs
+
+@st.cache_resource
+def get_scheduler(table_dir, _url_table):
+    """Prozessweiter Work-Scheduler für eine URL-Tabelle (Leases + Ziel-Redundanz); kennt die Labels aller Labeler."""
+    from labeler_scheduler import WorkScheduler
+    scheduler = WorkScheduler(len(_url_table), os.path.join(table_dir, "leases.sqlite"),
+                              redundancy=TARGET_LABELS_PER_URL,
+                              lease_seconds=float(get_setting("lease_seconds", 1800)))
+    def record(labeler_id, url):
+        item = _url_table.index_of(url)
+        if item is not None: scheduler.record_label(labeler_id, item)
+    progress_index = get_progress_index()
+    if progress_index:
+        try: progress_index.refresh(force=True)
+        except Exception as e: print(f"DEBUG: Fortschritts-Index für Scheduler nicht aktualisiert: {e}")
+        progress_index.add_listener(record) # Gespeicherte Labels (auch aus anderen Replikas) zählen ab jetzt mit
+    lbl_idx, url_idx = HEADER.index(COL_LBL), HEADER.index(COL_URL)
+    for row in get_write_queue().pending_rows(): record(row[lbl_idx].strip(), row[url_idx].strip())
+    metrics.add_collector("scheduler", scheduler.stats)
+    print(f"DEBUG: Scheduler gestartet: {scheduler.stats()}")
+    return scheduler
+
+def session_exclude(n_items):
+    """Bitmap der schon vergebenen Items dieser Sitzung für den Scheduler; wächst mit `session_items` mit statt pro Aufruf neu gebaut zu werden."""
+    from labeler_urls import Bitmap
+    items = st.session_state.session_items
+    cached = st.session_state.get("session_item_bits")
+    if cached is None or cached[0] is not items or cached[2] > len(items): cached = (items, Bitmap(n_items), 0)
+    for item in items[cached[2]:]: cached[1].add(item)
+    st.session_state.session_item_bits = (items, cached[1], len(items))
+    return cached[1]
+
+# === Session-Snapshots: Wiederaufnahme nach Reload/Verbindungsabbruch ohne Neuinitialisierung ===
+SESSION_META_KEYS = ("input_file_name", "total_items_in_session", "original_total_items_from_file", "already_processed_count_on_start", "collapsed_duplicates")
+
+@st.cache_resource
+def get_session_store():
+    """Prozessweiter Speicher für Session-Snapshots (lokale SQLite-Datei)."""
+    from labeler_session import SessionStore
+    store = SessionStore(get_setting("session_store_path", os.path.join(LOCAL_STATE_DIR, "sessions.sqlite")))
+    metrics.add_collector("session_store", store.stats)
+    return store
+
+def session_entries():
+    """Einträge der Session als `{local_index: (category_keys, comment)}` (Vergleichsbasis für inkrementelle Snapshots)."""
+    results, comments = st.session_state.session_results, st.session_state.session_comments
+    return {i: (tuple(results.get(i, [])), comments.get(i, "")) for i in results.keys() | comments.keys()}
+
+def snapshot_position():
+    return (st.session_state.current_index_in_session, len(st.session_state.session_items), bool(st.session_state.get("batch_mode", False)))
+
+def start_session_snapshot(table_dir):
+    """Legt nach der Initialisierung einen neuen Snapshot an (ersetzt den alten des Labelers)."""
     try:
-        now_ts = datetime.now(TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z%z')
-        data_row = [now_ts, labeler_id, url, categories_keys_str, comment]
-        worksheet_obj.append_row(data_row, value_input_option='USER_ENTERED'); return True
-    except gspread.exceptions.APIError as e: st.error(f"Google API Fehler beim Speichern: {e}."); return False
-    except Exception as e: st.error(f"Fehler beim Speichern in GSheet: {e}"); return False
-
-def clean_tweet_url(url):
-    if not isinstance(url, str): return url
-    try: cleaned_url = url.split('?')[0]; cleaned_url = re.sub(r"/(photo|video)/\d+$", "", cleaned_url); return cleaned_url
-    except Exception: return url
-
-@st.cache_data(ttl=3600)
-def get_tweet_embed_html(tweet_url):
-    if not isinstance(tweet_url, str): return None
+        get_session_store().start(st.session_state.labeler_id, table_dir, st.session_state.session_order,
+                                  {key: st.session_state[key] for key in SESSION_META_KEYS})
+        st.session_state.snapshot_written = {"position": None, "entries": {}}
+    except Exception as e: print(f"DEBUG: Session-Snapshot nicht angelegt: {e}")
+
+def persist_session():
+    """Schreibt Position und seit dem letzten Snapshot geänderte Einträge (nichts, wenn sich nichts geändert hat)."""
+    written = st.session_state.get("snapshot_written")
+    if written is None: return
+    entries, position = session_entries(), snapshot_position()
+    changed = {i: entry for i, entry in entries.items() if written["entries"].get(i) != entry}
+    if not changed and position == written["position"]: return
     try:
-        parsed_url = urlparse(tweet_url)
-        if not (parsed_url.netloc in ["twitter.com", "x.com", "www.twitter.com", "www.x.com"] and "/status/" in parsed_url.path): return None
-    except Exception: return None
-    cleaned_tweet_url = clean_tweet_url(tweet_url)
-    api_url = f"https://publish.twitter.com/oembed?url={cleaned_tweet_url}&maxwidth=550&omit_script=false&dnt=true&theme=dark"
+        with metrics.span("session_snapshot"):
+            get_session_store().update(st.session_state.labeler_id, position[0], st.session_state.session_items, changed,
+                                       meta={"batch_mode": position[2], "total_items_in_session": st.session_state.total_items_in_session})
+        written["entries"].update(changed); written["position"] = position
+    except Exception as e: print(f"DEBUG: Session-Snapshot nicht geschrieben: {e}")
+
+def restore_session(labeler_id):
+    """Stellt die letzte Session des Labelers aus dem Snapshot wieder her (ohne Sheets-Zugriff). True bei Erfolg.
+
+    Passt der Snapshot nicht mehr zur Input-Datei (andere URL-Tabelle), wird er verworfen.
+    """
+    with metrics.span("session_restore"):
+        snapshot = get_session_store().load(labeler_id)
+        if snapshot is None: return False
+        url_table = load_urls_from_input_csv(snapshot["meta"].get("input_file_name", DEFAULT_CSV_PATH))
+        if url_table is None or url_table.table_dir != snapshot["table_dir"]:
+            print(f"DEBUG: Session-Snapshot von '{labeler_id}' passt nicht zur Input-Datei, wird verworfen."); get_session_store().delete(labeler_id); return False
+        for key in SESSION_META_KEYS:
+            if key in snapshot["meta"]: st.session_state[key] = snapshot["meta"][key]
+        st.session_state.batch_mode = snapshot["meta"].get("batch_mode", False)
+        st.session_state.session_order = snapshot["session_order"]
+        st.session_state.session_items = snapshot["session_items"]
+        st.session_state.current_index_in_session = snapshot["current_index"]
+        st.session_state.session_results = snapshot["results"]
+        st.session_state.session_comments = snapshot["comments"]
+        st.session_state.labeler_id = labeler_id
+        st.session_state.intro_confirmed = st.session_state.initialized = True
+        st.session_state.snapshot_written = {"position": snapshot_position(), "entries": session_entries()}
+    metrics.count("sessions_restored")
+    print(f"DEBUG: Session von '{labeler_id}' wiederhergestellt (Item {snapshot['current_index'] + 1}).")
+    return True
+
+def save_categorization(storage_obj, labeler_id, url, categories_keys_str, comment):
+    """Legt die Zeile ins lokale Journal; der Hintergrund-Writer schreibt sie gebündelt ins Backend."""
+    return save_categorizations(storage_obj, labeler_id, [(url, categories_keys_str, comment)])
+
+def save_categorizations(storage_obj, labeler_id, entries):
+    """Wie `save_categorization` für mehrere `(url, categories_keys_str, comment)` in einer Journal-Transaktion."""
+    if not storage_obj: st.error("Keine Speicher-Verbindung zum Speichern."); return False
+    if not labeler_id: st.error("Labeler ID fehlt beim Speichern."); return False
+    if not entries or not all(url for url, _, _ in entries): st.error("URL fehlt beim Speichern."); return False
     try:
-        response = requests.get(api_url, timeout=10); response.raise_for_status(); data = response.json()
-        html_content = data.get("html")
-        if not html_content: return f"<p style='color:orange;'>Fehler: Vorschau unvollständig.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>"
-        return html_content
-    except requests.exceptions.Timeout: return f"<p style='color:orange; border:1px solid orange; padding:10px;'>Timeout Vorschau.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>"
-    except requests.exceptions.HTTPError as e:
-        status_code = e.response.status_code; msg = f"Fehler ({status_code}) Vorschau."
-        if status_code == 404: msg = "Tweet nicht gefunden (404)."
-        elif status_code == 403: msg = "Zugriff verweigert (403)."
-        elif status_code >= 500: msg = f"Serverfehler Twitter ({status_code})."
-        return f"<p style='color:orange; border:1px solid orange; padding:10px;'>{msg}</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>"
-    except requests.exceptions.RequestException: return f"<p style='color:orange; border:1px solid orange; padding:10px;'>Netzwerkfehler Vorschau.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>"
-    except Exception as e: st.warning(f"Embed Fehler {cleaned_tweet_url}: {e}"); return f"<p style='color:orange;'>Unbekannter Fehler Vorschau.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>"
+        now_ts = datetime.now(TIMEZONE).strftime(TIMESTAMP_FORMAT)
+        data_rows = [[now_ts, labeler_id, url, categories_keys_str, comment] for url, categories_keys_str, comment in entries]
+        with metrics.span("save_categorization", labeler=labeler_id, batch="true" if len(entries) > 1 else "false"):
+            get_write_queue().enqueue_many(data_rows)
+            progress_index = get_progress_index()
+            if progress_index:
+                for url, _, _ in entries: progress_index.add(labeler_id, url)
+        metrics.count("labels_saved", len(entries), labeler=labeler_id)
+        return True
+    except Exception as e: st.error(f"Fehler beim Speichern ins lokale Journal: {e}"); return False
+
+def get_pending_urls_by_labeler(target_labeler_id):
+    """URLs dieses Labelers, die noch im Journal auf den Flush ins Sheet warten."""
+    lbl_idx, url_idx = HEADER.index(COL_LBL), HEADER.index(COL_URL)
+    return {row[url_idx].strip() for row in get_write_queue().pending_rows() if row[lbl_idx].strip() == target_labeler_id}
+
+@st.cache_resource
+def get_embed_prefetcher():
+    """Prozessweiter Vorschau-Cache (SQLite, teilbar zwischen Replikas) + Thread-Pool, der die nächsten Items vorlädt."""
+    from labeler_embed import make_http_session, HostLimiter, fetch_tweet_embed_html, SQLiteEmbedCache, EmbedPrefetcher, OEMBED_ENDPOINT
+    session = make_http_session(pool_size=int(get_setting("prefetch_workers", 4)) * 2)
+    limiter = HostLimiter(per_host_limit=int(get_setting("prefetch_per_host", 2)))
+    cache = SQLiteEmbedCache(get_setting("embed_cache_path", os.path.join(LOCAL_STATE_DIR, "embed_cache.sqlite")),
+                             max_entries=int(get_setting("embed_cache_max_entries", 50000)),
+                             ok_ttl=float(get_setting("embed_cache_ttl", 7 * 86400)),
+                             error_ttl=float(get_setting("embed_cache_error_ttl", 600)))
+    endpoint = get_setting("oembed_endpoint", OEMBED_ENDPOINT)
+    def fetch(url):
+        with metrics.span("oembed_fetch"): result = fetch_tweet_embed_html(session, limiter, url, endpoint=endpoint)
+        metrics.count("oembed_requests", ok="true" if result and result[1] else "false")
+        return result
+    metrics.add_collector("embed_cache", cache.stats)
+    return EmbedPrefetcher(fetch, cache, max_workers=int(get_setting("prefetch_workers", 4)))
+
+PREFETCH_COUNT = int(get_setting("prefetch_count", 5)) # Wie viele kommende Items vorgeladen werden
+
+def get_tweet_embed_html(tweet_url):
+    """`(html, ok)` aus dem Cache bzw. frisch abgerufen; None, wenn die URL kein Tweet ist."""
+    with metrics.span("get_tweet_embed_html", labeler=current_labeler()): return get_embed_prefetcher().get(tweet_url)
+
+# === Vorschau-Modus: "embed" = iframe mit widgets.js, "static" = statische Karte + Fotos, Einbettung nur auf Wunsch ===
+PREVIEW_MODE = get_setting("preview_mode", "embed")
+
+@st.cache_resource
+def get_media_cache():
+    """Lokaler Cache für Foto-Vorschaubilder (Hintergrund-Downloader); None, wenn `media_endpoint` leer ist."""
+    from labeler_embed import make_http_session, HostLimiter
+    from labeler_preview import MediaCache, SYNDICATION_ENDPOINT
+    endpoint = get_setting("media_endpoint", SYNDICATION_ENDPOINT)
+    if not endpoint: return None
+    media_cache = MediaCache(get_setting("media_cache_dir", os.path.join(LOCAL_STATE_DIR, "media")), make_http_session(pool_size=4),
+                             HostLimiter(per_host_limit=int(get_setting("prefetch_per_host", 2))), endpoint=endpoint,
+                             max_workers=int(get_setting("media_workers", 2)), max_photos=int(get_setting("media_max_photos", 4)))
+    metrics.add_collector("media_cache", media_cache.stats)
+    return media_cache
+
+@st.cache_resource
+def get_widgets_script():
+    """Lokal gecachtes widgets.js für die interaktive Einbettung im statischen Modus."""
+    from labeler_embed import make_http_session
+    from labeler_preview import WidgetsScript
+    return WidgetsScript(get_setting("widgets_js_path", os.path.join(LOCAL_STATE_DIR, "widgets.js")), make_http_session(pool_size=1))
+
+@st.cache_resource
+def _load_variant_index(variants_path, mtime_ns):
+    from labeler_urls import read_variant_index
+    return read_variant_index(variants_path)
+
+def item_photo_numbers(url, variants_path):
+    """Foto-Nummern eines Items aus seiner URL und allen zusammengefassten Varianten (/photo/N)."""
+    from labeler_urls import tweet_status_id
+    from labeler_preview import photo_numbers
+    variants = _load_variant_index(variants_path, os.stat(variants_path).st_mtime_ns) if variants_path and os.path.exists(variants_path) else {}
+    return photo_numbers([url] + variants.get(tweet_status_id(url), []))
+
+def render_preview(url, height, variants_path):
+    """Zeigt die Vorschau eines Posts je nach `PREVIEW_MODE` und gibt `(html, ok)` zurück; Fehler stellt der Aufrufer dar."""
+    from labeler_embed import clean_tweet_url, canonical_tweet_url
+    from labeler_preview import static_card_html, embed_html, REMOTE_SCRIPT_TAG
+    embed = get_tweet_embed_html(clean_tweet_url(url))
+    if not (embed and embed[1]): return embed
+    if PREVIEW_MODE != "static": components.html(embed_html(embed[0], REMOTE_SCRIPT_TAG), height=height, scrolling=True); return embed
+    key = canonical_tweet_url(url)
+    card = None if key in st.session_state.interactive_previews else static_card_html(embed[0], url)
+    if card is None: components.html(embed_html(embed[0], get_widgets_script().script_tag()), height=height, scrolling=True); return embed
+    st.markdown(card, unsafe_allow_html=True)
+    from labeler_urls import tweet_status_id
+    status_id, numbers, media_cache = tweet_status_id(url), item_photo_numbers(url, variants_path), get_media_cache()
+    thumbnails = media_cache.thumbnails(status_id, numbers) if media_cache and numbers else []
+    if thumbnails: st.image(thumbnails, width=160)
+    elif media_cache and numbers: media_cache.request(status_id, numbers); st.caption(f"📷 {len(numbers)} Foto(s) – Vorschaubilder werden geladen …")
+    st.button("Interaktive Vorschau laden", key=f"interactive_{key}", help="Lädt die vollständige Einbettung (iframe + widgets.js).",
+              on_click=st.session_state.interactive_previews.add, args=(key,))
+    return embed
+
+def prefetch_previews(urls, variants_path):
+    """Wärmt Vorschau-Cache (und im statischen Modus die Foto-Vorschaubilder) für kommende Items vor."""
+    from labeler_embed import clean_tweet_url
+    get_embed_prefetcher().prefetch([clean_tweet_url(url) for url in urls])
+    media_cache = get_media_cache() if PREVIEW_MODE == "static" else None
+    if media_cache:
+        from labeler_urls import tweet_status_id
+        for url in urls: media_cache.request(tweet_status_id(url), item_photo_numbers(url, variants_path))
+
+
+# === Vorlabels (python labeler_prelabel.py): Vorschläge vorhaken, optional unsichere Items zuerst ===
+PRELABEL_PREFILL = bool(get_setting("prelabel_prefill", True))
+PRELABEL_UNCERTAIN_FIRST = bool(get_setting("prelabel_uncertain_first", False))
+
+@st.cache_resource
+def _load_prelabels(prelabel_dir, n_items, mtime_ns):
+    from labeler_prelabel import load_prelabels
+    prelabels = load_prelabels(prelabel_dir, n_items)
+    if prelabels: print(f"DEBUG: Vorlabels geladen: {prelabels.meta['with_suggestions']} von {prelabels.meta['items']} Items mit Vorschlägen.")
+    return prelabels
+
+def get_prelabels(url_table):
+    """Vorlabels zur URL-Tabelle (None, wenn keine berechnet wurden oder sie nicht mehr passen)."""
+    meta_path = os.path.join(url_table.table_dir, "prelabels", "meta.json")
+    if not os.path.exists(meta_path): return None
+    return _load_prelabels(os.path.dirname(meta_path), len(url_table), os.stat(meta_path).st_mtime_ns)
+
+def suggested_category_keys(url_table, item):
+    """Vorgeschlagene Subkategorien für ein Item der URL-Tabelle (leer, wenn Vorhaken aus ist oder es keine gibt)."""
+    prelabels = get_prelabels(url_table) if PRELABEL_PREFILL else None
+    return prelabels.suggestions(item) if prelabels else []
+
+
+# === Fragmente: laufen bei Interaktionen in ihrem Bereich allein neu statt des ganzen Skripts ===
+def selected_category_keys(item_index):
+    """Angehakte Subkategorien eines Items, gelesen aus den Checkbox-Keys im Session State."""
+    return sorted(key for key in ALL_CATEGORIES_KEYS if st.session_state.get(checkbox_key(item_index, key), False))
+
+@st.fragment
+@metrics.timed("fragment_run", fragment="embed")
+def render_embed_panel(display_url, prefetch_urls, variants_path):
+    """Linke Spalte: Vorschau des Posts. Checkbox-Klicks rechts bauen den iframe nicht neu."""
+    st.subheader("Post Vorschau / Link")
+    st.markdown(f"**URL:** [{display_url}]({display_url})")
+    embed = render_preview(display_url, 650, variants_path)
+    if not (embed and embed[1]):
+        if embed: st.markdown(embed[0], unsafe_allow_html=True) # Gecachter Fehlerhinweis, kein zweiter Abruf
+        elif "twitter.com" in display_url or "x.com" in display_url: st.caption("Vorschau konnte nicht geladen werden.")
+        else: st.caption("Vorschau nur für X/Twitter Posts.")
+        st.link_button("Link in neuem Tab öffnen", display_url)
+    # Nächste Items vorladen, während der Labeler noch am aktuellen Post arbeitet
+    prefetch_previews(prefetch_urls, variants_path)
+
+@st.fragment
+@metrics.timed("fragment_run", fragment="categories")
+def render_category_panel(item_index, suggested_keys=()):
+    """Rechte Spalte: Checkboxen, Anzeige der Auswahl und Kommentar. Läuft bei jedem Klick allein neu.
+
+    Noch nicht bearbeitete Items starten mit `suggested_keys` (Vorlabels) statt leer.
+    """
+    st.subheader("Kategorisierung")
+    prefilled = item_index not in st.session_state.session_results and bool(suggested_keys)
+    saved_selection_keys = st.session_state.session_results.get(item_index, suggested_keys)
+    if prefilled: st.caption("🤖 Vorschläge aus dem Codebook-Abgleich sind vorausgewählt – bitte prüfen.")
+
+    st.markdown("**Wähle passende Subkategorie(n):**")
+    for main_cat_key, main_data in CATEGORIES.items():
+        # Hauptkategorie OHNE Fragezeichen/Tooltip
+        st.markdown(MAIN_CATEGORY_HEADERS_HTML[main_cat_key], unsafe_allow_html=True)
+        # Subkategorien als Checkboxen mit detailliertem Tooltip
+        for sub_cat_key, sub_data in main_data["sub"].items():
+            st.checkbox(sub_data["title"], value=sub_cat_key in saved_selection_keys,
+                        key=checkbox_key(item_index, sub_cat_key), help=SUBCATEGORY_TOOLTIPS[sub_cat_key])
+
+    st.markdown("---")
+
+    # Anzeige der ausgewählten Tags
+    selected_keys = selected_category_keys(item_index)
+    if selected_keys:
+        st.write("**Ausgewählt:**")
+        st.markdown(tags_html(selected_keys), unsafe_allow_html=True)
+    else: st.caption("_Keine Kategorien ausgewählt._")
+
+    st.markdown("---")
+
+    # Kommentarfeld
+    default_comment = st.session_state.session_comments.get(item_index, "")
+    st.text_area("Optionaler Kommentar:", value=default_comment, height=120, key=f"comment_{item_index}", placeholder="Notizen, Link defekt?")
+
+GRID_ITEMS = int(get_setting("grid_items", 6)) # Raster-Modus: Posts pro Seite
+GRID_COLUMNS = int(get_setting("grid_columns", 3))
+GRID_PREVIEW_HEIGHT = int(get_setting("grid_preview_height", 420)) # Kompakte Vorschau statt 650 px
+
+@st.fragment
+@metrics.timed("fragment_run", fragment="grid")
+def render_grid_panel(item_indices, item_urls, prefetch_urls, variants_path, item_suggestions):
+    """Raster-Modus: pro Item eine kompakte Vorschau, Checkboxen aus demselben Codebook und Kommentar. Klicks laufen nur hier neu."""
+    for row_start in range(0, len(item_indices), GRID_COLUMNS):
+        grid_columns = st.columns(GRID_COLUMNS)
+        row_slice = slice(row_start, row_start + GRID_COLUMNS)
+        for grid_column, item_index, url, suggested_keys in zip(grid_columns, item_indices[row_slice], item_urls[row_slice], item_suggestions[row_slice]):
+            with grid_column.container(border=True):
+                embed = render_preview(url, GRID_PREVIEW_HEIGHT, variants_path)
+                if not (embed and embed[1]): st.caption("Keine Vorschau verfügbar.")
+                st.markdown(f"[Link öffnen]({url})")
+                saved_selection_keys = st.session_state.session_results.get(item_index, suggested_keys)
+                if item_index not in st.session_state.session_results and suggested_keys: st.caption("🤖 Vorschläge vorausgewählt")
+                for main_cat_key, main_data in CATEGORIES.items():
+                    st.markdown(MAIN_CATEGORY_HEADERS_HTML[main_cat_key], unsafe_allow_html=True)
+                    for sub_cat_key, sub_data in main_data["sub"].items():
+                        st.checkbox(sub_data["title"], value=sub_cat_key in saved_selection_keys,
+                                    key=checkbox_key(item_index, sub_cat_key), help=SUBCATEGORY_TOOLTIPS[sub_cat_key])
+                saved_comment = st.session_state.session_comments.get(item_index, "")
+                st.checkbox("Überspringen", value=saved_comment == "[Übersprungen]", key=f"skip_{item_index}", help="Wird nicht gespeichert und für andere Labeler freigegeben.")
+                st.text_input("Kommentar", value="" if saved_comment == "[Übersprungen]" else saved_comment, key=f"comment_{item_index}",
+                              label_visibility="collapsed", placeholder="Optionaler Kommentar")
+    prefetch_previews(prefetch_urls, variants_path)
+
+SIDEBAR_REFRESH_SECONDS = float(get_setting("sidebar_refresh_seconds", 10)) or None # Eigener Takt für Status-Zahlen, 0 = aus
+
+@st.fragment(run_every=SIDEBAR_REFRESH_SECONDS)
+def render_sidebar_status():
+    """Status in der Sidebar (innerhalb von `with st.sidebar:` aufrufen); aktualisiert sich im eigenen Takt."""
+    st.header("Info & Status")
+    if storage: st.success(f"Verbunden mit: '{connected_sheet_name}'")
+    else: st.error("Keine Speicher-Verbindung.")
+
+    st.markdown(f"**Labeler/in:** {st.session_state.labeler_id or '(Bitte eingeben)'}")
+    st.markdown(f"**Input-Datei:** {st.session_state.get('input_file_name', DEFAULT_CSV_PATH)}")
+
+    if st.session_state.get('initialized', False):
+        original_total = st.session_state.original_total_items_from_file
+        processed_on_start = st.session_state.already_processed_count_on_start
+        processed_count_total = processed_on_start + st.session_state.current_index_in_session
+        remaining_in_session = st.session_state.total_items_in_session - st.session_state.current_index_in_session
+        current_global_item_number = processed_count_total + 1
+        reachable_total = processed_on_start + st.session_state.total_items_in_session # Ohne URLs, die schon k Labels haben
+
+        if st.session_state.current_index_in_session >= st.session_state.total_items_in_session:
+             current_global_item_number = reachable_total; remaining_in_session = 0
+
+        st.metric("Gesamt aus Datei", original_total)
+        if st.session_state.collapsed_duplicates: st.caption(f"{st.session_state.collapsed_duplicates} doppelte URLs bzw. Varianten (/photo/N, ?s=…) zusammengefasst.")
+        st.metric("Aktuell / Gesamt", f"{min(current_global_item_number, reachable_total)} / {reachable_total}")
+        if reachable_total < original_total: st.caption(f"Ziel: {TARGET_LABELS_PER_URL} Labels pro URL – die übrigen {original_total - reachable_total} URLs haben es schon erreicht.")
+        st.metric("Von dir gespeichert", processed_count_total)
+        st.metric("Noch offen (in Session)", remaining_in_session)
+    else:
+        st.metric("Gesamt aus Datei", "-"); st.metric("Aktuell / Gesamt", "-")
+        st.metric("Von dir gespeichert", "-"); st.metric("Noch offen (in Session)", "-")
+
+    if storage:
+        write_queue = get_write_queue()
+        st.metric("Ausstehende Speicherungen", write_queue.pending_count(), help="Gespeicherte Labels, die noch im lokalen Journal auf das Schreiben ins Backend warten.")
+        if write_queue.last_error: st.warning(f"Schreiben ins Sheet verzögert: {write_queue.last_error}")
+        failed_rows = write_queue.failed_count()
+        if failed_rows:
+            st.error(f"{failed_rows} gespeicherte Labels ließen sich nicht ins Sheet schreiben (Tabelle 'failed' im Journal).")
+            if st.button("Erneut versuchen", key="retry_failed_rows"): st.toast(f"{write_queue.retry_failed()} Zeilen wieder eingereiht.", icon="🔁")
+
+    st.caption(f"Header: {'OK' if not header_written_flag else 'Geschrieben/Aktualisiert'}")
+    with st.expander("Kaltstart (dieser Prozess)"):
+        for line in startup_report.lines(): st.caption(line)
+    url_table = load_urls_from_input_csv(st.session_state.input_file_name, source_name=st.session_state.input_file_name) if st.session_state.get('initialized', False) else None
+    if url_table is not None:
+        scheduler_stats = get_scheduler(url_table.table_dir, url_table).stats()
+        st.caption(f"Scheduler: Ziel {scheduler_stats['k']} Labels/URL, {scheduler_stats['items_at_k']} URLs erreicht, {scheduler_stats['active_leases']} aktive Leases")
+    api_stats = storage.stats() if storage else {}
+    if api_stats: st.caption(f"API-Aufrufe: {api_stats['calls']} (gedrosselt {api_stats['throttled']}, Retries {api_stats['retried']}, zusammengefasst {api_stats['coalesced']}, fehlgeschlagen {api_stats['failed']})")
+    embed_stats = get_embed_prefetcher().cache.stats()
+    st.caption(f"Tweet-Vorschauen gecached: {embed_stats['entries']} (Hits {embed_stats['hits']}, Misses {embed_stats['misses']}, verdrängt {embed_stats['evictions']})")
+    st.caption("Fortschritt wird beim Start inkrementell abgerufen.")
+    # Randomisierung aktiv sobald Intro bestätigt
+    if st.session_state.get('intro_confirmed', False):
+        st.caption(f"Randomisierung: Aktiv (Seed: {st.session_state.labeler_id})")
+
+ADMIN_TOKEN = str(get_setting("admin_token", "")) # Admin-Seite nur mit ?admin=<Token> in der URL, leer = aus
+
+def is_admin():
+    return bool(ADMIN_TOKEN) and st.query_params.get("admin") == ADMIN_TOKEN
+
+@st.fragment
+def render_admin_metrics():
+    """Admin-Seite in der Sidebar: Latenzen pro Span/Labeler, Zähler, API-Nutzung und Export."""
+    with st.expander("🔧 Admin: Metriken (dieser Prozess)"):
+        st.caption("Latenzen (ms) pro Span und Labeler")
+        st.dataframe(metrics.span_rows(), hide_index=True, use_container_width=True)
+        counter_rows = metrics.counter_rows()
+        if counter_rows: st.caption("Zähler"); st.dataframe(counter_rows, hide_index=True, use_container_width=True)
+        collected = metrics.collected()
+        if collected: st.caption("Komponenten (API, Caches, Queue, Scheduler)"); st.dataframe([{"metric": k, "value": v} for k, v in sorted(collected.items())], hide_index=True, use_container_width=True)
+        st.download_button("Prometheus-Text herunterladen", metrics.prometheus_text(), file_name="labeler_metrics.prom", mime="text/plain")
+        if metrics.jsonl_path and st.button("JSONL jetzt schreiben"): st.caption(f"{metrics.flush_jsonl()} Messungen nach '{metrics.jsonl_path}' geschrieben.")
+    st.markdown(f"[📈 Übereinstimmung & Fortschritt öffnen](?admin={ADMIN_TOKEN}&view=agreement)")
+
+@st.cache_resource
+def get_agreement_tracker(table_dir, _url_table):
+    """Prozessweite Übereinstimmungs-Zahlen über alle gespeicherten Labels (inkrementell aktualisiert)."""
+    from labeler_agreement import AgreementTracker
+    storage_obj, _, _ = connect_storage()
+    return AgreementTracker(storage_obj, _url_table,
+                            min_refresh_interval=float(get_setting("agreement_refresh_interval", 30)),
+                            rebuild_interval=float(get_setting("agreement_rebuild_interval", 3600)))
+
+def show_agreement_dashboard():
+    """Admin-Ansicht: Cohen/Fleiss/Krippendorff pro Subkategorie, Labeler-Paare, Durchsatz und Hotspots."""
+    st.header("📈 Übereinstimmung & Fortschritt")
+    st.markdown(f"[⬅️ Zurück zum Labeling](?admin={ADMIN_TOKEN})")
+    url_table = load_urls_from_input_csv(DEFAULT_CSV_PATH, source_name=DEFAULT_CSV_PATH)
+    tracker = get_agreement_tracker(url_table.table_dir if url_table is not None else "", url_table)
+    rebuild = st.button("Komplett neu einlesen", help="Nötig, um Korrekturen im Upsert-Modus sofort zu sehen; sonst automatisch in festen Abständen.")
+    with st.spinner("Lese neue Zeilen..."), metrics.span("agreement_refresh"):
+        # Der Komplett-Neuaufbau läuft im Hintergrund; bis dahin zeigt die Seite den letzten Stand
+        try: tracker.refresh(rebuild=rebuild, executor=get_background_executor())
+        except Exception as e: st.warning(f"GSheet API Fehler (Übereinstimmung): {e}" if is_sheets_api_error(e) else f"Fehler (Übereinstimmung): {e}")
+    if tracker.rebuilding: st.info("Komplett-Neuaufbau läuft im Hintergrund, angezeigt wird der letzte Stand. Seite später neu laden.")
+    elif tracker.rebuild_error: st.warning(f"Komplett-Neuaufbau fehlgeschlagen, angezeigt wird der letzte Stand: {tracker.rebuild_error}")
+    st.caption(f"{tracker.rows_seen} Zeilen, {len(tracker.labelers)} Labeler, {tracker.n_items} Items · Werte nur über Items mit mindestens zwei Labels")
+    st.subheader("Pro Subkategorie")
+    st.dataframe(tracker.category_summary(), hide_index=True, use_container_width=True)
+    st.subheader("Labeler-Paare (Cohens Kappa, gemittelt über Subkategorien)")
+    st.dataframe(tracker.pairwise_cohen(), hide_index=True, use_container_width=True)
+    st.subheader("Durchsatz pro Labeler")
+    st.dataframe(tracker.throughput(), hide_index=True, use_container_width=True)
+    st.subheader("Uneinigkeits-Hotspots")
+    st.dataframe(tracker.hotspots(int(get_setting("agreement_hotspots", 25))), hide_index=True, use_container_width=True,
+                 column_config={"url": st.column_config.LinkColumn("URL")})
 
 
 # === ANGEPASST: Kombinierte Intro-Seite ===
@@ -273,6 +681,11 @@ def show_intro_page():
 # === Streamlit App Hauptteil ===
 st.title("📊 Dataset Labeler")
 
+# --- Admin-Ansicht (?admin=<Token>&view=agreement) statt des Labelings ---
+if is_admin() and st.query_params.get("view") == "agreement":
+    show_agreement_dashboard()
+    st.stop()
+
 # --- Session State Initialisierung ---
 if 'labeler_id' not in st.session_state: st.session_state.labeler_id = ""
 # Nur noch eine Bestätigung nötig
@@ -280,14 +693,20 @@ if 'intro_confirmed' not in st.session_state: st.session_state.intro_confirmed =
 if 'initialized' not in st.session_state: st.session_state.initialized = False
 # Restliche States bleiben gleich
 if 'input_file_name' not in st.session_state: st.session_state.input_file_name = DEFAULT_CSV_PATH
-if 'urls_to_process' not in st.session_state: st.session_state.urls_to_process = []
+if 'session_order' not in st.session_state: st.session_state.session_order = None # int32-Indizes in die geteilte URL-Tabelle
 if 'total_items_in_session' not in st.session_state: st.session_state.total_items_in_session = 0
-if 'processed_urls_from_sheet' not in st.session_state: st.session_state.processed_urls_from_sheet = set()
+if 'session_items' not in st.session_state: st.session_state.session_items = [] # Vom Scheduler vergebene Items (Tabellenindizes) in Bearbeitungsreihenfolge
 if 'current_index_in_session' not in st.session_state: st.session_state.current_index_in_session = 0
 if 'session_results' not in st.session_state: st.session_state.session_results = {}
 if 'session_comments' not in st.session_state: st.session_state.session_comments = {}
+if 'interactive_previews' not in st.session_state: st.session_state.interactive_previews = set() # Statischer Modus: URLs mit geladener interaktiver Einbettung
 if 'original_total_items_from_file' not in st.session_state: st.session_state.original_total_items_from_file = 0
 if 'already_processed_count_on_start' not in st.session_state: st.session_state.already_processed_count_on_start = 0
+if 'collapsed_duplicates' not in st.session_state: st.session_state.collapsed_duplicates = 0
+
+# --- Wiederaufnahme: nach Reload oder Verbindungsabbruch steht die Labeler ID noch in der URL ---
+if not st.session_state.intro_confirmed and st.query_params.get("labeler"):
+    if restore_session(st.query_params["labeler"]): st.toast("Letzte Sitzung wiederhergestellt.", icon="↩️")
 
 
 # --- Schritt 1: Labeler ID Eingabe ---
@@ -312,8 +731,13 @@ st.divider()
 # --- Schritt 2: Intro-Seite anzeigen (wenn ID da, aber Intro noch nicht bestätigt) ---
 if st.session_state.labeler_id and not st.session_state.intro_confirmed:
     show_intro_page() # Zeige die kombinierte Seite
+    previous_session = get_session_store().summary(st.session_state.labeler_id)
+    if previous_session and st.button(f"↩️ Letzte Sitzung fortsetzen (Item {previous_session['current_index'] + 1} von {previous_session['items']} vergebenen)"):
+        if restore_session(st.session_state.labeler_id): st.query_params["labeler"] = st.session_state.labeler_id; st.rerun()
+        else: st.warning("Die letzte Sitzung passt nicht mehr zur Input-Datei. Bitte neu starten.")
     if st.button("✅ Verstanden, starte das Labeling!"):
         st.session_state.intro_confirmed = True # Bestätigung setzt diesen State
+        st.query_params["labeler"] = st.session_state.labeler_id # Für die Wiederaufnahme nach einem Reload
         st.session_state.initialized = False # Trigger für Dateninitialisierung
         st.success(f"Danke, {st.session_state.labeler_id}! Lade jetzt deine Daten...")
         time.sleep(1)
@@ -321,16 +745,20 @@ if st.session_state.labeler_id and not st.session_state.intro_confirmed:
     st.stop()
 
 
+# --- Ab hier wird der Speicher gebraucht: auf die im Hintergrund gestartete Verbindung warten ---
+storage, header_written_flag, connected_sheet_name = connect_storage()
+
+
 # --- Schritt 3: Daten initialisieren (wenn Intro bestätigt, aber noch nicht initialisiert) ---
 needs_initialization = (st.session_state.intro_confirmed and
                         not st.session_state.get('initialized', False))
 
-if needs_initialization and worksheet:
+if needs_initialization and storage:
     print(f"Starte Initialisierung für bestätigten Labeler: {st.session_state.labeler_id}")
     # Reset States
-    st.session_state.urls_to_process = []
+    st.session_state.session_order = None
+    st.session_state.session_items = []
     st.session_state.total_items_in_session = 0
-    st.session_state.processed_urls_from_sheet = set()
     st.session_state.current_index_in_session = 0
     st.session_state.session_results = {}
     st.session_state.session_comments = {}
@@ -340,33 +768,34 @@ if needs_initialization and worksheet:
 
     with st.spinner(f"Lade URLs & prüfe Fortschritt für '{st.session_state.labeler_id}'..."):
         all_input_urls_cleaned = load_urls_from_input_csv(DEFAULT_CSV_PATH, source_name=DEFAULT_CSV_PATH)
-        st.session_state.original_total_items_from_file = len(all_input_urls_cleaned)
+        st.session_state.original_total_items_from_file = len(all_input_urls_cleaned) if all_input_urls_cleaned else 0
+        st.session_state.collapsed_duplicates = all_input_urls_cleaned.collapsed if all_input_urls_cleaned else 0
         if not all_input_urls_cleaned: st.error(f"Keine gültigen URLs in '{DEFAULT_CSV_PATH}'."); st.session_state.initialized = False; st.stop()
 
         current_labeler_id = st.session_state.labeler_id
-        get_processed_urls_by_labeler.clear()
-        processed_by_this_labeler = get_processed_urls_by_labeler(current_labeler_id)
-        st.session_state.processed_urls_from_sheet = processed_by_this_labeler
-        st.session_state.already_processed_count_on_start = len(processed_by_this_labeler)
-
-        remaining_urls = [url for url in all_input_urls_cleaned if url.strip() not in processed_by_this_labeler]
-        if remaining_urls:
-            hasher = hashlib.sha256(current_labeler_id.encode('utf-8'))
-            seed_value = int(hasher.hexdigest(), 16)
-            random.seed(seed_value)
-            random.shuffle(remaining_urls)
-            print(f"DEBUG: {len(remaining_urls)} URLs für '{current_labeler_id}' gemischt.")
-
-        st.session_state.urls_to_process = remaining_urls
-        st.session_state.total_items_in_session = len(remaining_urls)
+        processed_by_this_labeler = get_processed_urls_by_labeler(current_labeler_id) | get_pending_urls_by_labeler(current_labeler_id)
+        # Nur eine int32-Permutation pro Session; die URLs selbst liegen einmal im Prozess (URL-Tabelle).
+        # Der Abgleich läuft über die Status-ID, damit auch früher gespeicherte Varianten (/photo/2 etc.) als erledigt gelten.
+        # Die Permutation ist die stabile Reihenfolge des Labelers; welches Item er bekommt, entscheidet der Scheduler.
+        from labeler_urls import build_session_order, labeler_seed
+        session_order, done_bitmap = build_session_order(all_input_urls_cleaned, processed_by_this_labeler, labeler_seed(current_labeler_id))
+        prelabels = get_prelabels(all_input_urls_cleaned) if PRELABEL_UNCERTAIN_FIRST else None
+        if prelabels: session_order = prelabels.uncertain_first(session_order) # Knappste Modell-Entscheidungen zuerst, bei Gleichstand die gemischte Reihenfolge
+        st.session_state.already_processed_count_on_start = len(done_bitmap)
+        print(f"DEBUG: {len(session_order)} URLs für '{current_labeler_id}' gemischt.")
+
+        st.session_state.session_order = session_order
+        st.session_state.session_items = []
+        st.session_state.total_items_in_session = get_scheduler(all_input_urls_cleaned.table_dir, all_input_urls_cleaned).open_count(current_labeler_id, session_order)
         st.session_state.current_index_in_session = 0
         st.session_state.initialized = True # Initialisierung abgeschlossen
+        start_session_snapshot(all_input_urls_cleaned.table_dir)
 
         time.sleep(0.5)
         st.rerun() # UI neu laden für Labeling-Interface
 
-elif needs_initialization and not worksheet:
-    st.error("Google Sheet Verbindung fehlgeschlagen. Initialisierung kann nicht abgeschlossen werden.")
+elif needs_initialization and not storage:
+    st.error("Speicher-Verbindung fehlgeschlagen. Initialisierung kann nicht abgeschlossen werden.")
     st.session_state.initialized = False; st.stop()
 
 
@@ -375,154 +804,161 @@ if st.session_state.intro_confirmed and st.session_state.get('initialized', Fals
 
     # Aktuelle Werte holen
     labeler_id = st.session_state.labeler_id
-    urls_for_session = st.session_state.urls_to_process
-    total_in_session = st.session_state.total_items_in_session
+    url_table = load_urls_from_input_csv(st.session_state.input_file_name, source_name=st.session_state.input_file_name)
+    session_order = st.session_state.session_order
+    session_items = st.session_state.session_items
+    scheduler = get_scheduler(url_table.table_dir, url_table)
     original_total = st.session_state.original_total_items_from_file
     processed_on_start = st.session_state.already_processed_count_on_start
     current_local_idx = st.session_state.current_index_in_session
 
+    batch_mode = st.session_state.get("batch_mode", False)
+    page_size = GRID_ITEMS if batch_mode else 1
+
+    # Nächste Items vom Scheduler holen (Lease), bis die aktuelle Seite gefüllt ist
+    while len(session_items) < current_local_idx + page_size:
+        leased_item = scheduler.lease(labeler_id, session_order, exclude=session_exclude(len(url_table)))
+        if leased_item is None: break
+        session_items.append(leased_item)
+    open_in_session = scheduler.open_count(labeler_id, session_order) # O(1): der Scheduler führt den Wert bei jedem Label nach
+    total_in_session = st.session_state.total_items_in_session = current_local_idx + open_in_session
+    reachable_total = processed_on_start + total_in_session # Was dieser Labeler bei Ziel-Redundanz k überhaupt bekommen kann
+    persist_session() # Jede Navigation endet in einem Rerun: hier landet die neue Position im Snapshot
+
     # --- Fall: Alle URLs dieser Sitzung bearbeitet ---
-    if total_in_session <= 0 or current_local_idx >= total_in_session:
-        st.success(f"🎉 Super, {labeler_id}! Alle {original_total} URLs wurden bearbeitet!")
+    if current_local_idx >= len(session_items):
+        if reachable_total < original_total:
+            st.success(f"🎉 Super, {labeler_id}! Für dich sind keine offenen URLs mehr übrig: die übrigen haben das Ziel von {TARGET_LABELS_PER_URL} Labels pro URL erreicht. "
+                       f"Du hast {processed_on_start + current_local_idx} von {original_total} URLs bearbeitet.")
+        else: st.success(f"🎉 Super, {labeler_id}! Alle {original_total} URLs wurden bearbeitet!")
         st.balloons()
         if st.button("App neu laden (startet von vorn)"):
+             get_session_store().delete(labeler_id); st.query_params.pop("labeler", None)
+             st.session_state.snapshot_written = None
              st.session_state.labeler_id = "" # Reset für kompletten Neustart
              st.session_state.intro_confirmed = False # Zurücksetzen
              st.session_state.initialized = False
-             st.cache_data.clear(); st.cache_resource.clear(); get_processed_urls_by_labeler.clear()
+             # Ressourcen (Sheet-Verbindung, Schreib-Queue) bleiben bestehen, sonst liefe ein zweiter Writer auf demselben Journal
+             st.cache_data.clear()
              st.rerun()
         st.stop()
 
     # --- Fall: Es gibt noch URLs zu bearbeiten ---
-    current_url = urls_for_session[current_local_idx]
+    page_local_indices = list(range(current_local_idx, min(current_local_idx + page_size, len(session_items))))
+    for local_idx in page_local_indices: scheduler.touch(labeler_id, session_items[local_idx])
+    current_item = session_items[current_local_idx]
+    current_url = url_table[current_item]
     processed_count_total = processed_on_start + current_local_idx
     current_global_item_number = processed_count_total + 1
 
     # --- Navigation Oben ---
+    st.toggle("🔲 Raster-Modus", key="batch_mode", help=f"{GRID_ITEMS} Posts auf einmal kategorisieren und mit einem Klick speichern.")
     nav_cols_top = st.columns([1, 3, 1])
     # Zurück
     if current_local_idx > 0:
-        if nav_cols_top[0].button("⬅️ Zurück", key="back_top", use_container_width=True, help="Zum vorherigen Eintrag dieser Sitzung."):
-            st.session_state.current_index_in_session -= 1; st.rerun()
+        if nav_cols_top[0].button("⬅️ Zurück", key="back_top", use_container_width=True, help="Zum vorherigen Eintrag (bzw. zur vorherigen Seite) dieser Sitzung."):
+            st.session_state.current_index_in_session = max(0, current_local_idx - page_size); st.rerun()
     else: nav_cols_top[0].button("⬅️ Zurück", key="back_top_disabled", disabled=True, use_container_width=True)
     # Fortschritt
-    if original_total > 0:
-        progress_percentage = processed_count_total / original_total
-        progress_text = f"{labeler_id}: Item {current_global_item_number} / {original_total} (noch {total_in_session - current_local_idx} in Sitzung)"
+    if reachable_total > 0:
+        progress_percentage = min(processed_count_total / reachable_total, 1.0)
+        item_range = f"{current_global_item_number}–{current_global_item_number + len(page_local_indices) - 1}" if batch_mode else f"{current_global_item_number}"
+        progress_text = f"{labeler_id}: Item {item_range} / {reachable_total} (noch {open_in_session} offen für dich)"
+        if reachable_total < original_total: progress_text += f" – Ziel {TARGET_LABELS_PER_URL} Labels pro URL, {original_total} in der Datei"
         nav_cols_top[1].progress(progress_percentage, text=progress_text)
     else: nav_cols_top[1].progress(0, text="Keine Items")
-    # Überspringen
-    can_go_forward = (current_local_idx + 1) < total_in_session
-    if nav_cols_top[2].button("Überspringen ➡️" if can_go_forward else "Letztes Item", key="skip_next_top", use_container_width=True, help="Markiert dieses Item als übersprungen und geht zum nächsten."):
+    # Überspringen (im Raster-Modus pro Item)
+    if batch_mode: nav_cols_top[2].caption("Überspringen pro Post im Raster.")
+    can_go_forward = (current_local_idx + 1) < len(session_items) or open_in_session > 1
+    if not batch_mode and nav_cols_top[2].button("Überspringen ➡️" if can_go_forward else "Letztes Item", key="skip_next_top", use_container_width=True, help="Markiert dieses Item als übersprungen und geht zum nächsten."):
         if can_go_forward:
             st.session_state.session_results[current_local_idx] = []
             st.session_state.session_comments[current_local_idx] = "[Übersprungen]"
+            scheduler.release(labeler_id, current_item) # Andere Labeler dürfen das Item bekommen
             st.session_state.current_index_in_session += 1; st.rerun()
         else: st.toast("Dies ist bereits das letzte Item.", icon="ℹ️")
     st.divider()
 
-    # --- Zweispaltiges Layout ---
-    left_column, right_column = st.columns([2, 1])
+    if batch_mode:
+        # --- Raster: alle Items der Seite mit kompakter Vorschau (eigenes Fragment) ---
+        page_urls = [url_table[session_items[local_idx]] for local_idx in page_local_indices]
+        next_items = session_items[page_local_indices[-1] + 1: page_local_indices[-1] + 1 + GRID_ITEMS]
+        next_items += scheduler.peek(labeler_id, session_order, GRID_ITEMS - len(next_items), exclude=session_exclude(len(url_table))) if len(next_items) < GRID_ITEMS else []
+        render_grid_panel(page_local_indices, page_urls, [url_table[i] for i in next_items], url_table.variants_path,
+                          [suggested_category_keys(url_table, session_items[local_idx]) for local_idx in page_local_indices])
+        page_selections = {local_idx: selected_category_keys(local_idx) for local_idx in page_local_indices}
+        page_comments = {local_idx: st.session_state.get(f"comment_{local_idx}", "") for local_idx in page_local_indices}
+        page_skipped = {local_idx for local_idx in page_local_indices if st.session_state.get(f"skip_{local_idx}", False)}
+
+        # --- Navigation Unten (Raster) ---
+        st.divider()
+        nav_cols_bottom = st.columns(7)
+        def remember_page():
+            for local_idx in page_local_indices:
+                st.session_state.session_results[local_idx] = [] if local_idx in page_skipped else page_selections[local_idx]
+                st.session_state.session_comments[local_idx] = "[Übersprungen]" if local_idx in page_skipped else page_comments[local_idx]
+        if current_local_idx > 0:
+            if nav_cols_bottom[0].button("⬅️ Zurück ", key="back_bottom", use_container_width=True):
+                remember_page(); st.session_state.current_index_in_session = max(0, current_local_idx - page_size); st.rerun()
+        else: nav_cols_bottom[0].button("⬅️ Zurück ", key="back_bottom_disabled", disabled=True, use_container_width=True)
+
+        # Alle speichern: eine Journal-Transaktion, der Writer hängt die Zeilen gebündelt an
+        n_to_save = len(page_local_indices) - len(page_skipped)
+        if nav_cols_bottom[6].button(f"Alle speichern ({n_to_save}) ➡️", type="primary", key="save_all_bottom", use_container_width=True):
+            entries = [(page_urls[position], "; ".join(page_selections[local_idx]), page_comments[local_idx])
+                       for position, local_idx in enumerate(page_local_indices) if local_idx not in page_skipped]
+            if not storage: st.error("Speichern fehlgeschlagen: Keine Speicher-Verbindung.")
+            elif not labeler_id: st.error("Speichern fehlgeschlagen: Labeler ID fehlt.")
+            elif not entries or save_categorizations(storage, labeler_id, entries):
+                for local_idx in page_skipped: scheduler.release(labeler_id, session_items[local_idx]) # Andere Labeler dürfen die Items bekommen
+                remember_page()
+                st.toast(f"{len(entries)} gespeichert! (wird im Hintergrund ins Sheet geschrieben)", icon="✅")
+                st.session_state.current_index_in_session = current_local_idx + len(page_local_indices)
+                st.rerun()
+            else: st.error("Speichern fehlgeschlagen.")
+
+    else:
+        # --- Zweispaltiges Layout ---
+        left_column, right_column = st.columns([2, 1])
 
-    # --- Linke Spalte: URL Anzeige & Einbettung ---
-    with left_column:
-        st.subheader("Post Vorschau / Link")
-        base_tweet_url = clean_tweet_url(current_url)
-        embed_html = get_tweet_embed_html(base_tweet_url)
+        # --- Linke Spalte: URL Anzeige & Einbettung (eigenes Fragment) ---
         display_url = current_url
-        st.markdown(f"**URL:** [{display_url}]({display_url})")
-        if embed_html: components.html(embed_html, height=650, scrolling=True)
-        else:
-            if "twitter.com" in display_url or "x.com" in display_url:
-                 error_msg = get_tweet_embed_html(base_tweet_url)
-                 if error_msg and error_msg.startswith("<p style='color:orange"): st.markdown(error_msg, unsafe_allow_html=True)
-                 else: st.caption("Vorschau konnte nicht geladen werden.")
-            else: st.caption("Vorschau nur für X/Twitter Posts.")
-            st.link_button("Link in neuem Tab öffnen", display_url)
-
-    # --- Rechte Spalte: Kategorieauswahl & Kommentar ---
-    with right_column:
-        st.subheader("Kategorisierung")
-        saved_selection_keys = st.session_state.session_results.get(current_local_idx, [])
-        selected_category_keys_in_widgets = []
-
-        st.markdown("**Wähle passende Subkategorie(n):**")
-        for main_cat_key, main_data in CATEGORIES.items():
-            main_color = CATEGORY_COLORS.get(main_cat_key, "black")
-            main_title = main_data["title"]
-            # Hauptkategorie OHNE Fragezeichen/Tooltip
-            st.markdown(f'''<h6 style="color:{main_color}; border-bottom: 1px solid {main_color}; margin-top: 10px; margin-bottom: 5px;">
-                           {main_title}
-                         </h6>''', unsafe_allow_html=True)
-
-            # Subkategorien als Checkboxen
-            for sub_cat_key, sub_data in main_data["sub"].items():
-                sub_cat_title = sub_data["title"]
-                widget_key = f"cb_{current_local_idx}_{main_cat_key}_{sub_cat_key}"
-                is_checked_default = sub_cat_key in saved_selection_keys
-                # Tooltip Text formatieren
-                tooltip_text = f"""Definition: {sub_data['definition']}\nInclude: {sub_data['include']}\nExclude: {sub_data['exclude']}"""
-                # Checkbox mit detailliertem Tooltip
-                is_checked_now = st.checkbox(
-                    sub_cat_title,
-                    value=is_checked_default,
-                    key=widget_key,
-                    help=tooltip_text
-                )
-                if is_checked_now:
-                    selected_category_keys_in_widgets.append(sub_cat_key)
-
-        st.markdown("---")
-
-        # Anzeige der ausgewählten Tags
-        selected_category_keys_in_widgets = sorted(list(set(selected_category_keys_in_widgets)))
-        if selected_category_keys_in_widgets:
-            st.write("**Ausgewählt:**")
-            display_tags = []
-            for key in selected_category_keys_in_widgets:
-                display_title = key # Fallback
-                cat_color = SUBCATEGORY_COLORS.get(key, SUBCATEGORY_COLORS["DEFAULT_COLOR"])
-                for main_data in CATEGORIES.values():
-                    if key in main_data["sub"]: display_title = main_data["sub"][key]["title"]; break
-                display_tags.append(f'<span style="display: inline-block; background-color: {cat_color}; color: white; border-radius: 4px; padding: 1px 6px; margin: 2px; font-size: 0.85em;">{display_title}</span>')
-            st.markdown(" ".join(display_tags), unsafe_allow_html=True)
-        else: st.caption("_Keine Kategorien ausgewählt._")
-
-        st.markdown("---")
-
-        # Kommentarfeld
-        default_comment = st.session_state.session_comments.get(current_local_idx, "")
-        comment_key = f"comment_{current_local_idx}"
-        comment_input = st.text_area("Optionaler Kommentar:", value=default_comment, height=120, key=comment_key, placeholder="Notizen, Link defekt?")
-
-    # --- Navigation Unten ---
-    st.divider()
-    nav_cols_bottom = st.columns(7)
-    # Zurück
-    if current_local_idx > 0:
-        if nav_cols_bottom[0].button("⬅️ Zurück ", key="back_bottom", use_container_width=True):
-            st.session_state.session_results[current_local_idx] = selected_category_keys_in_widgets
-            st.session_state.session_comments[current_local_idx] = comment_input
-            st.session_state.current_index_in_session -= 1; st.rerun()
-    else: nav_cols_bottom[0].button("⬅️ Zurück ", key="back_bottom_disabled", disabled=True, use_container_width=True)
-
-    # Speichern & Weiter
-    if nav_cols_bottom[6].button("Speichern & Weiter ➡️", type="primary", key="save_next_bottom", use_container_width=True):
-        current_selection_keys = selected_category_keys_in_widgets
-        current_comment = comment_input
-        if not worksheet: st.error("Speichern fehlgeschlagen: Keine GSheet Verbindung.")
-        elif not labeler_id: st.error("Speichern fehlgeschlagen: Labeler ID fehlt.")
-        else:
-            categories_keys_str = "; ".join(current_selection_keys) if current_selection_keys else ""
-            save_success = save_categorization_gsheet(worksheet, labeler_id, display_url, categories_keys_str, current_comment)
-            if save_success:
-                st.toast("Gespeichert!", icon="✅")
-                st.session_state.session_results[current_local_idx] = current_selection_keys
-                st.session_state.session_comments[current_local_idx] = current_comment
-                st.session_state.processed_urls_from_sheet.add(display_url.strip())
-                st.session_state.current_index_in_session += 1
-                st.rerun()
-            else: st.error("Speichern in Google Sheet fehlgeschlagen.")
+        next_items = session_items[current_local_idx + 1: current_local_idx + 1 + PREFETCH_COUNT]
+        next_items += scheduler.peek(labeler_id, session_order, PREFETCH_COUNT - len(next_items), exclude=session_exclude(len(url_table))) if len(next_items) < PREFETCH_COUNT else []
+        with left_column: render_embed_panel(display_url, [url_table[i] for i in next_items], url_table.variants_path)
+
+        # --- Rechte Spalte: Kategorieauswahl & Kommentar (eigenes Fragment) ---
+        with right_column: render_category_panel(current_local_idx, suggested_category_keys(url_table, current_item))
+        selected_category_keys_in_widgets = selected_category_keys(current_local_idx)
+        comment_input = st.session_state.get(f"comment_{current_local_idx}", "")
+
+        # --- Navigation Unten ---
+        st.divider()
+        nav_cols_bottom = st.columns(7)
+        # Zurück
+        if current_local_idx > 0:
+            if nav_cols_bottom[0].button("⬅️ Zurück ", key="back_bottom", use_container_width=True):
+                st.session_state.session_results[current_local_idx] = selected_category_keys_in_widgets
+                st.session_state.session_comments[current_local_idx] = comment_input
+                st.session_state.current_index_in_session -= 1; st.rerun()
+        else: nav_cols_bottom[0].button("⬅️ Zurück ", key="back_bottom_disabled", disabled=True, use_container_width=True)
+
+        # Speichern & Weiter
+        if nav_cols_bottom[6].button("Speichern & Weiter ➡️", type="primary", key="save_next_bottom", use_container_width=True):
+            current_selection_keys = selected_category_keys_in_widgets
+            current_comment = comment_input
+            if not storage: st.error("Speichern fehlgeschlagen: Keine Speicher-Verbindung.")
+            elif not labeler_id: st.error("Speichern fehlgeschlagen: Labeler ID fehlt.")
+            else:
+                categories_keys_str = "; ".join(current_selection_keys) if current_selection_keys else ""
+                save_success = save_categorization(storage, labeler_id, display_url, categories_keys_str, current_comment)
+                if save_success:
+                    st.toast("Gespeichert! (wird im Hintergrund ins Sheet geschrieben)", icon="✅")
+                    st.session_state.session_results[current_local_idx] = current_selection_keys
+                    st.session_state.session_comments[current_local_idx] = current_comment
+                    st.session_state.current_index_in_session += 1
+                    st.rerun()
+                else: st.error("Speichern fehlgeschlagen.")
 
 
 # --- Fallback-Anzeige, wenn Initialisierung noch aussteht ---
@@ -530,37 +966,10 @@ elif st.session_state.intro_confirmed and not st.session_state.get('initialized'
     st.warning("Warte auf Initialisierung oder prüfe Fehlermeldungen...")
 
 
-# --- Sidebar ---
-st.sidebar.header("Info & Status")
-if worksheet: st.sidebar.success(f"Verbunden mit: '{connected_sheet_name}'")
-else: st.sidebar.error("Keine GSheet Verbindung.")
-
-st.sidebar.markdown(f"**Labeler/in:** {st.session_state.labeler_id or '(Bitte eingeben)'}")
-st.sidebar.markdown(f"**Input-Datei:** {st.session_state.get('input_file_name', DEFAULT_CSV_PATH)}")
-
-if st.session_state.get('initialized', False):
-    original_total = st.session_state.original_total_items_from_file
-    processed_on_start = st.session_state.already_processed_count_on_start
-    processed_count_total = processed_on_start + st.session_state.current_index_in_session
-    remaining_in_session = st.session_state.total_items_in_session - st.session_state.current_index_in_session
-    current_global_item_number = processed_count_total + 1
+# --- Sidebar (eigenes Fragment) ---
+with st.sidebar:
+    render_sidebar_status()
+    if is_admin(): render_admin_metrics()
 
-    if st.session_state.total_items_in_session == 0:
-         current_global_item_number = original_total; remaining_in_session = 0; processed_count_total = original_total
-    elif st.session_state.current_index_in_session >= st.session_state.total_items_in_session:
-         current_global_item_number = original_total; remaining_in_session = 0; processed_count_total = original_total
-
-    st.sidebar.metric("Gesamt aus Datei", original_total)
-    st.sidebar.metric("Aktuell / Gesamt", f"{min(current_global_item_number, original_total)} / {original_total}")
-    st.sidebar.metric("Von dir gespeichert", processed_count_total)
-    st.sidebar.metric("Noch offen (in Session)", remaining_in_session)
-else:
-    st.sidebar.metric("Gesamt aus Datei", "-"); st.sidebar.metric("Aktuell / Gesamt", "-")
-    st.sidebar.metric("Von dir gespeichert", "-"); st.sidebar.metric("Noch offen (in Session)", "-")
-
-st.sidebar.caption(f"GSheet Header: {'OK' if not header_written_flag else 'Geschrieben/Aktualisiert'}")
-st.sidebar.caption("Tweet-Vorschauen gecached.")
-st.sidebar.caption("Fortschritt wird beim Start abgerufen.")
-# Randomisierung aktiv sobald Intro bestätigt
-if st.session_state.get('intro_confirmed', False):
-    st.sidebar.caption(f"Randomisierung: Aktiv (Seed: {st.session_state.labeler_id})")
\ No newline at end of file
+# Dauer des ganzen Skriptlaufs (Läufe, die mit st.stop()/st.rerun() enden, zählen nicht; Fragment-Läufe haben eigene Spans)
+metrics.observe("script_run", time.perf_counter() - _script_start, labeler=current_labeler())
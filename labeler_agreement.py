@@ -0,0 +1,367 @@
+# Übereinstimmung zwischen Labelern und Fortschritt pro Labeler
+#
+# Grundlage ist die Matrix Labeler × Item -> Bitmaske (siehe labeler_codebook), also implizit
+# Labeler × Item × Subkategorie. Neue Zeilen werden inkrementell gelesen (ab der ersten noch nicht
+# gesehenen Zeile); für die betroffenen Items wird nur deren Beitrag zu den Zählern abgezogen und neu
+# addiert:
+# - pro Item: Anzahl Labels und Ja-Stimmen pro Subkategorie (reicht für Fleiss' Kappa und Krippendorffs Alpha)
+# - pro Labeler-Paar und Subkategorie: 2×2-Kontingenz (für Cohens Kappa), per Matrixprodukt
+#
+# Korrekturen im Upsert-Modus überschreiben Zeilen an Ort und Stelle und werden daher erst beim
+# nächsten vollständigen Neuaufbau (`rebuild_interval`) sichtbar.
+#
+# Kommandozeile (ohne Streamlit):
+#   python labeler_agreement.py [--input input.csv] [--top 20] [--json agreement.json]
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from labeler_storage import make_backend, load_secrets_file, SECRETS_PATH, HEADER, COL_TS, COL_LBL, COL_URL, COL_CATS
+from labeler_codebook import CODEBOOK_VERSION, CODEBOOK_VERSIONS, MASK_MISSING, SUBCATEGORY_TITLES, encode_categories
+from labeler_export import parse_timestamp
+from labeler_urls import item_key
+
+logger = logging.getLogger(__name__)
+
+PAIR_CHUNK = 50000 # Items pro Matrixprodukt (begrenzt den Speicher beim ersten Aufbau)
+MIN_PAIR_OVERLAP = 10 # Gemeinsame Items, ab denen ein Labeler-Paar in Cohens Kappa eingeht
+PACE_MAX_GAP = 600 # Pausen über 10 min zählen nicht zum Arbeitstempo
+
+
+def _nanmean(values, axis):
+    """Mittelwert ohne NaN; NaN (ohne Warnung), wenn es gar keine Werte gibt."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning); return np.nanmean(values, axis=axis)
+
+
+def _kappa(observed, expected):
+    with np.errstate(divide="ignore", invalid="ignore"): return np.where(expected < 1, (observed - expected) / (1 - expected), np.nan)
+
+
+def fleiss_kappa(n_labels, positives):
+    """Fleiss' Kappa pro Subkategorie (Ja/Nein) über Items mit mindestens zwei Labels; erlaubt variable Labelzahl."""
+    use = n_labels >= 2
+    n, k = n_labels[use, None].astype(np.float64), positives[use].astype(np.float64)
+    if not len(n): return np.full(positives.shape[1], np.nan)
+    agreement = (k * (k - 1) + (n - k) * (n - k - 1)) / (n * (n - 1))
+    p_yes = k.sum(axis=0) / n.sum()
+    return _kappa(agreement.mean(axis=0), p_yes ** 2 + (1 - p_yes) ** 2)
+
+
+def krippendorff_alpha(n_labels, positives):
+    """Krippendorffs Alpha (nominal, Ja/Nein) pro Subkategorie; fehlende Labels sind erlaubt."""
+    use = n_labels >= 2
+    m, k = n_labels[use, None].astype(np.float64), positives[use].astype(np.float64)
+    if not len(m): return np.full(positives.shape[1], np.nan)
+    # Koinzidenzmatrix: o_10 = Σ k(m-k)/(m-1), Randsummen n_1 = Σ k, n_0 = Σ (m-k)
+    disagree = (k * (m - k) / (m - 1)).sum(axis=0)
+    n_yes, n_no = k.sum(axis=0), (m - k).sum(axis=0)
+    total = n_yes + n_no
+    with np.errstate(divide="ignore", invalid="ignore"): return np.where(n_yes * n_no > 0, 1 - (total - 1) * disagree / (n_yes * n_no), np.nan)
+
+
+def cohen_kappa_pairs(n11, n10, n00):
+    """Cohens Kappa pro (Subkategorie, Labeler a, Labeler b) aus den 2×2-Zählern; n01 = n10 transponiert."""
+    n01 = n10.transpose(0, 2, 1)
+    total = (n11 + n10 + n01 + n00).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        observed = (n11 + n00) / total
+        expected = ((n11 + n10) * (n11 + n01) + (n00 + n01) * (n00 + n10)) / total ** 2
+    return _kappa(observed, expected), total
+
+
+class AgreementTracker:
+    """Inkrementell aktualisierte Übereinstimmungs- und Fortschrittszahlen über ein Speicher-Backend.
+
+    `url_table` (optional) legt die ersten Spalten in Tabellenreihenfolge fest; URLs, die dort fehlen,
+    bekommen zusätzliche Spalten.
+    """
+
+    # Von `_reset` aufgebauter Stand; ein Neuaufbau im Hintergrund ersetzt ihn am Ende auf einen Schlag
+    _STATE = ("next_row", "rows_seen", "last_refresh", "labelers", "_labeler_rows", "_extra_items", "_extra_urls", "_url_columns", "_masks",
+              "n_items", "labels", "saved_at", "n_labels", "positives", "pair_11", "pair_10", "pair_00")
+
+    def __init__(self, storage, url_table=None, min_refresh_interval=30.0, rebuild_interval=3600.0, chunk_size=5000):
+        self.storage = storage
+        self.url_table = url_table
+        self.min_refresh_interval = min_refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.chunk_size = chunk_size
+        self.categories = list(CODEBOOK_VERSIONS[CODEBOOK_VERSION])
+        self._shifts = np.arange(len(self.categories), dtype=np.uint16)
+        self._lock = threading.Lock()
+        self._rebuild = None # Future des laufenden bzw. letzten Neuaufbaus im Hintergrund
+        self._reset()
+
+    def _reset(self):
+        n_table, n_categories = self._n_table(), len(self.categories)
+        self.next_row = 2 # Zeile 1 ist der Header
+        self.rows_seen = 0
+        self.last_refresh = self.last_rebuild = 0.0
+        self.labelers = []
+        self._labeler_rows, self._extra_items, self._extra_urls = {}, {}, []
+        self._url_columns, self._masks = {}, {} # Caches: URL-String -> Spalte, Kategorien-String -> Maske
+        self.n_items = n_table
+        capacity = max(n_table, 1024)
+        self.labels = np.full((0, capacity), MASK_MISSING, dtype=np.uint16)
+        self.saved_at = np.zeros((0, capacity), dtype=np.int64)
+        self.n_labels = np.zeros(capacity, dtype=np.int32)
+        self.positives = np.zeros((capacity, n_categories), dtype=np.int32)
+        self.pair_11, self.pair_10, self.pair_00 = (np.zeros((n_categories, 0, 0), dtype=np.int64) for _ in range(3))
+
+    # --- Einlesen ---
+    def refresh(self, force=False, rebuild=False, executor=None):
+        """Liest neue Zeilen (bzw. alles bei `rebuild` oder nach `rebuild_interval`). Gibt die Zahl gelesener Zeilen zurück.
+
+        Mit `executor` läuft der komplette Neuaufbau dort im Hintergrund (`start_rebuild`); bis er
+        fertig ist, liefern die Auswertungen den bisherigen, weiter inkrementell nachgeführten Stand.
+        """
+        now = time.monotonic()
+        due = rebuild or bool(self.rebuild_interval and self.last_rebuild and now - self.last_rebuild >= self.rebuild_interval)
+        if due and executor is not None: self.start_rebuild(executor); due = rebuild = False
+        with self._lock:
+            if not force and not rebuild and now - self.last_refresh < self.min_refresh_interval: return 0
+            if due: self._reset()
+            if due or not self.last_rebuild: self.last_rebuild = now # Der erste Aufbau liest ohnehin alles
+            n_read, cells = 0, ([], [], [], [])
+            while True:
+                rows, next_row = self.storage.read_rows(self.next_row, self.chunk_size)
+                if not rows: break
+                self._parse(rows, cells); self.next_row = next_row
+                n_read += len(rows); self.rows_seen += len(rows)
+            self._apply(*cells) # Einmal pro Aktualisierung, damit jedes Item nur einmal neu gezählt wird
+            self.last_refresh = time.monotonic()
+        if n_read: logger.debug("Übereinstimmung: %d Zeilen eingelesen (bis Zeile %d).", n_read, self.next_row - 1)
+        return n_read
+
+    def start_rebuild(self, executor):
+        """Baut alle Zahlen in `executor` neu auf und tauscht sie danach aus. False, wenn schon ein Neuaufbau läuft."""
+        with self._lock:
+            if self.rebuilding: return False
+            self._rebuild = executor.submit(self._rebuild_in_background)
+        return True
+
+    @property
+    def rebuilding(self):
+        return self._rebuild is not None and not self._rebuild.done()
+
+    @property
+    def rebuild_error(self):
+        """Fehler des letzten Neuaufbaus im Hintergrund (None, wenn er geklappt hat oder noch läuft)."""
+        return self._rebuild.exception() if self._rebuild is not None and self._rebuild.done() else None
+
+    def _rebuild_in_background(self):
+        fresh = AgreementTracker(self.storage, self.url_table, rebuild_interval=0, chunk_size=self.chunk_size)
+        try: fresh.refresh(force=True)
+        finally:
+            with self._lock: self.last_rebuild = time.monotonic() # Auch nach einem Fehler erst im nächsten Intervall erneut
+        with self._lock:
+            for name in self._STATE: setattr(self, name, getattr(fresh, name))
+        return fresh.rows_seen
+
+    def _n_table(self):
+        return len(self.url_table) if self.url_table is not None else 0
+
+    def _item_column(self, url):
+        col = self._url_columns.get(url)
+        if col is not None: return col
+        col = self.url_table.index_of(url) if self.url_table is not None else None
+        if col is None:
+            key = item_key(url)
+            col = self._extra_items.get(key)
+            if col is None:
+                col = self._extra_items[key] = self._n_table() + len(self._extra_urls); self._extra_urls.append(url)
+                self.n_items = col + 1
+        self._url_columns[url] = col
+        return col
+
+    def _mask(self, categories):
+        mask = self._masks.get(categories)
+        if mask is None: mask = self._masks[categories] = encode_categories(categories)[0]
+        return mask
+
+    def _labeler_row(self, labeler_id):
+        row = self._labeler_rows.get(labeler_id)
+        if row is None: row = self._labeler_rows[labeler_id] = len(self.labelers); self.labelers.append(labeler_id)
+        return row
+
+    def _grow(self):
+        n_labelers, capacity = len(self.labelers), self.labels.shape[1]
+        new_capacity = capacity if self.n_items <= capacity else max(self.n_items, capacity * 2)
+        if n_labelers > self.labels.shape[0] or new_capacity > capacity:
+            labels = np.full((n_labelers, new_capacity), MASK_MISSING, dtype=np.uint16); labels[:self.labels.shape[0], :capacity] = self.labels
+            saved_at = np.zeros((n_labelers, new_capacity), dtype=np.int64); saved_at[:self.saved_at.shape[0], :capacity] = self.saved_at
+            self.labels, self.saved_at = labels, saved_at
+        if new_capacity > capacity:
+            self.n_labels = np.concatenate([self.n_labels, np.zeros(new_capacity - capacity, dtype=np.int32)])
+            self.positives = np.concatenate([self.positives, np.zeros((new_capacity - capacity, len(self.categories)), dtype=np.int32)])
+        old = self.pair_11.shape[1]
+        if n_labelers > old:
+            pad = ((0, 0), (0, n_labelers - old), (0, n_labelers - old))
+            self.pair_11, self.pair_10, self.pair_00 = (np.pad(a, pad) for a in (self.pair_11, self.pair_10, self.pair_00))
+
+    def _parse(self, rows, cells):
+        """Hängt (Labeler-Zeile, Spalte, Maske, Zeitstempel) der gültigen Zeilen an die Listen in `cells` an."""
+        ts_idx, lbl_idx, url_idx, cats_idx = (HEADER.index(c) for c in (COL_TS, COL_LBL, COL_URL, COL_CATS))
+        width = max(ts_idx, lbl_idx, url_idx, cats_idx) + 1
+        cell_labeler, cell_item, cell_mask, cell_ts = cells
+        for _, row in rows:
+            if len(row) < width: row = list(row) + [""] * (width - len(row))
+            labeler_id, url = str(row[lbl_idx] or "").strip(), str(row[url_idx] or "").strip()
+            if not labeler_id or not url: continue
+            cell_labeler.append(self._labeler_row(labeler_id)); cell_item.append(self._item_column(url))
+            cell_mask.append(self._mask(str(row[cats_idx] or ""))); cell_ts.append(parse_timestamp(str(row[ts_idx] or "")))
+
+    def _apply(self, cell_labeler, cell_item, cell_mask, cell_ts):
+        if not cell_labeler: return
+        self._grow()
+        labeler_rows, items = np.array(cell_labeler, dtype=np.int64), np.array(cell_item, dtype=np.int64)
+        # Pro Zelle zählt die letzte Zeile
+        _, last_reversed = np.unique((labeler_rows * self.labels.shape[1] + items)[::-1], return_index=True)
+        last = len(items) - 1 - last_reversed
+        touched = np.unique(items)
+        self._add_item_counts(touched[self.n_labels[touched] > 0], -1) # Items ohne bisherige Labels tragen nichts bei
+        self.labels[labeler_rows[last], items[last]] = np.array(cell_mask, dtype=np.uint16)[last]
+        self.saved_at[labeler_rows[last], items[last]] = np.array(cell_ts, dtype=np.int64)[last]
+        self._add_item_counts(touched, +1)
+
+    def _bits(self, items):
+        """(beobachtet [Labeler, Item], Ja-Stimmen [Labeler, Item, Subkategorie]) für die Spalten `items`."""
+        block = self.labels[:, items]
+        observed = block != MASK_MISSING
+        bits = ((block[:, :, None] >> self._shifts) & 1).astype(bool) & observed[:, :, None]
+        return observed, bits
+
+    def _add_item_counts(self, items, sign):
+        """Addiert (sign=+1) bzw. entfernt (-1) den Beitrag der Spalten `items` zu den Paar-Zählern.
+
+        Beim Addieren werden auch Labelzahl und Ja-Stimmen pro Item neu gesetzt.
+        """
+        if not len(self.labelers): return
+        for start in range(0, len(items), PAIR_CHUNK):
+            chunk = items[start:start + PAIR_CHUNK]
+            observed, bits = self._bits(chunk)
+            if sign > 0: self.n_labels[chunk] = observed.sum(axis=0); self.positives[chunk] = bits.sum(axis=0)
+            yes = bits.transpose(2, 0, 1).astype(np.float32) # [Subkategorie, Labeler, Item]
+            no = (observed[None, :, :] & ~bits.transpose(2, 0, 1)).astype(np.float32)
+            self.pair_11 += sign * np.rint(yes @ yes.transpose(0, 2, 1)).astype(np.int64)
+            self.pair_10 += sign * np.rint(yes @ no.transpose(0, 2, 1)).astype(np.int64)
+            self.pair_00 += sign * np.rint(no @ no.transpose(0, 2, 1)).astype(np.int64)
+
+    # --- Auswertung ---
+    def url(self, col):
+        n_table = self._n_table()
+        return self.url_table[col] if col < n_table else self._extra_urls[col - n_table]
+
+    def category_summary(self):
+        """Eine Zeile pro Subkategorie: Fleiss, Krippendorff, mittleres Cohen-Kappa der Paare, Ja-Anteil."""
+        with self._lock:
+            n_labels, positives = self.n_labels[:self.n_items], self.positives[:self.n_items]
+            fleiss, alpha = fleiss_kappa(n_labels, positives), krippendorff_alpha(n_labels, positives)
+            cohen, overlap = cohen_kappa_pairs(self.pair_11, self.pair_10, self.pair_00)
+            multi = int((n_labels >= 2).sum()); labeled = int(n_labels.sum())
+        upper = np.triu(np.ones(cohen.shape[1:], dtype=bool), k=1)[None] & (overlap >= MIN_PAIR_OVERLAP)
+        mean_cohen = _nanmean(np.where(upper, cohen, np.nan), axis=(1, 2)) if cohen.shape[1] else np.full(len(self.categories), np.nan)
+        rows = []
+        for c, key in enumerate(self.categories):
+            rows.append({"subkategorie": SUBCATEGORY_TITLES.get(key, key), "fleiss_kappa": _round(fleiss[c]), "krippendorff_alpha": _round(alpha[c]),
+                         "cohen_kappa_mittel": _round(mean_cohen[c]), "ja_anteil": _round(positives[:, c].sum() / labeled if labeled else np.nan),
+                         "items_mehrfach": multi})
+        return rows
+
+    def pairwise_cohen(self):
+        """Cohens Kappa je Labeler-Paar, gemittelt über die Subkategorien (nur Paare mit genug Überlappung)."""
+        with self._lock:
+            cohen, overlap = cohen_kappa_pairs(self.pair_11, self.pair_10, self.pair_00)
+            labelers = list(self.labelers)
+        mean = _nanmean(cohen, axis=0) if len(labelers) else np.zeros((0, 0))
+        shared = overlap[0] if len(labelers) else np.zeros((0, 0))
+        return [{"labeler_a": labelers[a], "labeler_b": labelers[b], "gemeinsame_items": int(shared[a, b]), "cohen_kappa": _round(mean[a, b])}
+                for a in range(len(labelers)) for b in range(a + 1, len(labelers)) if shared[a, b] >= MIN_PAIR_OVERLAP]
+
+    def throughput(self, now=None):
+        """Eine Zeile pro Labeler: Labels gesamt, letzte 24 h / 7 Tage, aktive Tage, Median-Abstand zwischen Speicherungen."""
+        now = now or time.time()
+        rows = []
+        with self._lock:
+            for labeler_row, labeler_id in enumerate(self.labelers):
+                labeled = self.labels[labeler_row, :self.n_items] != MASK_MISSING
+                ts = np.sort(self.saved_at[labeler_row, :self.n_items][labeled & (self.saved_at[labeler_row, :self.n_items] > 0)])
+                gaps = np.diff(ts); gaps = gaps[(gaps > 0) & (gaps <= PACE_MAX_GAP)]
+                rows.append({"labeler": labeler_id, "labels": int(labeled.sum()), "letzte_24h": int((ts >= now - 86400).sum()),
+                             "letzte_7_tage": int((ts >= now - 7 * 86400).sum()), "aktive_tage": int(len(np.unique(ts // 86400))),
+                             "sekunden_pro_label": _round(float(np.median(gaps)) if len(gaps) else np.nan, 1)})
+        return sorted(rows, key=lambda r: -r["labels"])
+
+    def hotspots(self, top=20, min_labels=2):
+        """Items mit dem größten Anteil uneiniger Labeler-Paare (gemittelt über die Subkategorien)."""
+        with self._lock:
+            n, k = self.n_labels[:self.n_items].astype(np.float64), self.positives[:self.n_items].astype(np.float64)
+            candidates = np.flatnonzero(n >= max(min_labels, 2))
+            if not len(candidates): return []
+            nc, kc = n[candidates, None], k[candidates]
+            disagreement = (2 * kc * (nc - kc) / (nc * (nc - 1))).mean(axis=1)
+            order = candidates[np.lexsort((-n[candidates], -disagreement))][:top]
+            scores = dict(zip(candidates.tolist(), disagreement.tolist()))
+            return [{"url": self.url(int(i)), "labels": int(n[i]), "uneinigkeit": _round(scores[int(i)]),
+                     "stimmen": ", ".join(f"{SUBCATEGORY_TITLES.get(key, key)} {int(k[i, c])}/{int(n[i])}" for c, key in enumerate(self.categories) if k[i, c])}
+                    for i in order if scores[int(i)] > 0]
+
+
+def _round(value, digits=3):
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def _print_table(title, rows):
+    print(f"\n{title}")
+    if not rows: print("  (keine Daten)"); return
+    columns = list(rows[0])
+    widths = [max(len(str(c)), *(len(str(r.get(c))) for r in rows)) for c in columns]
+    print("  " + "  ".join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for r in rows: print("  " + "  ".join(str(r.get(c)).ljust(w) for c, w in zip(columns, widths)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Übereinstimmung (Cohen, Fleiss, Krippendorff), Durchsatz und Uneinigkeits-Hotspots aus den gespeicherten Labels.")
+    parser.add_argument("--secrets", default=SECRETS_PATH, help="Pfad zur secrets.toml der App")
+    parser.add_argument("--input", default=None, help="Input-Datei der App (für die Item-Zuordnung wie in der App)")
+    parser.add_argument("--top", type=int, default=20, help="Anzahl Hotspots")
+    parser.add_argument("--json", default=None, help="Ergebnisse zusätzlich als JSON in diese Datei schreiben")
+    args = parser.parse_args(argv)
+
+    secrets = load_secrets_file(args.secrets)
+    storage_config = dict(secrets.get("storage", {}))
+    if storage_config.get("backend", "gsheets") == "fake_gsheets":
+        print("Das Backend 'fake_gsheets' lebt nur im App-Prozess, da gibt es nichts auszuwerten."); return 1
+    storage = make_backend(storage_config, secrets.get("google_sheets", {}), HEADER)
+    url_table = None
+    if args.input:
+        from labeler_urls import build_url_table
+        url_table = build_url_table(args.input, os.path.join(secrets.get("labeler", {}).get("local_state_dir", ".labeler_state"), "url_tables"))
+    print(f"Backend: {storage.describe()}")
+
+    tracker = AgreementTracker(storage, url_table)
+    start = time.perf_counter(); tracker.refresh(force=True)
+    print(f"{tracker.rows_seen} Zeilen, {len(tracker.labelers)} Labeler, {tracker.n_items} Items in {time.perf_counter() - start:.1f} s")
+    report = {"subkategorien": tracker.category_summary(), "paare": tracker.pairwise_cohen(),
+              "durchsatz": tracker.throughput(), "hotspots": tracker.hotspots(args.top)}
+    _print_table("Übereinstimmung pro Subkategorie", report["subkategorien"])
+    _print_table(f"Cohens Kappa pro Labeler-Paar (mind. {MIN_PAIR_OVERLAP} gemeinsame Items)", report["paare"])
+    _print_table("Durchsatz pro Labeler", report["durchsatz"])
+    _print_table(f"Uneinigkeits-Hotspots (Top {args.top})", report["hotspots"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"\nJSON: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
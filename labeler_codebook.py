@@ -0,0 +1,178 @@
+# Codebook (Kategorien, Definitionen, Farben) und daraus abgeleitete Anzeige-Strukturen
+#
+# Alles hier wird einmal pro Prozess beim Import berechnet: Tooltips, Key -> Titel und das HTML für
+# Überschriften und Tags. Die App setzt bei jedem Rerun nur noch fertige Strings zusammen.
+
+# Detailliertes Codebook für Kategorien und Tooltips
+# Die 'desc' Felder bei den Hauptkategorien werden nicht für Tooltips benötigt, können aber bleiben.
+CATEGORIES = {
+    "Health": {
+        "title": "1. Health",
+        "desc": "Posts related to health, well-being, and the healthcare system.",
+        "sub": {
+            "Lifestyle": {
+                "title": "1.1 Lifestyle",
+                "definition": "Includes content providing information on maintaining a healthy lifestyle. This includes content related to nutrition, physical activity, wellness routines, and preventive behaviors aimed at general health improvement.",
+                "include": "workout challenges, meal prep ideas, healthy eating advice.",
+                "exclude": "content primarily focused on diagnosed medical conditions or mental health disorders."
+            },
+            "Mental Health": {
+                "title": "1.2 Mental Health",
+                "definition": "Includes content related to mental health issues and psychological well-being in general. Covers content about awareness, coping strategies, therapy, and prevention.",
+                "include": "stress-reducing techniques, therapy experiences, posts explaining burnout.",
+                "exclude": "content where mental health is incidental or implied but not explicitly discussed."
+            },
+            "Physical Health": {
+                "title": "1.3 Physical Health",
+                "definition": "Covers content about physical illnesses, medical conditions, treatment, and disease prevention.",
+                "include": "COVID-19 updates, flu vaccine info, cancer awareness.",
+                "exclude": "health policy, issues related to mental health."
+            },
+            "Healthcare System": {
+                "title": "1.4 Healthcare System",
+                "definition": "Refers to content focused on the structure, accessibility, funding, or reform of healthcare services. Includes criticisms, suggestions and policy discussions.",
+                "include": "waiting time issues, insurance access, critiques of public/private healthcare.",
+                "exclude": "employment-focused healthcare issues (see 2.3)."
+            }
+        }
+    },
+    "Social": {
+        "title": "2. Social",
+        "desc": "Posts related to societal issues like education, family, relationships, and employment.",
+        "sub": {
+            "Education": {
+                "title": "2.1 Education",
+                "definition": "Includes content related to educational systems, school curricula, education policy, higher and additional education, teachers, schoolkids, university students as well as buildings like schools and universities. Covers topics such as school reform, special education, and access to education.",
+                "include": "photos of the learning process, debates on university tuition, special needs programs.",
+                "exclude": "posts only about family or children without an educational component."
+            },
+            "Family/Relationships": {
+                "title": "2.2 Family & Relationships",
+                "definition": "Covers posts discussing romantic, familial, and parenting relationships, including expressions of love, support, or conflict. Focus is on interpersonal dynamics.",
+                "include": "anniversary posts, family arguments, dating experiences.",
+                "exclude": "content focused on mental health issues in relationships."
+            },
+            "Employment": {
+                "title": "2.3 Employment",
+                "definition": "Refers to content related to labor markets, job conditions, pensions, and workplace policies. Includes discussions about employment policy, job loss and depictions of work processes and working equipment.",
+                "include": "posts about minimum wage, hiring processes, job training programs.",
+                "exclude": "healthcare workforce-specific content, issues overlapping with lifestyle/mental health (e.g. work-life balance)."
+            }
+        }
+    },
+    "Environment": {
+        "title": "3. Environment",
+        "desc": "Posts related to the environment, climate, energy sector, and disasters.",
+        "sub": {
+            "Environmental Policies": {
+                "title": "3.1 Environmental Policies",
+                "definition": "Includes content about environmental regulation, governmental decisions, and political discourse related to environmental protection. Can reference specific political actors or parties associated with environment issues.",
+                "include": "climate legislation, carbon tax debates, political campaigns on green policy.",
+                "exclude": "posts about energy or disasters unless policy is the primary focus."
+            },
+            "Energy Sector": {
+                "title": "3.2 Energy Sector",
+                "definition": "Covers content on natural and renewable energy (e.g., solar, wind, fossil fuels), including innovation, infrastructure, and research, without explicit political discussion.",
+                "include": "solar panel technology, energy storage solutions.",
+                "exclude": "political critique, disasters."
+            },
+            "Natural/Man-made Disasters": {
+                "title": "3.3 Natural/Man-made Disasters",
+                "definition": "Includes content about environmental hazards and disaster events, such as floods, wildfires, pollution, or industrial accidents. May reference causes or consequences of climate change.",
+                "include": "coverage of wildfires, oil spills, climate-induced droughts.",
+                "exclude": "content not referencing any kind of disaster."
+            }
+        }
+    }
+}
+
+
+# Flache Liste aller internen Subkategorien-Keys
+ALL_CATEGORIES_KEYS = [sub_cat_key for main_data in CATEGORIES.values() for sub_cat_key in main_data["sub"]]
+
+# === Bitmasken-Kodierung der Labels ===
+# Bit i steht für die i-te Subkategorie dieser Liste. Jede Änderung am Codebook (neue, umbenannte oder
+# umsortierte Subkategorien) bekommt eine neue Version; alte Versionen bleiben stehen, damit ältere
+# Exporte dekodierbar bleiben.
+CODEBOOK_VERSIONS = {
+    1: ("Lifestyle", "Mental Health", "Physical Health", "Healthcare System",
+        "Education", "Family/Relationships", "Employment",
+        "Environmental Policies", "Energy Sector", "Natural/Man-made Disasters"),
+}
+CODEBOOK_VERSION = max(CODEBOOK_VERSIONS)
+if CODEBOOK_VERSIONS[CODEBOOK_VERSION] != tuple(ALL_CATEGORIES_KEYS):
+    raise RuntimeError("CATEGORIES weicht von der neuesten Version in CODEBOOK_VERSIONS ab – bitte eine neue Codebook-Version eintragen.")
+MASK_BITS = 16 # Masken passen in uint16
+MASK_MISSING = (1 << MASK_BITS) - 1 # Platzhalter für "kein Label" in Exporten (alle Bits gesetzt)
+if len(ALL_CATEGORIES_KEYS) >= MASK_BITS: raise RuntimeError(f"Mehr als {MASK_BITS - 1} Subkategorien passen nicht in eine {MASK_BITS}-Bit-Maske.")
+CATEGORY_BITS = {key: 1 << bit for bit, key in enumerate(ALL_CATEGORIES_KEYS)}
+
+# Farben
+CATEGORY_COLORS = { "Health": "dodgerblue", "Social": "mediumseagreen", "Environment": "darkorange" }
+SUBCATEGORY_COLORS = {
+    "Lifestyle": "skyblue", "Mental Health": "lightcoral", "Physical Health": "mediumaquamarine", "Healthcare System": "steelblue",
+    "Education": "sandybrown", "Family/Relationships": "lightpink", "Employment": "khaki",
+    "Environmental Policies": "mediumseagreen", "Energy Sector": "gold", "Natural/Man-made Disasters": "slategray",
+    "DEFAULT_COLOR": "grey"
+}
+
+
+# === Vorberechnete Anzeige-Strukturen ===
+# Subkategorie-Key -> Hauptkategorie-Key und -> Titel (statt verschachtelter Suche pro Tag)
+SUBCATEGORY_PARENT = {sub_cat_key: main_cat_key for main_cat_key, main_data in CATEGORIES.items() for sub_cat_key in main_data["sub"]}
+SUBCATEGORY_TITLES = {sub_cat_key: sub_data["title"] for main_data in CATEGORIES.values() for sub_cat_key, sub_data in main_data["sub"].items()}
+
+# Tooltip pro Subkategorie (Definition, Include/Exclude)
+SUBCATEGORY_TOOLTIPS = {
+    sub_cat_key: f"""Definition: {sub_data['definition']}\nInclude: {sub_data['include']}\nExclude: {sub_data['exclude']}"""
+    for main_data in CATEGORIES.values() for sub_cat_key, sub_data in main_data["sub"].items()
+}
+
+# Überschrift pro Hauptkategorie (farbig, ohne Tooltip)
+MAIN_CATEGORY_HEADERS_HTML = {
+    main_cat_key: f'''<h6 style="color:{CATEGORY_COLORS.get(main_cat_key, "black")}; border-bottom: 1px solid {CATEGORY_COLORS.get(main_cat_key, "black")}; margin-top: 10px; margin-bottom: 5px;">
+                           {main_data["title"]}
+                         </h6>'''
+    for main_cat_key, main_data in CATEGORIES.items()
+}
+
+# Farbiges Tag pro Subkategorie für die Anzeige "Ausgewählt"
+TAG_STYLE = "display: inline-block; color: white; border-radius: 4px; padding: 1px 6px; margin: 2px; font-size: 0.85em;"
+SUBCATEGORY_TAGS_HTML = {
+    sub_cat_key: f'<span style="{TAG_STYLE} background-color: {SUBCATEGORY_COLORS.get(sub_cat_key, SUBCATEGORY_COLORS["DEFAULT_COLOR"])};">{title}</span>'
+    for sub_cat_key, title in SUBCATEGORY_TITLES.items()
+}
+
+
+def tags_html(category_keys):
+    """HTML der farbigen Tags für die gewählten Subkategorien (unbekannte Keys grau mit Key als Titel)."""
+    return " ".join(SUBCATEGORY_TAGS_HTML.get(key) or f'<span style="{TAG_STYLE} background-color: {SUBCATEGORY_COLORS["DEFAULT_COLOR"]};">{key}</span>'
+                    for key in category_keys)
+
+
+def checkbox_key(item_index, sub_cat_key):
+    """Widget-Key der Checkbox einer Subkategorie für ein Item der Sitzung."""
+    return f"cb_{item_index}_{SUBCATEGORY_PARENT[sub_cat_key]}_{sub_cat_key}"
+
+
+def split_category_string(value):
+    """Keys aus dem Wert der Spalte Kategorien ("A; B"), leere Einträge fallen weg."""
+    return [key.strip() for key in str(value or "").split(";") if key.strip()]
+
+
+def encode_categories(keys, version=CODEBOOK_VERSION):
+    """Bitmaske zu einer Key-Liste (oder dem Spaltenwert). Gibt `(maske, unbekannte_keys)` zurück."""
+    if isinstance(keys, str): keys = split_category_string(keys)
+    bits = CATEGORY_BITS if version == CODEBOOK_VERSION else {key: 1 << bit for bit, key in enumerate(CODEBOOK_VERSIONS[version])}
+    mask, unknown = 0, []
+    for key in keys:
+        if key in bits: mask |= bits[key]
+        else: unknown.append(key)
+    return mask, unknown
+
+
+def decode_mask(mask, version=CODEBOOK_VERSION):
+    """Subkategorie-Keys einer Bitmaske in Bit-Reihenfolge (leer für MASK_MISSING)."""
+    mask = int(mask)
+    if mask == MASK_MISSING: return []
+    return [key for bit, key in enumerate(CODEBOOK_VERSIONS[version]) if mask >> bit & 1]
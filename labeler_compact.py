@@ -0,0 +1,50 @@
+# Offline-Kompaktierung der Ergebnisse: nur die letzte Zeile pro (Labeler, URL) bleibt
+#
+# Aufruf (bei gestoppter App, im Projektordner):
+#   python labeler_compact.py             # kompaktiert das in .streamlit/secrets.toml konfigurierte Backend
+#   python labeler_compact.py --dry-run   # zählt nur, wie viele Zeilen frei würden
+#
+# Vor dem Umschreiben wird ein CSV-Backup aller Zeilen angelegt.
+import argparse
+import csv
+import os
+import sys
+from datetime import datetime
+
+from labeler_storage import make_backend, load_secrets_file, SECRETS_PATH, HEADER, COL_LBL, COL_URL
+
+
+def backup_rows(storage, backup_dir):
+    """Schreibt alle Ergebniszeilen (mit Header) als CSV nach `backup_dir`. Gibt den Pfad zurück."""
+    os.makedirs(backup_dir, exist_ok=True)
+    path = os.path.join(backup_dir, f"results-backup-{datetime.now().strftime('%Y%m%d-%H%M%S')}.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f); writer.writerow(storage.header); writer.writerows(storage.read_all_rows())
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Behält pro (Labeler, URL) nur die zuletzt gespeicherte Zeile.")
+    parser.add_argument("--secrets", default=SECRETS_PATH, help="Pfad zur secrets.toml der App")
+    parser.add_argument("--dry-run", action="store_true", help="Nur zählen, nichts umschreiben")
+    parser.add_argument("--backup-dir", default=None, help="Ordner für das CSV-Backup (Standard: <local_state_dir>/backups)")
+    args = parser.parse_args(argv)
+
+    secrets = load_secrets_file(args.secrets)
+    storage_config = dict(secrets.get("storage", {}))
+    if storage_config.get("backend", "gsheets") == "fake_gsheets":
+        print("Das Backend 'fake_gsheets' lebt nur im App-Prozess, da gibt es nichts zu kompaktieren."); return 1
+    storage = make_backend(storage_config, secrets.get("google_sheets", {}), HEADER)
+    print(f"Backend: {storage.describe()}")
+
+    if not args.dry_run:
+        backup_dir = args.backup_dir or os.path.join(secrets.get("labeler", {}).get("local_state_dir", ".labeler_state"), "backups")
+        print(f"Backup: {backup_rows(storage, backup_dir)}")
+    result = storage.compact(HEADER.index(COL_LBL), HEADER.index(COL_URL), dry_run=args.dry_run)
+    verb = "würden frei" if args.dry_run else "freigegeben"
+    print(f"Zeilen vorher: {result['before']}, nachher: {result['after']}, {verb}: {result['reclaimed']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# Tweet-Vorschauen (oEmbed): Abruf, Cache und Hintergrund-Prefetch
+#
+# Der Abruf läuft über eine gepoolte requests.Session; gleichzeitige Requests pro Host
+# werden begrenzt. Der Prefetcher wärmt den Cache für die nächsten Items der Session vor,
+# während der Labeler noch am aktuellen Post arbeitet. Der Cache liegt in einer SQLite-Datei
+# (überlebt Neustarts, kann von mehreren Replikas geteilt werden); Fehler werden mit kürzerer
+# TTL gecached (negatives Caching). Gespeichert wird nur das Blockquote (omit_script=true); das
+# widgets.js-Tag hängt erst die Darstellung an (siehe labeler_preview).
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+OEMBED_HOST = "publish.twitter.com"
+OEMBED_ENDPOINT = f"https://{OEMBED_HOST}/oembed" # Überschreibbar, z.B. für einen lokalen Mock in Benchmarks
+TWEET_HOSTS = ["twitter.com", "x.com", "www.twitter.com", "www.x.com"]
+
+
+def clean_tweet_url(url):
+    if not isinstance(url, str): return url
+    try: cleaned_url = url.split('?')[0]; cleaned_url = re.sub(r"/(photo|video)/\d+$", "", cleaned_url); return cleaned_url
+    except Exception: return url
+
+
+def canonical_tweet_url(url):
+    """Kanonischer Cache-Schlüssel: https://x.com/<user>/status/<id> (ohne Query, /photo/N, www, Groß/Klein)."""
+    cleaned = clean_tweet_url(url)
+    if not isinstance(cleaned, str): return cleaned
+    match = re.match(r"^https?://(?:www\.)?(?:twitter|x)\.com/([^/]+)/status/(\d+)", cleaned, re.IGNORECASE)
+    if not match: return cleaned
+    return f"https://x.com/{match.group(1).lower()}/status/{match.group(2)}"
+
+
+def make_http_session(pool_size=10):
+    """requests.Session mit Connection-Pool (Keep-Alive statt neuer TLS-Verbindung pro Vorschau)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter); session.mount("http://", adapter)
+    return session
+
+
+class HostLimiter:
+    """Begrenzt die Zahl gleichzeitiger Requests pro Host."""
+
+    def __init__(self, per_host_limit=2):
+        self.per_host_limit = per_host_limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, host):
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.per_host_limit))
+        with semaphore: yield
+
+
+def fetch_tweet_embed_html(session, limiter, tweet_url, timeout=10, endpoint=OEMBED_ENDPOINT):
+    """Holt das oEmbed-HTML für einen Tweet.
+
+    Gibt `(html, ok)` zurück; bei Fehlern ist `ok` False und `html` ein kurzer Hinweis mit Link.
+    Für URLs, die keine Tweets sind, kommt None zurück.
+    """
+    if not isinstance(tweet_url, str): return None
+    try:
+        parsed_url = urlparse(tweet_url)
+        if not (parsed_url.netloc in TWEET_HOSTS and "/status/" in parsed_url.path): return None
+    except Exception: return None
+    cleaned_tweet_url = clean_tweet_url(tweet_url)
+    api_url = f"{endpoint}?url={cleaned_tweet_url}&maxwidth=550&omit_script=true&dnt=true&theme=dark"
+    try:
+        with limiter.slot(urlparse(endpoint).netloc):
+            response = session.get(api_url, timeout=timeout); response.raise_for_status(); data = response.json()
+        html_content = data.get("html")
+        if not html_content: return f"<p style='color:orange;'>Fehler: Vorschau unvollständig.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>", False
+        return html_content, True
+    except requests.exceptions.Timeout: return f"<p style='color:orange; border:1px solid orange; padding:10px;'>Timeout Vorschau.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>", False
+    except requests.exceptions.HTTPError as e:
+        status_code = e.response.status_code; msg = f"Fehler ({status_code}) Vorschau."
+        if status_code == 404: msg = "Tweet nicht gefunden (404)."
+        elif status_code == 403: msg = "Zugriff verweigert (403)."
+        elif status_code >= 500: msg = f"Serverfehler Twitter ({status_code})."
+        return f"<p style='color:orange; border:1px solid orange; padding:10px;'>{msg}</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>", False
+    except requests.exceptions.RequestException: return f"<p style='color:orange; border:1px solid orange; padding:10px;'>Netzwerkfehler Vorschau.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>", False
+    except Exception: logger.exception("Unerwarteter Fehler bei der Vorschau für %s", cleaned_tweet_url); return f"<p style='color:orange;'>Unbekannter Fehler Vorschau.</p><p><a href='{tweet_url}' target='_blank'>Link prüfen</a></p>", False
+
+
+class SQLiteEmbedCache:
+    """Persistenter Vorschau-Cache (SQLite) mit LRU-Verdrängung und getrennten TTLs.
+
+    Einträge sind `(html, ok)`; erfolgreiche Vorschauen leben `ok_ttl` Sekunden, Fehler
+    (404, Timeout, ...) nur `error_ttl` Sekunden. Übersteigt der Cache `max_entries`, werden die
+    am längsten nicht genutzten Einträge gelöscht.
+    """
+
+    ACCESS_UPDATE_INTERVAL = 60.0 # last_access nur grob nachführen, spart Schreibzugriffe bei Hits
+
+    def __init__(self, path, max_entries=50000, ok_ttl=7 * 86400, error_ttl=600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ok_ttl = ok_ttl
+        self.error_ttl = error_ttl
+        self.hits = self.misses = self.expired = self.evictions = 0
+        self._lock = threading.Lock()
+        cache_dir = os.path.dirname(path)
+        if cache_dir: os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeds (key TEXT PRIMARY KEY, html TEXT NOT NULL, ok INTEGER NOT NULL, fetched_at REAL NOT NULL, last_access REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeds_last_access ON embeds (last_access)")
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeds").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT html, ok, fetched_at, last_access FROM embeds WHERE key = ?", (key,)).fetchone()
+            if row is None: self.misses += 1; return None
+            html, ok, fetched_at, last_access = row
+            if now - fetched_at > (self.ok_ttl if ok else self.error_ttl):
+                self._conn.execute("DELETE FROM embeds WHERE key = ?", (key,)); self._entries -= 1
+                self.expired += 1; self.misses += 1; return None
+            if now - last_access > self.ACCESS_UPDATE_INTERVAL:
+                self._conn.execute("UPDATE embeds SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return html, bool(ok)
+
+    def contains(self, key):
+        """Wie get(), aber ohne Statistik (für den Prefetcher)."""
+        with self._lock:
+            row = self._conn.execute("SELECT ok, fetched_at FROM embeds WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[1] <= (self.ok_ttl if row[0] else self.error_ttl)
+
+    def put(self, key, html, ok):
+        now = time.time()
+        with self._lock:
+            # Upsert statt INSERT OR REPLACE: ein ersetzter Eintrag ist keine neue Zeile und darf _entries nicht erhöhen
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                exists = self._conn.execute("SELECT 1 FROM embeds WHERE key = ?", (key,)).fetchone() is not None
+                self._conn.execute("INSERT INTO embeds (key, html, ok, fetched_at, last_access) VALUES (?, ?, ?, ?, ?) "
+                                   "ON CONFLICT(key) DO UPDATE SET html = excluded.html, ok = excluded.ok, fetched_at = excluded.fetched_at, last_access = excluded.last_access",
+                                   (key, html, int(ok), now, now))
+                self._conn.execute("COMMIT")
+            except Exception: self._conn.execute("ROLLBACK"); raise
+            if not exists: self._entries += 1
+            if self._entries > self.max_entries: self._evict()
+
+    def _evict(self):
+        # Zählung auffrischen (andere Replikas schreiben in dieselbe Datei) und auf 90 % verkleinern
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM embeds").fetchone()[0]
+        excess = self._entries - int(self.max_entries * 0.9)
+        if excess <= 0: return
+        self._conn.execute("DELETE FROM embeds WHERE key IN (SELECT key FROM embeds ORDER BY last_access LIMIT ?)", (excess,))
+        self._entries -= excess; self.evictions += excess
+
+    def stats(self):
+        return {"entries": self._entries, "hits": self.hits, "misses": self.misses, "expired": self.expired, "evictions": self.evictions}
+
+
+class EmbedPrefetcher:
+    """Liefert Vorschauen aus dem Cache und lädt die nächsten URLs im Hintergrund vor.
+
+    `fetch_fn(url)` macht den eigentlichen Abruf und liefert `(html, ok)` oder None; `key_fn(url)`
+    bildet den Cache-Schlüssel. Ist eine URL gerade im Prefetch, wartet `get()` auf diesen Abruf
+    statt einen zweiten Request zu starten.
+    """
+
+    def __init__(self, fetch_fn, cache, max_workers=4, key_fn=canonical_tweet_url):
+        self.fetch_fn = fetch_fn
+        self.cache = cache
+        self.key_fn = key_fn
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed-prefetch")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _fetch_and_store(self, url):
+        result = self.fetch_fn(url)
+        if result is not None: self.cache.put(self.key_fn(url), *result)
+        return result
+
+    def _load(self, key, url):
+        try: return self._fetch_and_store(url)
+        finally:
+            with self._lock: self._in_flight.pop(key, None)
+
+    def get(self, url):
+        key = self.key_fn(url)
+        cached = self.cache.get(key)
+        if cached is not None: return cached
+        with self._lock: future = self._in_flight.get(key)
+        if future is not None: return future.result()
+        return self._fetch_and_store(url)
+
+    def prefetch(self, urls):
+        """Startet Hintergrund-Abrufe für alle URLs, die weder gecached noch schon unterwegs sind."""
+        submitted = 0
+        for url in urls:
+            if not url: continue
+            key = self.key_fn(url)
+            if self.cache.contains(key): continue
+            with self._lock:
+                if key in self._in_flight: continue
+                self._in_flight[key] = self._executor.submit(self._load, key, url)
+            submitted += 1
+        return submitted
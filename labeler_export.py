@@ -0,0 +1,189 @@
+# Spaltenorientierter Export der Ergebnisse: Label-Matrix Labeler × URL -> Bitmaske
+#
+# Aufruf (im Projektordner, die App darf weiterlaufen):
+#   python labeler_export.py                      # nach <local_state_dir>/exports/labels-<Zeitstempel>
+#   python labeler_export.py --input input.csv    # Spalten in der Reihenfolge der URL-Tabelle der App
+#   python labeler_export.py --out export_dir
+#
+# Die Ergebnisse werden blockweise gelesen; pro (Labeler, Item) zählt die letzte Zeile. Varianten
+# desselben Tweets (/photo/N, ?s=20, ...) landen in derselben Spalte, `variants.csv` führt sie auf
+# die Original-URLs zurück.
+#
+# Auf Platte (alle .npy mit np.load(..., mmap_mode="r") lesbar, siehe LabelExport):
+#   labels.npy          uint16 [Labeler, URL], Bitmaske nach meta["categories"] (MASK_MISSING = kein Label)
+#   timestamps.npy      int64 [Labeler, URL], Unix-Sekunden des letzten Speicherns (0 = kein Label/unlesbar)
+#   urls.bin            aneinandergehängte UTF-8-URLs, `url_offsets.npy` (int64, n+1 Einträge)
+#   comments.bin        nicht-leere Kommentare, `comment_offsets.npy` und `comment_cells.npy` (Zelle = Labeler * n_urls + URL, sortiert)
+#   variants.csv        Varianten-Index (item_key, original_url)
+#   meta.json           Labeler-Reihenfolge, Codebook-Version, Zähler
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+from labeler_storage import make_backend, load_secrets_file, SECRETS_PATH, HEADER, COL_TS, COL_LBL, COL_URL, COL_CATS, COL_COMMENT
+from labeler_codebook import CODEBOOK_VERSION, CODEBOOK_VERSIONS, MASK_MISSING, encode_categories, decode_mask
+from labeler_urls import item_key, build_url_table, read_variant_index, write_variant_index
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(value):
+    """Unix-Sekunden zu einem Zeitstempel der App ('2025-01-01 12:00:00 CET+0100'), 0 wenn unlesbar."""
+    value = str(value or "").strip()
+    try: return int(datetime.strptime(value[:19] + value[-5:], "%Y-%m-%d %H:%M:%S%z").timestamp())
+    except ValueError: return 0
+
+
+def _write_strings(data_path, offsets_path, strings):
+    """Strings als aneinandergehängtes UTF-8 plus int64-Offsets (wie die URL-Tabelle)."""
+    offsets = array("q", [0])
+    with open(data_path, "wb") as data:
+        for value in strings:
+            encoded = value.encode("utf-8"); data.write(encoded); offsets.append(offsets[-1] + len(encoded))
+    np.save(offsets_path, np.frombuffer(offsets, dtype=np.int64))
+
+
+def export_labels(storage, out_dir, url_table=None, chunk_size=5000):
+    """Schreibt den Export nach `out_dir` (atomar über ein temporäres Verzeichnis). Gibt meta zurück."""
+    ts_idx, lbl_idx, url_idx, cats_idx, comment_idx = (HEADER.index(c) for c in (COL_TS, COL_LBL, COL_URL, COL_CATS, COL_COMMENT))
+    n_table = len(url_table) if url_table is not None else 0
+    labelers, extra_items, urls_extra, variants = {}, {}, [], {}
+    cell_labeler, cell_url, cell_mask, cell_ts = array("I"), array("I"), array("H"), array("q")
+    comments, unknown_categories = {}, {}
+    rows_read = rows_skipped = 0
+
+    for chunk in storage.iter_rows(chunk_size):
+        for row in chunk:
+            rows_read += 1
+            cell = lambda col: str(row[col] if len(row) > col and row[col] is not None else "").strip()
+            labeler_id, url = cell(lbl_idx), cell(url_idx)
+            if not labeler_id or not url: rows_skipped += 1; continue
+            col = url_table.index_of(url) if url_table is not None else None
+            if col is None:
+                key = item_key(url)
+                col = extra_items.get(key)
+                if col is None: col = extra_items[key] = n_table + len(urls_extra); urls_extra.append(url)
+            column_url = url_table[col] if col < n_table else urls_extra[col - n_table]
+            if url != column_url:
+                originals = variants.setdefault(item_key(column_url), [column_url])
+                if url not in originals: originals.append(url)
+            mask, unknown = encode_categories(cell(cats_idx))
+            for key in unknown: unknown_categories[key] = unknown_categories.get(key, 0) + 1
+            row_labeler = labelers.setdefault(labeler_id, len(labelers))
+            cell_labeler.append(row_labeler); cell_url.append(col); cell_mask.append(mask); cell_ts.append(parse_timestamp(cell(ts_idx)))
+            comment = cell(comment_idx)
+            if comment: comments[(row_labeler, col)] = comment
+            else: comments.pop((row_labeler, col), None) # Spätere Zeile ohne Kommentar ersetzt den alten
+
+    n_labelers, n_urls = len(labelers), n_table + len(urls_extra)
+    flat = np.frombuffer(cell_labeler, dtype=np.uint32).astype(np.int64) * n_urls + np.frombuffer(cell_url, dtype=np.uint32)
+    # Letzte Zeile pro Zelle: erstes Vorkommen in der umgedrehten Folge
+    _, last_reversed = np.unique(flat[::-1], return_index=True)
+    last = len(flat) - 1 - last_reversed
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_dir)), exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="exporting-", dir=os.path.dirname(os.path.abspath(out_dir)))
+    try:
+        labels = np.lib.format.open_memmap(os.path.join(tmp_dir, "labels.npy"), mode="w+", dtype=np.uint16, shape=(n_labelers, n_urls))
+        labels[:] = MASK_MISSING
+        labels.reshape(-1)[flat[last]] = np.frombuffer(cell_mask, dtype=np.uint16)[last]
+        labels.flush(); del labels
+        timestamps = np.lib.format.open_memmap(os.path.join(tmp_dir, "timestamps.npy"), mode="w+", dtype=np.int64, shape=(n_labelers, n_urls))
+        timestamps[:] = 0
+        timestamps.reshape(-1)[flat[last]] = np.frombuffer(cell_ts, dtype=np.int64)[last]
+        timestamps.flush(); del timestamps
+
+        url_strings = (url_table[i] for i in range(n_table)) if url_table is not None else iter(())
+        _write_strings(os.path.join(tmp_dir, "urls.bin"), os.path.join(tmp_dir, "url_offsets.npy"), (*url_strings, *urls_extra))
+        comment_cells = sorted((labeler_row * n_urls + col, text) for (labeler_row, col), text in comments.items())
+        np.save(os.path.join(tmp_dir, "comment_cells.npy"), np.array([c for c, _ in comment_cells], dtype=np.int64))
+        _write_strings(os.path.join(tmp_dir, "comments.bin"), os.path.join(tmp_dir, "comment_offsets.npy"), (t for _, t in comment_cells))
+
+        if url_table is not None:
+            for key, originals in read_variant_index(url_table.variants_path).items():
+                merged = variants.setdefault(key, [originals[0]])
+                merged.extend(url for url in originals if url not in merged)
+        write_variant_index(os.path.join(tmp_dir, "variants.csv"), variants)
+
+        meta = {"created": datetime.now().isoformat(timespec="seconds"), "source": storage.describe(),
+                "input": url_table.meta["source"] if url_table is not None else None,
+                "codebook_version": CODEBOOK_VERSION, "categories": list(CODEBOOK_VERSIONS[CODEBOOK_VERSION]), "mask_missing": MASK_MISSING,
+                "labelers": list(labelers), "n_urls": n_urls, "n_input_urls": n_table,
+                "rows_read": rows_read, "rows_skipped": rows_skipped, "labels": int(len(last)), "comments": len(comment_cells),
+                "unknown_categories": unknown_categories}
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f: json.dump(meta, f, ensure_ascii=False, indent=1)
+        if os.path.exists(out_dir): shutil.rmtree(out_dir)
+        os.replace(tmp_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True); raise
+    return meta
+
+
+class LabelExport:
+    """Liest einen Export memory-mapped: `labels[labeler_row, url_col]` usw., ohne das Sheet zu parsen."""
+
+    def __init__(self, export_dir):
+        self.export_dir = export_dir
+        with open(os.path.join(export_dir, "meta.json"), encoding="utf-8") as f: self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(export_dir, name), mmap_mode="r")
+        self.labels, self.timestamps = load("labels.npy"), load("timestamps.npy")
+        self.url_offsets, self.comment_offsets, self.comment_cells = load("url_offsets.npy"), load("comment_offsets.npy"), load("comment_cells.npy")
+        self.url_data = np.fromfile(os.path.join(export_dir, "urls.bin"), dtype=np.uint8)
+        self.comment_data = np.fromfile(os.path.join(export_dir, "comments.bin"), dtype=np.uint8)
+        self.labelers = self.meta["labelers"]
+        self.categories = self.meta["categories"]
+        self._labeler_rows = {labeler_id: row for row, labeler_id in enumerate(self.labelers)}
+
+    def labeler_row(self, labeler_id):
+        return self._labeler_rows.get(labeler_id)
+
+    def url(self, col):
+        return self.url_data[self.url_offsets[col]:self.url_offsets[col + 1]].tobytes().decode("utf-8")
+
+    def comment(self, labeler_row, col):
+        """Kommentar der Zelle oder ''."""
+        cell = labeler_row * self.meta["n_urls"] + col
+        pos = int(np.searchsorted(self.comment_cells, cell))
+        if pos >= len(self.comment_cells) or self.comment_cells[pos] != cell: return ""
+        return self.comment_data[self.comment_offsets[pos]:self.comment_offsets[pos + 1]].tobytes().decode("utf-8")
+
+    def category_keys(self, labeler_row, col):
+        """Subkategorie-Keys der Zelle (leer, wenn kein Label oder keine Kategorie)."""
+        return decode_mask(self.labels[labeler_row, col], self.meta["codebook_version"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportiert die Ergebnisse als Label-Matrix (Labeler × URL -> Bitmaske) im .npy-Format.")
+    parser.add_argument("--secrets", default=SECRETS_PATH, help="Pfad zur secrets.toml der App")
+    parser.add_argument("--out", default=None, help="Zielordner (Standard: <local_state_dir>/exports/labels-<Zeitstempel>)")
+    parser.add_argument("--input", default=None, help="Input-Datei der App; ihre Items bilden die ersten Spalten in Tabellenreihenfolge")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Zeilen pro Leseblock")
+    args = parser.parse_args(argv)
+
+    secrets = load_secrets_file(args.secrets)
+    storage_config = dict(secrets.get("storage", {}))
+    if storage_config.get("backend", "gsheets") == "fake_gsheets":
+        print("Das Backend 'fake_gsheets' lebt nur im App-Prozess, da gibt es nichts zu exportieren."); return 1
+    storage = make_backend(storage_config, secrets.get("google_sheets", {}), HEADER)
+    local_state_dir = secrets.get("labeler", {}).get("local_state_dir", ".labeler_state")
+    url_table = build_url_table(args.input, os.path.join(local_state_dir, "url_tables")) if args.input else None
+    out_dir = args.out or os.path.join(local_state_dir, "exports", f"labels-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    print(f"Backend: {storage.describe()}")
+
+    meta = export_labels(storage, out_dir, url_table, chunk_size=args.chunk_size)
+    print(f"Export: {out_dir}")
+    print(f"Zeilen gelesen: {meta['rows_read']} (ohne Labeler/URL: {meta['rows_skipped']}), Labels: {meta['labels']}, "
+          f"Labeler: {len(meta['labelers'])}, URLs: {meta['n_urls']}, Codebook-Version: {meta['codebook_version']}")
+    if meta["unknown_categories"]: print(f"Unbekannte Kategorien (nicht in der Maske): {meta['unknown_categories']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
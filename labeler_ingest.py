@@ -0,0 +1,265 @@
+# Massen-Import von Ergebniszeilen (Modell-Vorlabels, Migration einer früheren Runde)
+#
+# Aufruf (im Projektordner):
+#   python labeler_ingest.py vorlabels.jsonl                 # importiert ins konfigurierte Backend
+#   python labeler_ingest.py alt.csv --dry-run               # prüft nur und zählt
+#   python labeler_ingest.py alt.csv --resume                # setzt einen abgebrochenen Import fort
+#   python labeler_ingest.py korrekturen.csv --mode upsert   # überschreibt vorhandene (Labeler, URL)-Zeilen
+#
+# Eingabe: CSV mit Header oder JSONL, pro Datensatz Labeler, URL, Kategorien und optional Kommentar
+# und Timestamp. Spaltennamen wie im Sheet (Labeler_ID, URL, Kategorien, Kommentar, Timestamp) oder
+# labeler/url/categories/comment/timestamp; ein CSV-Backup aus labeler_compact.py lässt sich also
+# direkt wieder einspielen. In JSONL dürfen die Kategorien auch eine Liste sein.
+#
+# Kategorien werden gegen das Codebook geprüft, Datensätze mit unbekannten Keys landen (mit Grund)
+# in einer Reject-Datei. Abgeglichen wird wie in der App über (Labeler, Status-ID), also auch gegen
+# früher gespeicherte Varianten (/photo/N) und gegen noch nicht geschriebene Zeilen im Journal der App.
+# Kommt ein (Labeler, Item) in der Datei mehrfach vor, gewinnt wie überall in der App der letzte
+# Datensatz (Korrekturen über "Zurück" in einem Roh-Export); er überschreibt die schon geschriebene
+# Zeile aus dieser Datei auch im Modus "skip".
+# Geschrieben wird in großen Batches; nach jedem Batch wird ein Checkpoint gespeichert, daneben die
+# Schlüssel der bisher geschriebenen Datensätze (`<checkpoint>.keys`). Weil vor dem Schreiben gegen die
+# vorhandenen Zeilen abgeglichen wird, entstehen auch nach einem Abbruch zwischen Batch und Checkpoint
+# keine Duplikate (Modus "skip").
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from labeler_storage import make_backend, load_secrets_file, SECRETS_PATH, HEADER, COL_TS, COL_LBL, COL_URL, COL_CATS, COL_COMMENT, TIMEZONE, TIMESTAMP_FORMAT
+from labeler_codebook import ALL_CATEGORIES_KEYS, split_category_string
+from labeler_urls import URL_PATTERN, item_key, key_hash, detect_encoding
+from labeler_export import parse_timestamp
+
+FIELD_ALIASES = {COL_LBL: ("labeler", "labeler_id"), COL_URL: ("url",), COL_CATS: ("categories", "kategorien"),
+                 COL_COMMENT: ("comment", "kommentar"), COL_TS: ("timestamp",)}
+INGEST_MODES = ("skip", "upsert")
+CATEGORY_ORDER = {key: position for position, key in enumerate(ALL_CATEGORIES_KEYS)}
+
+
+class IngestError(ValueError):
+    """Ungültiger Datensatz (der Text ist der Grund in der Reject-Datei)."""
+
+
+def _field(record, column):
+    for name in (column,) + FIELD_ALIASES[column]:
+        for key in (name, name.lower()):
+            if key in record and record[key] is not None: return record[key]
+    return ""
+
+
+def normalize_record(record, now_ts, drop_unknown=False):
+    """Prüft einen Datensatz und gibt die Ergebniszeile in Header-Reihenfolge zurück (wirft `IngestError`)."""
+    labeler_id, url = str(_field(record, COL_LBL)).strip(), str(_field(record, COL_URL)).strip()
+    if not labeler_id: raise IngestError("Labeler fehlt")
+    if not URL_PATTERN.match(url): raise IngestError(f"ungültige URL '{url}'")
+    categories = _field(record, COL_CATS)
+    keys = [str(k).strip() for k in categories if str(k).strip()] if isinstance(categories, list) else split_category_string(categories)
+    unknown = [k for k in keys if k not in CATEGORY_ORDER]
+    if unknown and not drop_unknown: raise IngestError(f"unbekannte Kategorien: {'; '.join(unknown)}")
+    keys = sorted({k for k in keys if k in CATEGORY_ORDER}) # Wie in der App: sortierte Keys, "; "-getrennt
+    timestamp = str(_field(record, COL_TS)).strip()
+    if timestamp and not parse_timestamp(timestamp): raise IngestError(f"unlesbarer Timestamp '{timestamp}'")
+    row = {COL_TS: timestamp or now_ts, COL_LBL: labeler_id, COL_URL: url, COL_CATS: "; ".join(keys), COL_COMMENT: str(_field(record, COL_COMMENT)).strip()}
+    return [row[col] for col in HEADER]
+
+
+def iter_records(path):
+    """Liefert `(Datensatznummer, dict)` aus einer CSV- (mit Header) oder JSONL-Datei; Nummern zählen ab 1."""
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            number = 0
+            for line in f:
+                if not line.strip(): continue
+                number += 1
+                try: record = json.loads(line)
+                except json.JSONDecodeError as e: record = {"__error__": f"kein gültiges JSON ({e.msg})"}
+                yield number, record if isinstance(record, dict) else {"__error__": "kein JSON-Objekt"}
+    else:
+        with open(path, newline="", encoding=detect_encoding(path)) as f:
+            yield from enumerate(csv.DictReader(f), start=1)
+
+
+def dedup_key(labeler_id, url):
+    """64-Bit-Schlüssel von (Labeler, Item) – Varianten desselben Tweets fallen zusammen."""
+    return key_hash(f"{labeler_id}\t{item_key(url)}")
+
+
+def existing_keys(storage, chunk_size=5000):
+    """`{dedup_key: Zeilennummer}` aller vorhandenen Ergebniszeilen (blockweise gelesen)."""
+    lbl_idx, url_idx = HEADER.index(COL_LBL), HEADER.index(COL_URL)
+    keys, start_row = {}, 2
+    while True:
+        rows, next_row = storage.read_rows(start_row, limit=chunk_size)
+        for row_number, row in rows:
+            labeler_id = str(row[lbl_idx]).strip() if len(row) > lbl_idx else ""
+            url = str(row[url_idx]).strip() if len(row) > url_idx else ""
+            if labeler_id and url: keys[dedup_key(labeler_id, url)] = row_number
+        if not rows or next_row == start_row: return keys
+        start_row = next_row
+
+
+def journal_keys(journal_path):
+    """Schlüssel der Zeilen, die im Journal der App noch auf den Flush warten (leer, wenn es keins gibt)."""
+    if not os.path.exists(journal_path): return set()
+    lbl_idx, url_idx = HEADER.index(COL_LBL), HEADER.index(COL_URL)
+    conn = sqlite3.connect(f"file:{journal_path}?mode=ro", uri=True, timeout=30)
+    try: rows = [json.loads(r) for (r,) in conn.execute("SELECT row FROM pending")]
+    except sqlite3.OperationalError: return set()
+    finally: conn.close()
+    return {dedup_key(row[lbl_idx].strip(), row[url_idx].strip()) for row in rows if len(row) > url_idx and row[lbl_idx].strip() and row[url_idx].strip()}
+
+
+def input_fingerprint(path):
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path): return None
+    with open(path, encoding="utf-8") as f: return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    """Schreibt den Checkpoint atomar (ein Abbruch hinterlässt nie eine halbe Datei)."""
+    checkpoint_dir = os.path.dirname(path)
+    if checkpoint_dir: os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f: json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_seen_keys(path, count):
+    """Schlüssel der ersten `count` geschriebenen Datensätze; Überhang nach dem letzten Checkpoint wird abgeschnitten."""
+    if not count: return set()
+    keys = np.fromfile(path, dtype=np.uint64, count=count) if os.path.exists(path) else np.zeros(0, dtype=np.uint64)
+    if len(keys) < count: raise ValueError(f"Schlüsseldatei '{path}' passt nicht zum Checkpoint.")
+    with open(path, "r+b") as f: f.truncate(count * 8)
+    return set(keys.tolist())
+
+
+def append_seen_keys(path, keys):
+    keys_dir = os.path.dirname(path)
+    if keys_dir: os.makedirs(keys_dir, exist_ok=True)
+    with open(path, "ab") as f: np.asarray(keys, dtype=np.uint64).tofile(f); f.flush(); os.fsync(f.fileno())
+
+
+def trim_rejects(reject_path, done_records):
+    """Entfernt Rejects nach dem Checkpoint (sie werden beim Fortsetzen erneut geprüft und geschrieben)."""
+    with open(reject_path, newline="", encoding="utf-8") as f: rows = list(csv.reader(f))
+    with open(f"{reject_path}.tmp", "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows[:1] + [row for row in rows[1:] if row and int(row[0]) <= done_records])
+    os.replace(f"{reject_path}.tmp", reject_path)
+
+
+def ingest(storage, input_path, checkpoint_path, reject_path, mode="skip", batch_size=2000, journal_path=None,
+           drop_unknown=False, dry_run=False, resume=False, chunk_size=5000):
+    """Importiert `input_path` in Batches. Gibt die Zähler zurück (wie im Checkpoint)."""
+    lbl_idx, url_idx = HEADER.index(COL_LBL), HEADER.index(COL_URL)
+    fingerprint = input_fingerprint(input_path)
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and checkpoint.get("input") != fingerprint:
+        raise ValueError(f"Checkpoint '{checkpoint_path}' gehört zu einer anderen oder geänderten Input-Datei.")
+    counts = dict(checkpoint["counts"]) if checkpoint else {"records": 0, "written": 0, "updated": 0, "duplicates": 0, "rejected": 0}
+    done_records = counts["records"]
+    if checkpoint and checkpoint.get("finished"): print("Import laut Checkpoint bereits abgeschlossen."); return counts
+    if done_records: print(f"Setze nach Datensatz {done_records} fort.")
+    if checkpoint and os.path.exists(reject_path): trim_rejects(reject_path, done_records)
+    keys_path = f"{checkpoint_path}.keys"
+    # Schlüssel, die aus dieser Datei schon geschrieben wurden (spätere Datensätze überschreiben sie)
+    seen = load_seen_keys(keys_path, checkpoint.get("seen_keys", 0)) if checkpoint else set()
+    if not checkpoint and not dry_run and os.path.exists(keys_path): os.remove(keys_path)
+
+    existing = existing_keys(storage, chunk_size) if storage else {}
+    pending = journal_keys(journal_path) if journal_path else set()
+    print(f"Vorhandene (Labeler, Item)-Paare: {len(existing)}, davon im Journal ausstehend: {len(pending)}")
+    now_ts = datetime.now(TIMEZONE).strftime(TIMESTAMP_FORMAT)
+
+    batch, batch_end = {}, done_records # {Schlüssel: Zeile}, ein späterer Datensatz ersetzt den früheren
+    def flush(finished=False):
+        nonlocal batch
+        if batch and not dry_run:
+            new_keys = [key for key in batch if key not in seen]
+            # Upsert über `existing`: enthält im Modus "skip" nur Zeilen, die aus dieser Datei stammen
+            written = storage.upsert_rows(list(batch.values()), lbl_idx, url_idx, lambda labeler_id, url: existing.get(dedup_key(labeler_id, url)), key=dedup_key)
+            for row_number, row in written: existing[dedup_key(row[lbl_idx], row[url_idx])] = row_number
+            seen.update(new_keys); append_seen_keys(keys_path, new_keys)
+        elif dry_run: seen.update(batch)
+        batch = {}
+        counts["records"] = batch_end
+        if not dry_run: save_checkpoint(checkpoint_path, {"input": fingerprint, "mode": mode, "counts": counts, "seen_keys": len(seen), "finished": finished,
+                                                          "updated_at": datetime.now(TIMEZONE).strftime(TIMESTAMP_FORMAT)})
+
+    reject_file = None
+    try:
+        for number, record in iter_records(input_path):
+            if number <= done_records: continue
+            try:
+                if "__error__" in record: raise IngestError(record["__error__"])
+                row = normalize_record(record, now_ts, drop_unknown=drop_unknown)
+                key = dedup_key(row[lbl_idx], row[url_idx])
+                if key in pending or (mode == "skip" and key in existing and key not in seen): counts["duplicates"] += 1; continue
+                if key in seen or key in batch: counts["duplicates"] += 1 # Korrektur eines früheren Datensatzes: ersetzt ihn
+                else: counts["updated" if key in existing else "written"] += 1
+                batch.pop(key, None); batch[key] = row
+            except IngestError as e:
+                counts["rejected"] += 1
+                if reject_file is None:
+                    os.makedirs(os.path.dirname(reject_path) or ".", exist_ok=True)
+                    reject_file = open(reject_path, "a" if checkpoint else "w", newline="", encoding="utf-8"); reject_writer = csv.writer(reject_file)
+                    if reject_file.tell() == 0: reject_writer.writerow(["record", "reason", "data"])
+                reject_writer.writerow([number, str(e), json.dumps(record, ensure_ascii=False)])
+            finally: batch_end = number
+            if len(batch) >= batch_size:
+                flush(); print(f"  {counts['records']} Datensätze verarbeitet, {counts['written']} neu, {counts['updated']} aktualisiert")
+        flush(finished=True)
+    finally:
+        if reject_file: reject_file.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importiert Ergebniszeilen (Labeler, URL, Kategorien, Kommentar) gebündelt ins Backend.")
+    parser.add_argument("input", help="CSV (mit Header) oder JSONL mit einem Datensatz pro Zeile")
+    parser.add_argument("--secrets", default=SECRETS_PATH, help="Pfad zur secrets.toml der App")
+    parser.add_argument("--mode", choices=INGEST_MODES, default="skip", help="skip: vorhandene (Labeler, URL) überspringen, upsert: überschreiben")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Zeilen pro Schreibvorgang")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint-Datei (Standard: <local_state_dir>/ingest/<Dateiname>.checkpoint.json)")
+    parser.add_argument("--resume", action="store_true", help="Ab dem letzten Checkpoint fortsetzen")
+    parser.add_argument("--drop-unknown", action="store_true", help="Unbekannte Kategorien entfernen statt den Datensatz abzulehnen")
+    parser.add_argument("--dry-run", action="store_true", help="Nur prüfen und zählen, nichts schreiben")
+    args = parser.parse_args(argv)
+
+    secrets = load_secrets_file(args.secrets)
+    storage_config = dict(secrets.get("storage", {}))
+    if storage_config.get("backend", "gsheets") == "fake_gsheets":
+        print("Das Backend 'fake_gsheets' lebt nur im App-Prozess, da kann nichts importiert werden."); return 1
+    storage = make_backend(storage_config, secrets.get("google_sheets", {}), HEADER)
+    print(f"Backend: {storage.describe()}")
+    if not args.dry_run: storage.ensure_header()
+
+    local_state_dir = secrets.get("labeler", {}).get("local_state_dir", ".labeler_state")
+    base_name = os.path.basename(args.input)
+    checkpoint_path = args.checkpoint or os.path.join(local_state_dir, "ingest", f"{base_name}.checkpoint.json")
+    reject_path = os.path.join(os.path.dirname(checkpoint_path), f"{base_name}.rejects.csv")
+    if not args.resume and not args.dry_run and os.path.exists(checkpoint_path):
+        print(f"Checkpoint '{checkpoint_path}' existiert: mit --resume fortsetzen oder die Datei löschen."); return 1
+    try:
+        counts = ingest(storage, args.input, checkpoint_path, reject_path, mode=args.mode, batch_size=args.batch_size,
+                        journal_path=os.path.join(local_state_dir, "save_journal.sqlite"), drop_unknown=args.drop_unknown,
+                        dry_run=args.dry_run, resume=args.resume)
+    except ValueError as e: print(f"Fehler: {e}"); return 1
+    verb = "würden geschrieben" if args.dry_run else "geschrieben"
+    print(f"Datensätze: {counts['records']}, {verb}: {counts['written']} neu / {counts['updated']} aktualisiert, "
+          f"Duplikate: {counts['duplicates']}, abgelehnt: {counts['rejected']}")
+    if counts["rejected"]: print(f"Abgelehnte Datensätze: {reject_path}")
+    if not args.dry_run: print(f"Checkpoint: {checkpoint_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+# Prozessweite Metriken: Spans (Dauer-Histogramme), Zähler und Collector-Werte
+#
+# Heiße Pfade werden mit `with metrics.span("name", labeler=...)` gemessen. Pro (Name, Labels)
+# gibt es ein Histogramm mit festen Buckets (ein Lock + bisect pro Messung). Bestehende Zähler
+# anderer Komponenten (Embed-Cache, Quota-Client, Write-Queue, Scheduler) werden nicht doppelt
+# geführt, sondern beim Export über Collectors abgefragt.
+#
+# Export:
+# - prometheus_text(): Textformat von Prometheus (z.B. für den node_exporter-Textfile-Collector)
+# - JSONL: jede Messung als eine Zeile (gepuffert, von einem Hintergrund-Thread geschrieben)
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Bucket-Grenzen in Sekunden (1 ms bis 60 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "labeler_"
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(label_key, extra=()):
+    items = list(label_key) + list(extra)
+    if not items: return ""
+    escape = lambda v: v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in items) + "}"
+
+
+class Histogram:
+    """Kumulative Bucket-Zählung wie bei Prometheus, dazu Summe, Anzahl und Maximum."""
+
+    __slots__ = ("bounds", "counts", "total", "count", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # letzter Bucket: +Inf
+        self.total = 0.0; self.count = 0; self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value; self.count += 1
+        if value > self.max: self.max = value
+
+    def quantile(self, q):
+        """Quantil, linear innerhalb des Buckets interpoliert (Genauigkeit = Bucket-Breite)."""
+        if not self.count: return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class MetricsRegistry:
+    """Thread-sichere Sammlung von Spans, Zählern und Collectors eines Prozesses."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, jsonl_path=None):
+        self.buckets = tuple(buckets)
+        self.started = time.time()
+        self._histograms = {} # (Span-Name, Label-Key) -> Histogram
+        self._counters = {} # (Name, Label-Key) -> Wert
+        self._collectors = {} # Name -> Funktion, die {Metrik: Wert} liefert
+        self._lock = threading.Lock()
+        self.jsonl_path = jsonl_path
+        self._events = deque(maxlen=100000) # Puffer für JSONL; bei Überlauf fallen die ältesten weg
+
+    # --- Erfassen ---
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None: histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        if self.jsonl_path: self._events.append({"ts": round(time.time(), 3), "span": name, "seconds": round(seconds, 6), **{k: v for k, v in key[1]}})
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Misst die Dauer des Blocks (auch wenn er mit einer Exception endet)."""
+        start = time.perf_counter()
+        try: yield
+        finally: self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """Decorator-Variante von `span()` für ganze Funktionen (z.B. Fragmente)."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels): return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, n=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock: self._counters[key] = self._counters.get(key, 0) + n
+
+    def add_collector(self, name, collect_fn):
+        """`collect_fn()` liefert {Metrik: Zahl}; wird erst beim Export aufgerufen. Gleicher Name ersetzt."""
+        with self._lock: self._collectors[name] = collect_fn
+
+    # --- Auslesen ---
+    def span_rows(self):
+        """Eine Zeile pro (Span, Labels) mit Anzahl, Mittel, p50/p95/Max in Millisekunden."""
+        with self._lock: items = [(name, labels, h.count, h.total, h.quantile(0.5), h.quantile(0.95), h.max) for (name, labels), h in self._histograms.items()]
+        return [{"span": name, **dict(labels), "count": count, "mean_ms": round(total / count * 1000, 1) if count else 0.0,
+                 "p50_ms": round(p50 * 1000, 1), "p95_ms": round(p95 * 1000, 1), "max_ms": round(peak * 1000, 1)}
+                for name, labels, count, total, p50, p95, peak in sorted(items, key=lambda item: (item[0], item[1]))]
+
+    def counter_rows(self):
+        with self._lock: items = sorted(self._counters.items())
+        return [{"counter": name, **dict(labels), "value": value} for (name, labels), value in items]
+
+    def collected(self):
+        """Werte aller Collectors; ein fehlerhafter Collector liefert nur einen Fehlerzähler."""
+        with self._lock: collectors = list(self._collectors.items())
+        values = {}
+        for prefix, collect_fn in collectors:
+            try: values.update({f"{prefix}_{k}": v for k, v in collect_fn().items() if isinstance(v, (int, float))})
+            except Exception as e: logger.warning("Metrik-Collector '%s' fehlgeschlagen: %s", prefix, e); values[f"{prefix}_collect_errors"] = 1
+        return values
+
+    def prometheus_text(self):
+        """Alle Metriken im Prometheus-Textformat."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            snapshot = [(key, list(h.counts), h.total, h.count) for key, h in histograms]
+        if snapshot:
+            family = f"{METRIC_PREFIX}span_seconds"
+            lines += [f"# HELP {family} Dauer heißer Pfade (Spans).", f"# TYPE {family} histogram"]
+            for (name, labels), counts, total, count in snapshot:
+                cumulative = 0
+                for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+                    cumulative += n
+                    lines.append(f"{family}_bucket{_format_labels((('span', name),) + labels, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{family}_sum{_format_labels((('span', name),) + labels)} {total:.6f}")
+                lines.append(f"{family}_count{_format_labels((('span', name),) + labels)} {count}")
+        for name in sorted({name for (name, _), _ in counters}):
+            lines += [f"# TYPE {METRIC_PREFIX}{name}_total counter"]
+            lines += [f"{METRIC_PREFIX}{name}_total{_format_labels(labels)} {value}" for (n, labels), value in counters if n == name]
+        for name, value in sorted(self.collected().items()):
+            lines += [f"# TYPE {METRIC_PREFIX}{name} gauge", f"{METRIC_PREFIX}{name} {value}"]
+        lines += [f"# TYPE {METRIC_PREFIX}uptime_seconds gauge", f"{METRIC_PREFIX}uptime_seconds {time.time() - self.started:.0f}"]
+        return "\n".join(lines) + "\n"
+
+    # --- Dateien ---
+    def flush_jsonl(self):
+        """Schreibt gepufferte Messungen als JSONL ans Ende von `jsonl_path`. Gibt die Anzahl zurück."""
+        if not self.jsonl_path or not self._events: return 0
+        events = []
+        while self._events:
+            try: events.append(self._events.popleft())
+            except IndexError: break
+        jsonl_dir = os.path.dirname(self.jsonl_path)
+        if jsonl_dir: os.makedirs(jsonl_dir, exist_ok=True)
+        with open(self.jsonl_path, "a", encoding="utf-8") as f: f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in events)
+        return len(events)
+
+    def write_textfile(self, path):
+        """Schreibt `prometheus_text()` atomar nach `path` (Textfile-Collector liest nie halbe Dateien)."""
+        text_dir = os.path.dirname(path)
+        if text_dir: os.makedirs(text_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f: f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def start_exporter(self, interval=15.0, textfile_path=None):
+        """Hintergrund-Thread, der alle `interval` Sekunden JSONL schreibt und die Textdatei erneuert."""
+        if not self.jsonl_path and not textfile_path: return None
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush_jsonl()
+                    if textfile_path: self.write_textfile(textfile_path)
+                except Exception: logger.exception("Metrik-Export fehlgeschlagen")
+        thread = threading.Thread(target=run, name="labeler-metrics-export", daemon=True)
+        thread.start()
+        return thread
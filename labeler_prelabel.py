@@ -0,0 +1,332 @@
+# Vorlabels: Subkategorie-Vorschläge aus dem Codebook-Text, offline für die ganze Input-Datei
+#
+# Aufruf (im Projektordner, die App darf dabei laufen):
+#   python labeler_prelabel.py                      # bewertet alle Items von input.csv mit gecachtem Tweet-Text
+#   python labeler_prelabel.py --fetch-missing      # holt fehlende oEmbed-Vorschauen vorher ab
+#   python labeler_prelabel.py --threshold 0.25 --workers 8
+#
+# Der Text kommt aus einem eigenen Text-Speicher (`prelabel_texts.sqlite`, ohne Verdrängung), ersatzweise
+# aus dem oEmbed-Cache der App (Blockquote -> Text). `--fetch-missing` legt die abgerufenen Texte nur im
+# Text-Speicher ab, damit sie nicht mit dem LRU-Cache der App konkurrieren. Das Modell ist ein TF-IDF-Abgleich
+# gegen das Codebook: pro Subkategorie ein Vektor aus Titel, Definition und Include-Beispielen, ein
+# zweiter aus dem Exclude-Text zieht ab. Bewertet wird in einem Prozess-Pool, blockweise über die
+# URL-Tabelle. Das Ergebnis liegt neben der Tabelle (`<table_dir>/prelabels/`), eine Zeile pro Item:
+#   scores.npy  float16 Items × Subkategorien (Reihenfolge wie ALL_CATEGORIES_KEYS)
+#   mask.npy    uint16 Bitmaske der Vorschläge (Codebook-Bits), MASK_MISSING = kein Text
+#   margin.npy  float16 Abstand der knappsten Vorschlags-Entscheidung (Schwelle bzw. Rang bei max_suggestions; klein = unsicher), NaN = kein Text
+#   meta.json   Schwelle, Codebook-Version, Zähler
+# Die App hakt die Vorschläge vor und kann unsichere Items zuerst vergeben.
+import argparse
+import html
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from labeler_codebook import CATEGORIES, ALL_CATEGORIES_KEYS, CATEGORY_BITS, CODEBOOK_VERSION, MASK_MISSING, decode_mask
+from labeler_embed import canonical_tweet_url
+from labeler_storage import load_secrets_file, SECRETS_PATH
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "codebook-tfidf-v1"
+TOKEN_PATTERN = re.compile(r"[a-zäöüß][a-zäöüß0-9]+")
+TAG_PATTERN = re.compile(r"<[^>]+>")
+PARAGRAPH_PATTERN = re.compile(r"<p\b[^>]*>(.*?)</p>", re.IGNORECASE | re.DOTALL) # Tweet-Text im oEmbed-Blockquote
+STOPWORDS = frozenset("""a about above after again all also an and any are as at be because been being both but by can content covers
+discussing e.g eg etc for from general has have how in including includes into is issues it its like more most not of on only or other
+over posts post related refers see such than that the their them these this those through to under up us was we were what when where
+which while who with without you your""".split())
+QUERY_CHUNK = 500 # Keys pro SQL-Abfrage an den Vorschau-Cache
+
+
+# === Text ===
+@lru_cache(maxsize=65536)
+def _stem(token):
+    """Sehr leichte Normalisierung englischer Endungen (Plural, -ing, -ed), damit Codebook und Posts zusammenpassen."""
+    if len(token) > 4 and token.endswith("ies"): return token[:-3] + "y"
+    if len(token) > 5 and token.endswith("ing"): return token[:-3]
+    if len(token) > 4 and token.endswith("ed"): return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"): return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Terme eines Textes: Wortstämme plus zusammengezogene Bigramme ("mental health" -> "mentalhealth", passt auf Hashtags)."""
+    words = [w for w in TOKEN_PATTERN.findall(text.lower()) if w not in STOPWORDS]
+    return [_stem(w) for w in words] + [a + b for a, b in zip(words, words[1:])]
+
+
+def tweet_text(oembed_html):
+    """Reiner Text eines Tweets aus dem oEmbed-HTML ('' ohne Tweet-Blockquote).
+
+    Bewusst per Regex statt mit dem HTML-Parser der Vorschau: hier zählt nur der Text, und das für jedes Item.
+    """
+    if not oembed_html or "twitter-tweet" not in oembed_html: return ""
+    match = PARAGRAPH_PATTERN.search(oembed_html)
+    return " ".join(html.unescape(TAG_PATTERN.sub(" ", match.group(1))).split()) if match else ""
+
+
+# === Modell ===
+class CodebookClassifier:
+    """TF-IDF-Abgleich von Texten mit den Subkategorien des Codebooks (picklebar für den Prozess-Pool)."""
+
+    def __init__(self, exclude_weight=0.5):
+        self.exclude_weight = exclude_weight
+        positive, negative = [], []
+        for main_data in CATEGORIES.values():
+            for sub_data in main_data["sub"].values():
+                title = re.sub(r"^[\d.]+\s*", "", sub_data["title"])
+                # Titel und Include-Beispiele doppelt gewichtet: sie sind die schärfsten Hinweise
+                positive.append(Counter(tokenize(f"{title} {title} {sub_data['definition']} {sub_data['include']} {sub_data['include']}")))
+                negative.append(Counter(tokenize(sub_data["exclude"])))
+        self.vocabulary = {term: i for i, term in enumerate(sorted(set().union(*positive)))}
+        n_docs = len(positive)
+        document_frequency = Counter(term for doc in positive for term in doc)
+        self.idf = np.array([math.log((1 + n_docs) / (1 + document_frequency[term])) + 1 for term in self.vocabulary], dtype=np.float32)
+        self.positive = self._normalized_rows(positive)
+        self.negative = self._normalized_rows(negative)
+
+    def _vectors(self, counters):
+        matrix = np.zeros((len(counters), len(self.vocabulary)), dtype=np.float32)
+        for row, counts in enumerate(counters):
+            for term, n in counts.items():
+                column = self.vocabulary.get(term)
+                if column is not None: matrix[row, column] = 1 + math.log(n)
+        return matrix * self.idf
+
+    def _normalized_rows(self, counters):
+        matrix = self._vectors(counters)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+    def score(self, texts):
+        """Scores in [0, 1] als float32-Array Texte × Subkategorien."""
+        vectors = self._normalized_rows([Counter(tokenize(text)) for text in texts])
+        return np.clip(vectors @ self.positive.T - self.exclude_weight * (vectors @ self.negative.T), 0.0, 1.0)
+
+
+def _selected(scores, threshold, max_suggestions):
+    selected = scores >= threshold
+    if max_suggestions < scores.shape[1]:
+        rank = np.argsort(np.argsort(-scores, axis=1, kind="stable"), axis=1)
+        selected &= rank < max_suggestions
+    return selected
+
+
+def suggestion_masks(scores, threshold, max_suggestions):
+    """Bitmaske der Vorschläge: Subkategorien über der Schwelle, höchstens `max_suggestions` pro Item."""
+    bits = np.array([CATEGORY_BITS[key] for key in ALL_CATEGORIES_KEYS], dtype=np.uint16)
+    return (_selected(scores, threshold, max_suggestions) * bits).sum(axis=1).astype(np.uint16)
+
+
+def decision_margins(scores, threshold, max_suggestions):
+    """Pro Item: um wie viel sich ein Score mindestens ändern müsste, damit `suggestion_masks` anders entscheidet.
+
+    Ein Vorschlag fällt weg, wenn sein Score unter die Schwelle oder unter den besten nicht gewählten fällt;
+    eine andere Subkategorie kommt dazu, wenn sie die Schwelle und den letzten gewählten Platz erreicht.
+    """
+    n_categories = scores.shape[1]
+    slots = min(max_suggestions, n_categories)
+    ranked = -np.sort(-scores, axis=1)
+    last_in = ranked[:, slots - 1, None] if slots > 0 else np.full((len(scores), 1), np.inf) # Ohne Plätze kommt nichts dazu
+    first_out = ranked[:, slots, None] if slots < n_categories else np.full((len(scores), 1), -np.inf)
+    keep = np.minimum(scores - threshold, scores - first_out)
+    join = np.maximum(threshold, last_in) - scores
+    return np.where(_selected(scores, threshold, max_suggestions), keep, join).min(axis=1)
+
+
+# === Text: eigener Text-Speicher, ersatzweise der Vorschau-Cache ===
+def _lookup(path, sql, keys):
+    """`{key: wert}` für `keys` aus einer SQLite-Datei (nur lesend; leer, wenn es sie nicht gibt)."""
+    found = {}
+    if not keys or not os.path.exists(path): return found
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+    try:
+        for start in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[start:start + QUERY_CHUNK]
+            found.update(conn.execute(sql.format(placeholders=", ".join("?" * len(chunk))), chunk).fetchall())
+    finally: conn.close()
+    return found
+
+
+def stored_texts(text_path, keys):
+    """`{key: text}` aus dem Text-Speicher (auch '' für Tweets ohne Text)."""
+    return _lookup(text_path, "SELECT key, text FROM texts WHERE key IN ({placeholders})", list(keys))
+
+
+def store_texts(text_path, entries):
+    """Schreibt `(key, text)`-Paare in den Text-Speicher (vorhandene werden ersetzt). Es gibt keine Verdrängung."""
+    text_dir = os.path.dirname(text_path)
+    if text_dir: os.makedirs(text_dir, exist_ok=True)
+    conn = sqlite3.connect(text_path, timeout=30)
+    try:
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS texts (key TEXT PRIMARY KEY, text TEXT NOT NULL, stored_at REAL NOT NULL)")
+            now = time.time()
+            conn.executemany("INSERT INTO texts (key, text, stored_at) VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET text = excluded.text, stored_at = excluded.stored_at",
+                             [(key, text, now) for key, text in entries])
+    finally: conn.close()
+
+
+def cached_texts(cache_path, urls, text_path=None):
+    """Tweet-Texte zu `urls` aus dem Text-Speicher, sonst aus dem oEmbed-Cache (nur erfolgreiche Einträge, TTL egal); '' ohne Text."""
+    keys = [canonical_tweet_url(url) for url in urls]
+    texts = stored_texts(text_path, set(keys)) if text_path else {}
+    missing = list({key for key in keys if key not in texts})
+    html_by_key = _lookup(cache_path, "SELECT key, html FROM embeds WHERE ok = 1 AND key IN ({placeholders})", missing)
+    return [texts[key] if key in texts else tweet_text(html_by_key[key]) if key in html_by_key else "" for key in keys]
+
+
+def score_range(table_dir, cache_path, start, end, classifier, text_path=None):
+    """Bewertet die Items `start:end` einer URL-Tabelle (läuft in einem Worker-Prozess). Gibt `(start, scores, has_text)` zurück."""
+    from labeler_urls import UrlTable
+    table = UrlTable(table_dir)
+    texts = cached_texts(cache_path, [table[i] for i in range(start, end)], text_path)
+    has_text = np.array([bool(text) for text in texts], dtype=bool)
+    scores = np.zeros((end - start, len(ALL_CATEGORIES_KEYS)), dtype=np.float32)
+    if has_text.any(): scores[has_text] = classifier.score([text for text in texts if text])
+    return start, scores, has_text
+
+
+def fetch_missing(table, text_path, cache_path, fetch_fn, workers=4, chunk_size=5000):
+    """Legt für alle Items ohne Eintrag im Text-Speicher den Tweet-Text dort ab. Gibt die Anzahl der Abrufe zurück.
+
+    Texte, die der oEmbed-Cache der App noch hat, werden übernommen; der Rest wird mit `fetch_fn(url)`
+    (liefert `(html, ok)` oder None) abgerufen. Fehlschläge werden nicht gespeichert und beim nächsten
+    Lauf erneut versucht. Der Cache der App wird dabei nicht beschrieben.
+    """
+    fetched = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(table), chunk_size):
+            urls = {canonical_tweet_url(table[i]): table[i] for i in range(start, min(start + chunk_size, len(table)))}
+            stored = stored_texts(text_path, urls)
+            missing = [key for key in urls if key not in stored]
+            html_by_key = _lookup(cache_path, "SELECT key, html FROM embeds WHERE ok = 1 AND key IN ({placeholders})", missing)
+            entries = [(key, tweet_text(html)) for key, html in html_by_key.items()]
+            to_fetch = [key for key in missing if key not in html_by_key]
+            for key, result in zip(to_fetch, executor.map(lambda key: fetch_fn(urls[key]), to_fetch)):
+                if result is not None and result[1]: entries.append((key, tweet_text(result[0])))
+            fetched += len(to_fetch)
+            if entries: store_texts(text_path, entries)
+    return fetched
+
+
+def build_prelabels(table, cache_path, out_dir, threshold=0.2, max_suggestions=2, exclude_weight=0.5, workers=None, chunk_size=5000, text_path=None):
+    """Bewertet alle Items der URL-Tabelle und schreibt das Ergebnis atomar nach `out_dir`. Gibt die Metadaten zurück."""
+    started = time.time()
+    classifier = CodebookClassifier(exclude_weight=exclude_weight)
+    n_items = len(table)
+    scores = np.zeros((n_items, len(ALL_CATEGORIES_KEYS)), dtype=np.float32)
+    has_text = np.zeros(n_items, dtype=bool)
+    ranges = [(start, min(start + chunk_size, n_items)) for start in range(0, n_items, chunk_size)]
+    if len(ranges) <= 1 or workers == 1:
+        results = [score_range(table.table_dir, cache_path, start, end, classifier, text_path) for start, end in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(score_range, table.table_dir, cache_path, start, end, classifier, text_path) for start, end in ranges]
+            results = [future.result() for future in futures]
+    for start, chunk_scores, chunk_has_text in results:
+        scores[start:start + len(chunk_scores)] = chunk_scores; has_text[start:start + len(chunk_has_text)] = chunk_has_text
+
+    masks = np.where(has_text, suggestion_masks(scores, threshold, max_suggestions), np.uint16(MASK_MISSING)).astype(np.uint16)
+    margins = np.where(has_text, decision_margins(scores, threshold, max_suggestions), np.nan).astype(np.float16)
+    meta = {"model": MODEL_NAME, "codebook_version": CODEBOOK_VERSION, "categories": ALL_CATEGORIES_KEYS, "threshold": threshold,
+            "max_suggestions": max_suggestions, "exclude_weight": exclude_weight, "items": n_items, "with_text": int(has_text.sum()),
+            "with_suggestions": int(((masks != 0) & has_text).sum()), "created": started, "seconds": round(time.time() - started, 2)}
+
+    parent_dir = os.path.dirname(out_dir) or "."
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".prelabels-", dir=parent_dir)
+    np.save(os.path.join(tmp_dir, "scores.npy"), scores.astype(np.float16))
+    np.save(os.path.join(tmp_dir, "mask.npy"), masks)
+    np.save(os.path.join(tmp_dir, "margin.npy"), margins)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f: json.dump(meta, f, ensure_ascii=False, indent=2)
+    if os.path.exists(out_dir): shutil.rmtree(out_dir)
+    os.replace(tmp_dir, out_dir)
+    return meta
+
+
+# === Lesen (App) ===
+class Prelabels:
+    """Memory-mapped Vorlabels einer URL-Tabelle."""
+
+    def __init__(self, prelabel_dir):
+        with open(os.path.join(prelabel_dir, "meta.json"), encoding="utf-8") as f: self.meta = json.load(f)
+        self.masks = np.load(os.path.join(prelabel_dir, "mask.npy"), mmap_mode="r")
+        self.margins = np.load(os.path.join(prelabel_dir, "margin.npy"), mmap_mode="r")
+        self.scores = np.load(os.path.join(prelabel_dir, "scores.npy"), mmap_mode="r")
+
+    def suggestions(self, item):
+        """Vorgeschlagene Subkategorie-Keys für ein Item (Index der URL-Tabelle); leer ohne Text."""
+        mask = int(self.masks[item])
+        return [] if mask == MASK_MISSING else decode_mask(mask)
+
+    def uncertain_first(self, order):
+        """`order` stabil nach Unsicherheit sortiert: knappste Entscheidungen zuerst, Items ohne Text zuletzt."""
+        margins = np.asarray(self.margins[np.asarray(order)], dtype=np.float32)
+        return np.asarray(order)[np.argsort(np.nan_to_num(margins, nan=np.inf), kind="stable")]
+
+
+def load_prelabels(prelabel_dir, n_items):
+    """`Prelabels` oder None, wenn sie fehlen, nicht zur Tabelle oder nicht zur Codebook-Version passen."""
+    if not os.path.exists(os.path.join(prelabel_dir, "meta.json")): return None
+    prelabels = Prelabels(prelabel_dir)
+    if prelabels.meta.get("codebook_version") != CODEBOOK_VERSION or prelabels.meta.get("items") != n_items:
+        logger.warning("Vorlabels in '%s' passen nicht zu Tabelle/Codebook, werden ignoriert.", prelabel_dir); return None
+    return prelabels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Berechnet Subkategorie-Vorschläge (TF-IDF gegen das Codebook) für alle Items der Input-Datei.")
+    parser.add_argument("--secrets", default=SECRETS_PATH, help="Pfad zur secrets.toml der App")
+    parser.add_argument("--input", default="input.csv", help="Input-Datei der App")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Mindest-Score für einen Vorschlag")
+    parser.add_argument("--max-suggestions", type=int, default=2, help="Höchstens so viele Vorschläge pro Item")
+    parser.add_argument("--workers", type=int, default=None, help="Prozesse (Standard: Anzahl CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Items pro Arbeitspaket")
+    parser.add_argument("--fetch-missing", action="store_true", help="Fehlende oEmbed-Vorschauen vorher abrufen und cachen")
+    parser.add_argument("--top", type=int, default=5, help="So viele Beispiele mit Vorschlägen ausgeben")
+    args = parser.parse_args(argv)
+
+    secrets = load_secrets_file(args.secrets) if os.path.exists(args.secrets) else {}
+    labeler_config = secrets.get("labeler", {})
+    local_state_dir = labeler_config.get("local_state_dir", ".labeler_state")
+    cache_path = labeler_config.get("embed_cache_path", os.path.join(local_state_dir, "embed_cache.sqlite"))
+    text_path = labeler_config.get("prelabel_text_path", os.path.join(local_state_dir, "prelabel_texts.sqlite"))
+    from labeler_urls import build_url_table
+    table = build_url_table(args.input, os.path.join(local_state_dir, "url_tables"))
+    print(f"URL-Tabelle: {len(table)} Items ({table.table_dir})")
+
+    if args.fetch_missing:
+        from labeler_embed import make_http_session, HostLimiter, fetch_tweet_embed_html, OEMBED_ENDPOINT
+        session = make_http_session(pool_size=8)
+        limiter = HostLimiter(per_host_limit=int(labeler_config.get("prefetch_per_host", 2)))
+        endpoint = labeler_config.get("oembed_endpoint", OEMBED_ENDPOINT)
+        fetched = fetch_missing(table, text_path, cache_path, lambda url: fetch_tweet_embed_html(session, limiter, url, endpoint=endpoint))
+        print(f"Vorschauen abgerufen: {fetched} (Texte in {text_path})")
+
+    out_dir = os.path.join(table.table_dir, "prelabels")
+    meta = build_prelabels(table, cache_path, out_dir, threshold=args.threshold, max_suggestions=args.max_suggestions,
+                           workers=args.workers, chunk_size=args.chunk_size, text_path=text_path)
+    print(f"Vorlabels: {out_dir}")
+    print(f"Items: {meta['items']}, mit Text: {meta['with_text']}, mit Vorschlägen: {meta['with_suggestions']} ({meta['seconds']} s)")
+    prelabels = Prelabels(out_dir)
+    examples = [i for i in range(len(table)) if prelabels.suggestions(i)][:args.top]
+    for item in examples: print(f"  {table[item]} -> {'; '.join(prelabels.suggestions(item))}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
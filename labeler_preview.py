@@ -0,0 +1,256 @@
+# Leichte Tweet-Vorschau ohne widgets.js: statische Karte, lokale Foto-Vorschaubilder, Skript-Cache
+#
+# Das oEmbed-HTML wird mit omit_script=true abgerufen (nur das <blockquote>). Im statischen Modus
+# wird daraus eine Karte mit Text, Autor und Datum gebaut – ohne iframe und ohne Skript. Fotos, auf
+# die /photo/N-URLs aus der Input-Datei verweisen, kommen als kleine Vorschaubilder aus einem lokalen
+# Cache, den ein Hintergrund-Downloader füllt. Die interaktive Einbettung (iframe + widgets.js) gibt
+# es nur auf Wunsch; widgets.js wird dafür einmal lokal gecached und inline mitgegeben.
+import html
+import json
+import logging
+import math
+import os
+import re
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+SYNDICATION_ENDPOINT = "https://cdn.syndication.twimg.com/tweet-result" # Liefert die Medien-URLs eines Tweets
+WIDGETS_JS_URL = "https://platform.twitter.com/widgets.js"
+REMOTE_SCRIPT_TAG = f'<script async src="{WIDGETS_JS_URL}" charset="utf-8"></script>'
+WIDGETS_SCRIPT_PATTERN = re.compile(r"<script[^>]*widgets\.js[^>]*>\s*</script>", re.IGNORECASE)
+PHOTO_NUMBER_PATTERN = re.compile(r"/photo/(\d+)(?:$|[/?#])")
+STATUS_ID_PATTERN = re.compile(r"/status/(\d+)")
+
+SAFE_LINK_SCHEMES = ("https://", "http://") # Nur solche hrefs landen in der Karte (unsafe_allow_html)
+CARD_STYLE = "border:1px solid #8884; border-radius:12px; padding:12px 16px; margin-bottom:8px;"
+
+
+# === Statische Karte aus dem oEmbed-Blockquote ===
+class _BlockquoteParser(HTMLParser):
+    """Zerlegt `<blockquote class="twitter-tweet"><p>Text</p>&mdash; Autor <a>Datum</a></blockquote>`.
+
+    Vom Text bleiben nur Links (als <a>, mit geprüftem href) und Zeilenumbrüche übrig; alles andere
+    wird escaped.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text_parts, self.footer_parts = [], []
+        self.date, self.status_url = "", ""
+        self._in_p = self._in_footer_link = False
+        self._link_open = False
+        self._skip_depth = 0 # Inhalt von <script>/<style> wird verworfen
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in ("script", "style"): self._skip_depth += 1
+        elif tag == "p": self._in_p = True
+        elif tag == "br" and self._in_p: self.text_parts.append("<br>")
+        elif tag == "a":
+            href = attrs.get("href") or ""
+            if self._in_p and href.startswith(SAFE_LINK_SCHEMES):
+                self.text_parts.append(f'<a href="{html.escape(href)}" target="_blank">'); self._link_open = True
+            elif not self._in_p: self._in_footer_link = True; self.status_url = href
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"): self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == "p": self._in_p = False
+        elif tag == "a":
+            if self._link_open: self.text_parts.append("</a>"); self._link_open = False
+            self._in_footer_link = False
+
+    def handle_data(self, data):
+        if self._skip_depth: return
+        if self._in_p: self.text_parts.append(html.escape(data))
+        elif self._in_footer_link: self.date += data
+        else: self.footer_parts.append(data)
+
+
+def parse_oembed_html(oembed_html):
+    """`{"text_html", "author", "date", "status_url"}` aus dem oEmbed-HTML; None, wenn es kein Tweet-Blockquote ist."""
+    if not oembed_html or "twitter-tweet" not in oembed_html: return None
+    parser = _BlockquoteParser()
+    parser.feed(WIDGETS_SCRIPT_PATTERN.sub("", oembed_html)); parser.close()
+    author = " ".join("".join(parser.footer_parts).replace("—", " ").split())
+    return {"text_html": "".join(parser.text_parts).strip(), "author": author, "date": parser.date.strip(), "status_url": parser.status_url}
+
+
+def static_card_html(oembed_html, tweet_url):
+    """Statische Karte (nur HTML/CSS) oder None, wenn das oEmbed-HTML nicht lesbar ist."""
+    parsed = parse_oembed_html(oembed_html)
+    if not parsed: return None
+    status_url = parsed["status_url"].strip()
+    link = html.escape(status_url if status_url.lower().startswith(SAFE_LINK_SCHEMES) else tweet_url)
+    return (f'<div style="{CARD_STYLE}"><div style="font-weight:600; margin-bottom:6px;">{html.escape(parsed["author"] or "Unbekannt")}</div>'
+            f'<div style="white-space:pre-wrap; line-height:1.4;">{parsed["text_html"] or "<i>(kein Text)</i>"}</div>'
+            f'<div style="margin-top:8px; font-size:0.85em; opacity:0.7;"><a href="{link}" target="_blank">{html.escape(parsed["date"] or "Original öffnen")}</a></div></div>')
+
+
+def embed_html(oembed_html, script_tag):
+    """HTML für die interaktive Einbettung: Blockquote (ein evtl. enthaltenes widgets.js-Tag entfernt) + `script_tag`."""
+    return WIDGETS_SCRIPT_PATTERN.sub("", oembed_html) + script_tag
+
+
+def photo_numbers(urls):
+    """Foto-Nummern N aus allen `/photo/N`-URLs eines Items (sortiert, ohne Duplikate)."""
+    return sorted({int(m.group(1)) for url in urls if isinstance(url, str) for m in PHOTO_NUMBER_PATTERN.finditer(url)})
+
+
+# === Token für den Syndication-Endpunkt ===
+def _next_double(value):
+    return struct.unpack("<d", struct.pack("<q", struct.unpack("<q", struct.pack("<d", value))[0] + 1))[0]
+
+
+def _to_radix_string(value, radix=36):
+    """Wie `Number.prototype.toString(radix)` in JavaScript (V8) für positive Gleitkommazahlen."""
+    chars = "0123456789abcdefghijklmnopqrstuvwxyz"
+    integer, fraction = math.floor(value), value - math.floor(value)
+    delta = max(0.5 * (_next_double(value) - value), 5e-324)
+    digits = []
+    if fraction >= delta:
+        while True:
+            fraction *= radix; delta *= radix
+            digit = int(fraction); digits.append(digit); fraction -= digit
+            if (fraction > 0.5 or (fraction == 0.5 and digit & 1)) and fraction + delta > 1:
+                # Aufrunden, ggf. mit Übertrag in den ganzzahligen Teil
+                while True:
+                    if not digits: integer += 1; break
+                    last = digits.pop() + 1
+                    if last < radix: digits.append(last); break
+                break
+            if fraction < delta: break
+    integer_digits = ""
+    while True:
+        integer, remainder = divmod(integer, radix); integer_digits = chars[int(remainder)] + integer_digits
+        if not integer: break
+    return integer_digits + ("." + "".join(chars[d] for d in digits) if digits else "")
+
+
+def syndication_token(status_id):
+    """Token-Parameter, den die Web-Einbettung an den Syndication-Endpunkt hängt."""
+    return re.sub(r"(0+|\.)", "", _to_radix_string(float(int(status_id)) / 1e15 * math.pi))
+
+
+# === Lokaler Medien-Cache ===
+class MediaCache:
+    """Foto-Vorschaubilder unter `cache_dir/<status_id>/<N>.jpg`, von einem Hintergrund-Downloader gefüllt.
+
+    `thumbnails()` liefert nur, was schon auf Platte liegt, und blockiert nie; `request()` plant fehlende
+    Downloads ein. Tweets ohne (passende) Fotos bekommen eine Markierungsdatei, fehlgeschlagene Abrufe
+    werden `error_ttl` Sekunden lang nicht wiederholt.
+    """
+
+    def __init__(self, cache_dir, session, limiter, endpoint=SYNDICATION_ENDPOINT, max_workers=2, error_ttl=3600, max_photos=4, timeout=10):
+        self.cache_dir = cache_dir
+        self.session = session
+        self.limiter = limiter
+        self.endpoint = endpoint
+        self.error_ttl = error_ttl
+        self.max_photos = max_photos
+        self.timeout = timeout
+        self.downloaded = self.failed = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media-download")
+        self._in_flight, self._failed_at = set(), {}
+        self._lock = threading.Lock()
+
+    def _dir(self, status_id):
+        return os.path.join(self.cache_dir, str(status_id))
+
+    def path_for(self, status_id, number):
+        return os.path.join(self._dir(status_id), f"{number}.jpg")
+
+    def thumbnails(self, status_id, numbers):
+        """Pfade der bereits gecachten Vorschaubilder zu den Foto-Nummern `numbers`."""
+        return [path for path in (self.path_for(status_id, n) for n in numbers[:self.max_photos]) if os.path.exists(path)]
+
+    def _complete(self, status_id, numbers):
+        return os.path.exists(os.path.join(self._dir(status_id), "done")) or all(os.path.exists(self.path_for(status_id, n)) for n in numbers[:self.max_photos])
+
+    def request(self, status_id, numbers):
+        """Plant den Download fehlender Vorschaubilder ein. Gibt True zurück, wenn ein Download gestartet wurde."""
+        if not status_id or not numbers or not self.endpoint or self._complete(status_id, numbers): return False
+        with self._lock:
+            if status_id in self._in_flight or time.time() - self._failed_at.get(status_id, 0) < self.error_ttl: return False
+            self._in_flight.add(status_id)
+        self._executor.submit(self._download, status_id, list(numbers[:self.max_photos]))
+        return True
+
+    def _download(self, status_id, numbers):
+        try:
+            with self.limiter.slot(urlparse(self.endpoint).netloc):
+                response = self.session.get(self.endpoint, params={"id": status_id, "token": syndication_token(status_id), "lang": "de"}, timeout=self.timeout)
+                response.raise_for_status(); data = response.json()
+            media = [m for m in data.get("mediaDetails") or [] if m.get("media_url_https")]
+            os.makedirs(self._dir(status_id), exist_ok=True)
+            for number in numbers:
+                if number > len(media) or os.path.exists(self.path_for(status_id, number)): continue
+                image_url = media[number - 1]["media_url_https"]
+                with self.limiter.slot(urlparse(image_url).netloc):
+                    image = self.session.get(image_url, params={"name": "small"}, timeout=self.timeout); image.raise_for_status()
+                tmp_path = f"{self.path_for(status_id, number)}.tmp"
+                with open(tmp_path, "wb") as f: f.write(image.content)
+                os.replace(tmp_path, self.path_for(status_id, number)); self.downloaded += 1
+            # Alles geholt, was der Tweet hergibt: nicht erneut anfragen
+            with open(os.path.join(self._dir(status_id), "done"), "w", encoding="utf-8") as f: json.dump({"photos": len(media), "requested": numbers}, f)
+        except Exception as e:
+            logger.warning("Vorschaubilder für %s nicht geladen: %s", status_id, e)
+            self.failed += 1
+            with self._lock: self._failed_at[status_id] = time.time()
+        finally:
+            with self._lock: self._in_flight.discard(status_id)
+
+    def stats(self):
+        return {"downloaded": self.downloaded, "failed": self.failed, "in_flight": len(self._in_flight)}
+
+
+class WidgetsScript:
+    """Lokal gecachte Kopie von widgets.js für die interaktive Einbettung (einmal pro `max_age` neu geladen).
+
+    Solange keine Kopie da ist, liefert `script_tag()` das normale externe Script-Tag.
+    """
+
+    def __init__(self, path, session, url=WIDGETS_JS_URL, max_age=86400, timeout=15):
+        self.path = path
+        self.session = session
+        self.url = url
+        self.max_age = max_age
+        self.timeout = timeout
+        self._script = None
+        self._loading = False
+        self._lock = threading.Lock()
+
+    def _fresh(self):
+        return os.path.exists(self.path) and time.time() - os.path.getmtime(self.path) < self.max_age
+
+    def _download(self):
+        try:
+            response = self.session.get(self.url, timeout=self.timeout); response.raise_for_status()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.tmp", "wb") as f: f.write(response.content)
+            os.replace(f"{self.path}.tmp", self.path)
+            with self._lock: self._script = None # Beim nächsten script_tag() neu einlesen
+        except Exception as e: logger.warning("widgets.js nicht geladen: %s", e)
+        finally:
+            with self._lock: self._loading = False
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._loading or self._fresh(): return
+            self._loading = True
+        threading.Thread(target=self._download, name="widgets-js-download", daemon=True).start()
+
+    def script_tag(self):
+        self.refresh_in_background()
+        with self._lock:
+            if self._script is None and os.path.exists(self.path):
+                with open(self.path, encoding="utf-8", errors="replace") as f: self._script = f.read().replace("</script", "<\\/script")
+            script = self._script
+        if script: return f'<script charset="utf-8">{script}</script>'
+        return REMOTE_SCRIPT_TAG
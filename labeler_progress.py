@@ -0,0 +1,89 @@
+# Prozessweiter Fortschritts-Index (Labeler -> Menge bearbeiteter URLs)
+#
+# Statt bei jedem Session-Start das komplette Sheet zu laden, werden nur die Spalten
+# Labeler_ID und URL gelesen, und zwar nur ab der ersten noch nicht gesehenen Zeile.
+# Nebenbei merkt sich der Index die (letzte) Zeilennummer pro (Labeler, URL) für Upserts.
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressIndex:
+    """Inkrementeller Index über die Ergebnis-Zeilen eines Speicher-Backends.
+
+    `next_row` ist die erste (1-basierte) Zeile, die noch nicht gelesen wurde.
+    Eigene Speichervorgänge werden über `add()` direkt eingetragen, ohne auf das Backend zu warten.
+    """
+
+    def __init__(self, storage, labeler_col, url_col, min_refresh_interval=5.0):
+        self.storage = storage
+        self.labeler_col = labeler_col
+        self.url_col = url_col
+        self.min_refresh_interval = min_refresh_interval
+        self.next_row = 2 # Zeile 1 ist der Header
+        self.rows_seen = 0
+        self.last_refresh = 0.0
+        self._by_labeler = {}
+        self._row_of = {} # (Labeler, URL) -> Zeilennummer der letzten Zeile
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """Liest nur die neuen Zeilen seit dem letzten Aufruf. Gibt die Zahl neuer Zeilen zurück."""
+        with self._refresh_lock:
+            if not force and time.monotonic() - self.last_refresh < self.min_refresh_interval: return 0
+            start_row = self.next_row
+            rows, next_row = self.storage.read_progress(start_row, self.labeler_col, self.url_col)
+            n_rows = len(rows)
+            added = []
+            with self._lock:
+                for row_number, lbl, url in rows:
+                    lbl, url = lbl.strip(), url.strip()
+                    if lbl and url: self._add_locked(lbl, url, added); self._row_of[(lbl, url)] = row_number
+                self.next_row = next_row
+                self.rows_seen += n_rows
+            self._notify(added)
+            self.last_refresh = time.monotonic()
+            if n_rows: logger.debug("Fortschritts-Index: %d neue Zeilen ab Zeile %d gelesen.", n_rows, start_row)
+            return n_rows
+
+    def _add_locked(self, labeler_id, url, added):
+        urls = self._by_labeler.setdefault(labeler_id, set())
+        if url not in urls: urls.add(url); added.append((labeler_id, url))
+
+    def _notify(self, added):
+        for listener in self._listeners:
+            for labeler_id, url in added: listener(labeler_id, url)
+
+    def add_listener(self, listener):
+        """`listener(labeler_id, url)` wird für jedes neu bekannte Paar aufgerufen; bekannte Paare werden nachgereicht."""
+        with self._lock:
+            self._listeners.append(listener)
+            known = [(lbl, url) for lbl, urls in self._by_labeler.items() for url in urls]
+        for labeler_id, url in known: listener(labeler_id, url)
+
+    def add(self, labeler_id, url):
+        """Trägt einen eigenen Speichervorgang sofort ein."""
+        if not labeler_id or not url: return
+        added = []
+        with self._lock: self._add_locked(labeler_id.strip(), url.strip(), added)
+        self._notify(added)
+
+    def row_for(self, labeler_id, url):
+        """Zeilennummer der (letzten) Zeile zu (Labeler, URL) oder None."""
+        with self._lock: return self._row_of.get((labeler_id.strip(), url.strip()))
+
+    def record_rows(self, written):
+        """Trägt selbst geschriebene `(Zeilennummer, Zeile)` ein, ohne auf das nächste Lesen zu warten."""
+        with self._lock:
+            for row_number, row in written:
+                lbl, url = str(row[self.labeler_col]).strip(), str(row[self.url_col]).strip()
+                if lbl and url: self._row_of[(lbl, url)] = row_number
+
+    def urls_for(self, labeler_id, refresh=True):
+        """Kopie der bearbeiteten URLs eines Labelers (vorher inkrementell aktualisiert)."""
+        if refresh: self.refresh()
+        with self._lock: return set(self._by_labeler.get(labeler_id, ()))
@@ -0,0 +1,137 @@
+# Quota-bewusster Wrapper um ein gspread-Worksheet
+#
+# Alle Sheets-Aufrufe eines Prozesses laufen durch einen gemeinsamen Client:
+# - Token-Buckets für Lese- und Schreibzugriffe (Sheets-Quota: Requests pro Minute)
+# - Retry mit exponentiellem Backoff + Jitter bei 429 und 5xx; nicht idempotente Schreibzugriffe
+#   (Anhängen, Einfügen, Löschen) nur, wenn sicher nichts geschrieben wurde
+# - Gleichzeitige, identische Lesezugriffe werden zu einem Request zusammengefasst
+import logging
+import random
+import threading
+import time
+
+import gspread
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ("get_all_values", "row_values", "batch_get", "get")
+WRITE_METHODS = ("update_cells", "batch_update", "update", "resize", "clear") # Idempotent: ein zweiter Versuch ändert nichts
+NON_IDEMPOTENT_WRITE_METHODS = ("append_row", "append_rows", "insert_row", "delete_rows")
+
+
+class TokenBucket:
+    """Klassischer Token-Bucket: `rate_per_minute` Tokens pro Minute, maximal `capacity` auf Vorrat."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Nimmt ein Token, wartet falls nötig. Gibt die Wartezeit in Sekunden zurück."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0: self._tokens -= 1.0; return waited
+                delay = (1.0 - self._tokens) / self.rate
+            time.sleep(delay); waited += delay
+
+
+def _status_code(error):
+    code = getattr(error, "code", None)
+    return getattr(getattr(error, "response", None), "status_code", None) if code in (-1, None) else code
+
+
+def is_retryable(error):
+    """429 (Quota) und 5xx sind vorübergehend, ebenso Netzwerkfehler."""
+    if isinstance(error, gspread.exceptions.APIError):
+        code = _status_code(error)
+        return code == 429 or (isinstance(code, int) and code >= 500)
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def is_retryable_before_send(error):
+    """Für nicht idempotente Schreibzugriffe: nur 429 (abgelehnt, nichts geschrieben) und Verbindungsfehler vor dem Senden.
+
+    Bei Timeouts, abgebrochenen Verbindungen und 5xx kann Google die Zeilen schon geschrieben haben;
+    das entscheidet der Aufrufer (Upsert gleicht über den Schlüssel ab).
+    """
+    if isinstance(error, gspread.exceptions.APIError): return _status_code(error) == 429
+    if isinstance(error, requests.exceptions.ConnectTimeout): return True
+    reason = getattr(error.args[0], "reason", None) if isinstance(error, requests.exceptions.ConnectionError) and error.args else None
+    return isinstance(reason, ConnectTimeoutError) # Verbindung kam gar nicht zustande (auch DNS)
+
+
+class QuotaAwareWorksheet:
+    """Proxy um ein gspread-Worksheet mit Rate-Limit, Retry/Backoff und Request-Coalescing.
+
+    Nicht explizit behandelte Attribute werden unverändert an das Worksheet durchgereicht.
+    """
+
+    def __init__(self, worksheet, reads_per_minute=60, writes_per_minute=60, max_retries=5, base_delay=1.0, max_delay=32.0):
+        self._worksheet = worksheet
+        self._read_bucket = TokenBucket(reads_per_minute)
+        self._write_bucket = TokenBucket(writes_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.counters = {"calls": 0, "throttled": 0, "retried": 0, "failed": 0, "coalesced": 0}
+        self._counter_lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self._counter_lock: self.counters[name] += n
+
+    def stats(self):
+        with self._counter_lock: return dict(self.counters)
+
+    def _call(self, bucket, method, args, kwargs, retryable=is_retryable):
+        attempt = 0
+        while True:
+            if bucket.acquire() > 0: self._count("throttled")
+            self._count("calls")
+            try: return getattr(self._worksheet, method)(*args, **kwargs)
+            except Exception as e:
+                if not retryable(e) or attempt >= self.max_retries: self._count("failed"); raise
+                # "Full Jitter": zufällige Wartezeit zwischen 0 und dem exponentiellen Deckel
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                logger.warning("Sheets %s fehlgeschlagen (%s), Retry %d/%d in %.1fs.", method, e, attempt + 1, self.max_retries, delay)
+                self._count("retried"); attempt += 1
+                time.sleep(delay)
+
+    def _read(self, method, args, kwargs):
+        key = (method, repr(args), repr(sorted(kwargs.items())))
+        with self._in_flight_lock:
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = {"done": threading.Event(), "result": None, "error": None}
+                self._in_flight[key] = pending; leader = True
+            else: leader = False
+        if not leader:
+            self._count("coalesced")
+            pending["done"].wait()
+            if pending["error"] is not None: raise pending["error"]
+            return pending["result"]
+        try:
+            pending["result"] = self._call(self._read_bucket, method, args, kwargs)
+            return pending["result"]
+        except Exception as e:
+            pending["error"] = e; raise
+        finally:
+            with self._in_flight_lock: self._in_flight.pop(key, None)
+            pending["done"].set()
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if name in READ_METHODS: return lambda *args, **kwargs: self._read(name, args, kwargs)
+        if name in WRITE_METHODS: return lambda *args, **kwargs: self._call(self._write_bucket, name, args, kwargs)
+        if name in NON_IDEMPOTENT_WRITE_METHODS: return lambda *args, **kwargs: self._call(self._write_bucket, name, args, kwargs, retryable=is_retryable_before_send)
+        return attr
@@ -0,0 +1,234 @@
+# Prozessweiter Work-Scheduler mit Leases und Ziel-Redundanz pro URL
+#
+# Statt dass jeder Labeler unabhängig die ganze Datei abarbeitet, vergibt der Scheduler Items per
+# Lease (mit Ablaufzeit). Ziel sind k Labels pro URL; bevorzugt werden URLs, die am weitesten unter
+# k liegen. Bei Gleichstand entscheidet die stabile, geseedete Reihenfolge des Labelers.
+# Aktive Leases liegen zusätzlich in einer lokalen SQLite-Datei und überleben so Neustarts.
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from labeler_urls import Bitmap
+
+SCAN_CHUNK = 8192 # Positionen pro vektorisiertem Scan-Schritt
+
+
+class WorkScheduler:
+    """Vergibt Items (Indizes der URL-Tabelle) an Labeler.
+
+    `label_counts[i]` zählt die Labeler, die Item i gespeichert haben, `lease_counts[i]` die aktiven
+    Leases. Ein Item ist für einen Labeler verfügbar, wenn er es noch nicht gelabelt hat, es nicht
+    schon selbst geleast hat und `label_counts + lease_counts < k` gilt.
+    """
+
+    def __init__(self, n_items, lease_store_path, redundancy=3, lease_seconds=1800):
+        self.n_items = n_items
+        self.k = redundancy if redundancy > 0 else np.iinfo(np.int16).max # k <= 0: jeder Labeler bekommt alles
+        self.lease_seconds = lease_seconds
+        self.label_counts = np.zeros(n_items, dtype=np.int32)
+        self.lease_counts = np.zeros(n_items, dtype=np.int32)
+        # Histogramm der effektiven Belegung (Labels + Leases, gekappt bei k) -> untere Schranke in O(k)
+        self._histogram = np.zeros(min(int(self.k), n_items + 1) + 1, dtype=np.int64)
+        self._histogram[0] = n_items
+        self._own_levels = {} # Labeler -> Histogramm seiner eigenen gelabelten/geleasten Items (nur für Labeler, die schon gescannt haben)
+        self.chunks_scanned = 0
+        self._done = {} # Labeler -> Bitmap der gelabelten Items
+        self._leases = {} # Labeler -> {Item: Ablaufzeit}
+        self._expiry_heap = [] # (Ablaufzeit, Labeler, Item), veraltete Einträge werden beim Poppen übersprungen
+        self._cursor = {} # Labeler -> (order, erste Position, vor der nichts mehr verfügbar wird)
+        self._open = {} # Labeler -> [order, Bitmap der Items in order, offene Items]; wird bei jedem Label nachgeführt
+        self._lock = threading.RLock()
+        store_dir = os.path.dirname(lease_store_path)
+        if store_dir: os.makedirs(store_dir, exist_ok=True)
+        self._conn = sqlite3.connect(lease_store_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leases (item INTEGER NOT NULL, labeler TEXT NOT NULL, expires REAL NOT NULL, PRIMARY KEY (item, labeler))")
+        now = time.time()
+        self._conn.execute("DELETE FROM leases WHERE expires <= ? OR item >= ?", (now, n_items))
+        for item, labeler, expires in self._conn.execute("SELECT item, labeler, expires FROM leases").fetchall():
+            self._add_lease(labeler, item, expires, persist=False)
+
+    # --- Interne Buchhaltung (Aufrufer hält den Lock) ---
+    def _done_bitmap(self, labeler):
+        bitmap = self._done.get(labeler)
+        if bitmap is None: bitmap = self._done[labeler] = Bitmap(self.n_items)
+        return bitmap
+
+    def _level(self, item):
+        return min(int(self.label_counts[item] + self.lease_counts[item]), len(self._histogram) - 1)
+
+    def _is_own(self, labeler, item):
+        done = self._done.get(labeler)
+        return (done is not None and item in done) or item in self._leases.get(labeler, {})
+
+    def _bump(self, item, labels=0, leases=0):
+        before = self._level(item)
+        self.label_counts[item] += labels; self.lease_counts[item] += leases
+        after = self._level(item)
+        if before == after: return
+        self._histogram[before] -= 1; self._histogram[after] += 1
+        for labeler, own in self._own_levels.items():
+            if self._is_own(labeler, item): own[before] -= 1; own[after] += 1
+
+    def _own_changed(self, labeler, item, delta):
+        """Item kommt zu den eigenen (gelabelten oder geleasten) Items eines Labelers hinzu bzw. fällt heraus."""
+        own = self._own_levels.get(labeler)
+        if own is not None: own[self._level(item)] += delta
+
+    def _add_lease(self, labeler, item, expires, persist=True):
+        held = self._leases.setdefault(labeler, {})
+        new = item not in held
+        if new and item not in self._done_bitmap(labeler): self._own_changed(labeler, item, 1)
+        held[item] = expires
+        if new: self._bump(item, leases=1)
+        heapq.heappush(self._expiry_heap, (expires, labeler, item))
+        if persist: self._conn.execute("INSERT OR REPLACE INTO leases (item, labeler, expires) VALUES (?, ?, ?)", (item, labeler, expires))
+
+    def _drop_lease(self, labeler, item):
+        held = self._leases.get(labeler)
+        if not held or item not in held: return False
+        del held[item]
+        if item not in self._done_bitmap(labeler): self._own_changed(labeler, item, -1)
+        self._bump(item, leases=-1)
+        self._conn.execute("DELETE FROM leases WHERE item = ? AND labeler = ?", (item, labeler))
+        return True
+
+    def _expire(self, now):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires, labeler, item = heapq.heappop(self._expiry_heap)
+            if self._leases.get(labeler, {}).get(item) == expires: self._drop_lease(labeler, item)
+
+    def _levels(self, items):
+        return np.minimum(self.label_counts[items] + self.lease_counts[items], len(self._histogram) - 1)
+
+    def _lower_bound(self, labeler, exclude_bits, exclude_items):
+        """Kleinste effektive Belegung über die Items, die dieser Labeler noch bekommen kann (Abbruchkriterium beim Scan).
+
+        Vom globalen Histogramm abgezogen werden seine eigenen gelabelten/geleasten Items und die
+        übrigen ausgeschlossenen Items; sonst bliebe die Schranke auf einer Stufe stehen, die nur
+        noch Items enthält, die er nie bekommt, und jeder Scan liefe bis zum Ende von `order`.
+        """
+        done = self._done_bitmap(labeler)
+        own = self._own_levels.get(labeler)
+        if own is None:
+            items = np.union1d(np.flatnonzero(done.to_bool_array()), np.fromiter(self._leases.get(labeler, {}), dtype=np.int64))
+            own = self._own_levels[labeler] = np.bincount(self._levels(items.astype(np.int64)), minlength=len(self._histogram)).astype(np.int64)
+        excluded = exclude_items
+        if exclude_bits is not None: # Gesetzte Bits nur in den wenigen Bytes suchen, die nicht schon eigene Items sind
+            not_done = exclude_bits & ~done.bits
+            free = np.flatnonzero(not_done)
+            bits = np.unpackbits(not_done[free], bitorder="little").reshape(-1, 8).astype(bool)
+            excluded = np.concatenate([excluded, ((free[:, None] << 3) + np.arange(8))[bits]])
+        excluded = excluded[excluded < self.n_items]
+        if len(excluded): # Nur Items zählen, die nicht schon unter `own` fallen
+            excluded = np.unique(excluded)
+            excluded = np.array([i for i in excluded.tolist() if not self._is_own(labeler, i)], dtype=np.int64)
+        available = self._histogram - own - np.bincount(self._levels(excluded), minlength=len(self._histogram))
+        nonzero = np.flatnonzero(available[:-1] > 0)
+        return int(nonzero[0]) if len(nonzero) else int(self.k)
+
+    def _rank(self, labeler, order, limit, exclude=()):
+        """Die `limit` besten Kandidaten aus `order`: (effektive Belegung, Position, Item), aufsteigend.
+
+        `exclude` ist ein `Bitmap` (wird pro Chunk per Bit-Test geprüft) oder eine kleine Menge von Items.
+        """
+        done_bits = self._done_bitmap(labeler).bits
+        exclude_bits = exclude.bits if isinstance(exclude, Bitmap) else None
+        exclude_items = np.array([] if exclude_bits is not None else list(exclude), dtype=np.int64)
+        skip = np.concatenate([np.array(list(self._leases.get(labeler, {})), dtype=np.int64), exclude_items])
+        cached = self._cursor.get(labeler)
+        start = cached[1] if cached is not None and cached[0] is order else 0
+        lower_bound = self._lower_bound(labeler, exclude_bits, exclude_items)
+        best = []
+        for pos in range(start, len(order), SCAN_CHUNK):
+            chunk = np.asarray(order[pos:pos + SCAN_CHUNK], dtype=np.int64)
+            self.chunks_scanned += 1
+            counts = self.label_counts[chunk]
+            # Dauerhaft nicht mehr verfügbar: selbst gelabelt oder k Labels erreicht
+            permanent = ((done_bits[chunk >> 3] >> (chunk & 7)) & 1).astype(bool) | (counts >= self.k)
+            if pos == start:
+                leading = int(np.argmin(permanent)) if not permanent.all() else len(chunk)
+                start = pos + leading; self._cursor[labeler] = (order, start)
+            effective = counts + self.lease_counts[chunk]
+            blocked = permanent | (effective >= self.k)
+            if exclude_bits is not None: blocked |= ((exclude_bits[chunk >> 3] >> (chunk & 7)) & 1).astype(bool)
+            if len(skip): blocked |= np.isin(chunk, skip)
+            candidates = np.flatnonzero(~blocked)
+            if len(candidates):
+                if len(candidates) > limit: candidates = candidates[np.lexsort((candidates, effective[candidates]))[:limit]]
+                best = sorted(best + [(int(effective[c]), pos + int(c), int(chunk[c])) for c in candidates])[:limit]
+            if len(best) >= limit and best[-1][0] <= lower_bound: break
+        return best
+
+    # --- Öffentliche API ---
+    def record_label(self, labeler, item):
+        """Ein Label von `labeler` für `item` ist gespeichert (idempotent)."""
+        with self._lock:
+            done = self._done_bitmap(labeler)
+            if item in done: return False
+            if item not in self._leases.get(labeler, {}): self._own_changed(labeler, item, 1)
+            labels = int(self.label_counts[item])
+            for other, entry in self._open.items():
+                # Für den Labeler selbst fällt das Item weg, wenn es unter k lag; für andere nur, wenn es jetzt k erreicht
+                if item not in entry[1]: continue
+                if (labels < self.k) if other == labeler else (labels + 1 == self.k and item not in self._done_bitmap(other)): entry[2] -= 1
+            done.add(item); self._bump(item, labels=1)
+            self._drop_lease(labeler, item)
+            return True
+
+    def lease(self, labeler, order, exclude=()):
+        """Vergibt das nächste Item aus `order` an `labeler` (oder None, wenn nichts mehr offen ist)."""
+        with self._lock:
+            now = time.time(); self._expire(now)
+            best = self._rank(labeler, order, 1, exclude)
+            if not best: return None
+            item = best[0][2]
+            self._add_lease(labeler, item, now + self.lease_seconds)
+            return item
+
+    def peek(self, labeler, order, count, exclude=()):
+        """Die Items, die `lease()` als Nächstes vergeben würde (ohne Lease, z.B. für den Prefetch)."""
+        with self._lock:
+            self._expire(time.time())
+            return [item for _, _, item in self._rank(labeler, order, count, exclude)]
+
+    def touch(self, labeler, item):
+        """Verlängert die Lease auf das Item, an dem der Labeler gerade arbeitet."""
+        with self._lock:
+            if item in self._done_bitmap(labeler): return
+            expires = time.time() + self.lease_seconds
+            if self._leases.get(labeler, {}).get(item, 0) < expires - self.lease_seconds / 10: self._add_lease(labeler, item, expires)
+
+    def release(self, labeler, item):
+        """Gibt ein Item zurück (z.B. beim Überspringen), damit andere es bekommen können."""
+        with self._lock: return self._drop_lease(labeler, item)
+
+    def open_count(self, labeler, order):
+        """Wie viele Items aus `order` dieser Labeler noch bekommen könnte (ohne Leases anderer).
+
+        Gezählt wird einmal pro `order`, danach führt `record_label` den Wert mit (O(1) pro Aufruf).
+        """
+        with self._lock:
+            entry = self._open.get(labeler)
+            if entry is None or entry[0] is not order:
+                chunk = np.asarray(order, dtype=np.int64)
+                done_bits = self._done_bitmap(labeler).bits
+                permanent = ((done_bits[chunk >> 3] >> (chunk & 7)) & 1).astype(bool) | (self.label_counts[chunk] >= self.k)
+                members = Bitmap(self.n_items)
+                np.bitwise_or.at(members.bits, chunk >> 3, (1 << (chunk & 7)).astype(np.uint8))
+                entry = self._open[labeler] = [order, members, int(len(chunk) - permanent.sum())]
+            return entry[2]
+
+    def done_count(self, labeler):
+        with self._lock: return len(self._done_bitmap(labeler))
+
+    def stats(self):
+        with self._lock:
+            return {"items": self.n_items, "k": int(self.k), "active_leases": int(self.lease_counts.sum()),
+                    "items_at_k": int((self.label_counts >= self.k).sum()), "labels": int(self.label_counts.sum()),
+                    "chunks_scanned": self.chunks_scanned}
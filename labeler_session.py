@@ -0,0 +1,103 @@
+# Lokale Session-Snapshots: Wiederaufnahme nach Reload oder Verbindungsabbruch
+#
+# `st.session_state` lebt nur so lange wie die Browser-Verbindung. Pro Labeler liegt deshalb ein
+# Snapshot in einer lokalen SQLite-Datei: Reihenfolge (int32-Permutation, einmal pro Session
+# geschrieben), vergebene Items, Position und die Einträge der Session (Auswahl + Kommentar, auch
+# ungespeicherte Änderungen nach "Zurück"). Bei jeder Navigation werden nur Position und geänderte
+# Einträge geschrieben. Die Wiederherstellung liest nur diese Datei – kein Sheets-Zugriff.
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class SessionStore:
+    """Snapshots der Labeling-Sessions, ein Snapshot pro Labeler ID."""
+
+    def __init__(self, path):
+        self.path = path
+        self.writes = self.restores = 0
+        self._lock = threading.Lock()
+        store_dir = os.path.dirname(path)
+        if store_dir: os.makedirs(store_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (labeler TEXT PRIMARY KEY, table_dir TEXT NOT NULL, session_order BLOB NOT NULL, "
+                           "session_items BLOB NOT NULL, current_index INTEGER NOT NULL, meta TEXT NOT NULL, updated REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (labeler TEXT NOT NULL, local_index INTEGER NOT NULL, categories TEXT NOT NULL, "
+                           "comment TEXT NOT NULL, PRIMARY KEY (labeler, local_index))")
+
+    def start(self, labeler, table_dir, session_order, meta):
+        """Beginnt einen neuen Snapshot (ersetzt den alten samt Einträgen). `meta` ist ein JSON-fähiges dict."""
+        order_blob = np.asarray(session_order, dtype=np.int32).tobytes()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM entries WHERE labeler = ?", (labeler,))
+                self._conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, 0, ?, ?)",
+                                   (labeler, table_dir, order_blob, b"", json.dumps(meta, ensure_ascii=False), time.time()))
+                self._conn.execute("COMMIT")
+            except Exception: self._conn.execute("ROLLBACK"); raise
+            self.writes += 1
+
+    def update(self, labeler, current_index, session_items, changed_entries, meta=None):
+        """Schreibt Position, vergebene Items und die geänderten Einträge `{local_index: (category_keys, comment)}`.
+
+        `meta` (falls angegeben) wird mit dem gespeicherten dict zusammengeführt. Gibt False zurück,
+        wenn es für den Labeler keinen Snapshot gibt.
+        """
+        items_blob = np.asarray(session_items, dtype=np.int32).tobytes()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT meta FROM sessions WHERE labeler = ?", (labeler,)).fetchone()
+                if row is None: self._conn.execute("ROLLBACK"); return False
+                merged_meta = {**json.loads(row[0]), **(meta or {})}
+                self._conn.execute("UPDATE sessions SET session_items = ?, current_index = ?, meta = ?, updated = ? WHERE labeler = ?",
+                                   (items_blob, int(current_index), json.dumps(merged_meta, ensure_ascii=False), time.time(), labeler))
+                self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                                       [(labeler, int(i), "; ".join(keys), comment) for i, (keys, comment) in changed_entries.items()])
+                self._conn.execute("COMMIT")
+            except Exception: self._conn.execute("ROLLBACK"); raise
+            self.writes += 1
+        return True
+
+    def summary(self, labeler):
+        """`{"current_index", "items", "updated"}` ohne die Blobs zu lesen; None, wenn kein Snapshot existiert."""
+        with self._lock:
+            row = self._conn.execute("SELECT current_index, length(session_items) / 4, updated FROM sessions WHERE labeler = ?", (labeler,)).fetchone()
+        return {"current_index": row[0], "items": row[1], "updated": row[2]} if row else None
+
+    def load(self, labeler):
+        """Der komplette Snapshot des Labelers oder None.
+
+        Schlüssel: table_dir, session_order (int32-Array), session_items, current_index, results
+        (`{local_index: [keys]}`), comments (`{local_index: str}`) und meta.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT table_dir, session_order, session_items, current_index, meta FROM sessions WHERE labeler = ?", (labeler,)).fetchone()
+            if row is None: return None
+            entries = self._conn.execute("SELECT local_index, categories, comment FROM entries WHERE labeler = ?", (labeler,)).fetchall()
+            self.restores += 1
+        table_dir, order_blob, items_blob, current_index, meta = row
+        return {"table_dir": table_dir, "session_order": np.frombuffer(order_blob, dtype=np.int32).copy(),
+                "session_items": np.frombuffer(items_blob, dtype=np.int32).tolist(), "current_index": current_index,
+                "results": {i: [k for k in categories.split("; ") if k] for i, categories, _ in entries},
+                "comments": {i: comment for i, _, comment in entries}, "meta": json.loads(meta)}
+
+    def delete(self, labeler):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM entries WHERE labeler = ?", (labeler,))
+                self._conn.execute("DELETE FROM sessions WHERE labeler = ?", (labeler,))
+                self._conn.execute("COMMIT")
+            except Exception: self._conn.execute("ROLLBACK"); raise
+
+    def stats(self):
+        with self._lock: sessions = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {"sessions": sessions, "writes": self.writes, "restores": self.restores}
@@ -0,0 +1,43 @@
+# Kaltstart-Bericht: wohin die Zeit beim ersten Seitenaufruf eines Prozesses geht
+#
+# Jede Phase wird höchstens einmal pro Prozess erfasst (der erste Skriptlauf bzw. der erste
+# Verbindungsaufbau). Phasen aus Hintergrund-Threads laufen parallel zum Rendern der ID-/Intro-Seite
+# und sind entsprechend markiert.
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Sammelt `(Phase, Dauer in s, Thread)` in der Reihenfolge, in der die Phasen enden."""
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.phases = []
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, background=False):
+        """Trägt eine Phase ein; weitere Aufrufe mit demselben Namen werden ignoriert."""
+        with self._lock:
+            if name in self._names: return False
+            self._names.add(name); self.phases.append((name, seconds, background))
+        logger.info("Start-Phase '%s': %.0f ms%s", name, seconds * 1000, " (Hintergrund)" if background else "")
+        return True
+
+    def has(self, name):
+        with self._lock: return name in self._names
+
+    @contextmanager
+    def phase(self, name, background=False):
+        start = time.perf_counter()
+        try: yield
+        finally: self.record(name, time.perf_counter() - start, background)
+
+    def lines(self):
+        """Lesbare Zeilen für die Anzeige, z.B. 'Speicher: Header prüfen – 120 ms (Hintergrund)'."""
+        with self._lock: phases = list(self.phases)
+        return [f"{name} – {seconds * 1000:.0f} ms{' (Hintergrund)' if background else ''}" for name, seconds, background in phases]
@@ -0,0 +1,573 @@
+# Austauschbare Speicher-Backends für die Labeling-Ergebnisse
+#
+# - GoogleSheetsBackend: das bisherige Google Sheet (gspread-Worksheet)
+# - SQLiteBackend:       lokale SQLite-Datei mit hohem Durchsatz
+# - FakeWorksheet:       In-Process-Nachbau eines gspread-Worksheets mit künstlicher Latenz
+#                        und Quota-Fehlern (429), läuft über den GoogleSheetsBackend-Codepfad
+#
+# Welches Backend verwendet wird, steht in st.secrets unter [storage] backend = "gsheets" | "sqlite" | "fake_gsheets".
+#
+# Im Modus [storage] write_mode = "upsert" (Standard) überschreibt eine Korrektur über "Zurück" die
+# vorhandene Zeile desselben (Labeler, URL) statt eine weitere anzuhängen. Alt-Bestände mit
+# überholten Zeilen räumt `python labeler_compact.py` offline auf.
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import tomllib
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# gspread, google-auth und requests werden erst auf den Pfaden importiert, die sie brauchen
+# (Sheets-Verbindung, Fake-Worksheet). Das SQLite-Backend startet ohne sie.
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets','https://www.googleapis.com/auth/drive']
+BACKEND_NAMES = ("gsheets", "sqlite", "fake_gsheets")
+WRITE_MODES = ("upsert", "append")
+
+# === Ergebnis-Spalten ===
+COL_TS = "Timestamp"
+COL_LBL = "Labeler_ID"
+COL_URL = "URL"
+COL_CATS = "Kategorien"
+COL_COMMENT = "Kommentar"
+HEADER = [COL_TS, COL_LBL, COL_URL, COL_CATS, COL_COMMENT]
+TIMEZONE = pytz.timezone("Europe/Berlin")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S %Z%z" # Spalte Timestamp, z.B. '2025-01-01 12:00:00 CET+0100'
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml") # Für Kommandozeilen-Werkzeuge außerhalb von Streamlit
+
+
+def _column_letter(col_index):
+    """0-basierter Spaltenindex -> Spaltenbuchstabe ('A', 'B', ..., 'AA')."""
+    letters = ""
+    col_index += 1
+    while col_index: col_index, rem = divmod(col_index - 1, 26); letters = chr(65 + rem) + letters
+    return letters
+
+
+def is_sheets_api_error(error):
+    """True für einen gspread APIError; ohne gspread zu importieren (nie geladen -> kann keiner sein)."""
+    gspread = sys.modules.get("gspread")
+    return gspread is not None and isinstance(error, gspread.exceptions.APIError)
+
+
+def is_grid_limit_error(error):
+    """True für den 400er der Sheets-API bei Bereichen, die hinter dem Raster beginnen ("exceeds grid limits")."""
+    return is_sheets_api_error(error) and "exceeds grid limits" in str(error)
+
+
+def is_sheet_not_found(error):
+    gspread = sys.modules.get("gspread")
+    return gspread is not None and isinstance(error, gspread.exceptions.SpreadsheetNotFound)
+
+
+def _first_row_of_range(a1_range):
+    """Erste Zeilennummer eines A1-Bereichs wie 'Sheet1!A5:E7' (None, wenn nicht erkennbar)."""
+    match = re.search(r"(?:^|!)\$?[A-Z]+\$?(\d+)", a1_range or "")
+    return int(match.group(1)) if match else None
+
+
+def row_key(row, labeler_col, url_col):
+    """(Labeler, URL) einer Ergebniszeile, getrimmt; leere Felder als ''."""
+    def cell(col): return str(row[col]).strip() if len(row) > col and row[col] is not None else ""
+    return cell(labeler_col), cell(url_col)
+
+
+def normalized_key(key, labeler_url):
+    """`key(labeler, url)` bzw. das Paar selbst ohne Schlüsselfunktion."""
+    return key(*labeler_url) if key else labeler_url
+
+
+def latest_rows(rows, labeler_col, url_col):
+    """Behält pro (Labeler, URL) nur die letzte Zeile, in der Reihenfolge dieser letzten Zeilen.
+
+    Komplett leere Zeilen fallen weg; Zeilen ohne Labeler oder URL bleiben unverändert erhalten.
+    """
+    keys = [row_key(row, labeler_col, url_col) for row in rows]
+    last_position = {key: position for position, key in enumerate(keys) if all(key)}
+    return [row for position, (row, key) in enumerate(zip(rows, keys))
+            if any(str(v).strip() for v in row) and (not all(key) or last_position[key] == position)]
+
+
+def load_secrets_file(path=SECRETS_PATH):
+    """Liest die secrets.toml der App (für Kommandozeilen-Werkzeuge, die ohne Streamlit laufen)."""
+    with open(path, "rb") as f: return tomllib.load(f)
+
+
+class StorageBackend:
+    """Gemeinsame Schnittstelle aller Backends.
+
+    Zeilen sind Listen in der Reihenfolge von `header`. Zeilennummern sind 1-basiert wie im
+    Sheet (Zeile 1 = Header), damit der Fortschritts-Index backend-unabhängig bleibt.
+    """
+
+    name = "?"
+
+    def __init__(self, header):
+        self.header = list(header)
+        self.moved_rows = 0 # Upsert-Zeilen, die angehängt statt überschrieben wurden (Zielzeile verschoben)
+
+    def ensure_header(self):
+        """Prüft/korrigiert den Header. Gibt True zurück, wenn er geschrieben werden musste."""
+        raise NotImplementedError
+
+    def append_row(self, row):
+        return self.append_rows([row])
+
+    def append_rows(self, rows):
+        """Hängt Zeilen an. Gibt die Zeilennummer der ersten neuen Zeile zurück (None, wenn unbekannt)."""
+        raise NotImplementedError
+
+    def update_rows(self, updates):
+        """Überschreibt Zeilen an Ort und Stelle; `updates` ist eine Liste von (Zeilennummer, Zeile)."""
+        raise NotImplementedError
+
+    def upsert_rows(self, rows, labeler_col, url_col, row_for, key=None):
+        """Schreibt Zeilen als Upsert über (Labeler, URL).
+
+        `row_for(labeler, url)` liefert die vorhandene Zeilennummer oder None. `key(labeler, url)`
+        normalisiert den Schlüssel (Standard: die getrimmten Strings), z.B. auf die Status-ID, damit
+        Varianten desselben Tweets als derselbe Eintrag gelten. Mehrere Zeilen mit demselben Schlüssel
+        im Batch werden zur letzten zusammengefasst. Steht in einer Zielzeile inzwischen ein anderer
+        Schlüssel (von Hand sortiert oder gelöscht), wird die Zeile angehängt statt überschrieben.
+        Gibt die geschriebenen `(Zeilennummer, Zeile)` zurück (angehängte Zeilen nur, wenn das
+        Backend die Nummer kennt).
+        """
+        normalized = lambda row: normalized_key(key, row_key(row, labeler_col, url_col))
+        latest = {}
+        for row in rows:
+            row_id = normalized(row)
+            latest.pop(row_id, None); latest[row_id] = list(row)
+        updates, appends = [], []
+        for row in latest.values():
+            labeler_id, url = row_key(row, labeler_col, url_col)
+            row_number = row_for(labeler_id, url) if labeler_id and url else None
+            if row_number: updates.append((row_number, row))
+            else: appends.append(row)
+        current = self.current_keys([n for n, _ in updates], labeler_col, url_col) if updates else None
+        if current is not None:
+            moved = {n for n, row in updates if n not in current or normalized_key(key, current[n]) != normalized(row)}
+            if moved:
+                self.moved_rows += len(moved)
+                logger.warning("%d Zeile(n) stehen nicht mehr an der erwarteten Stelle, werden angehängt statt überschrieben.", len(moved))
+                appends = [row for n, row in updates if n in moved] + appends
+                updates = [(n, row) for n, row in updates if n not in moved]
+        if updates: self.update_rows(updates)
+        first_row = self.append_rows(appends) if appends else None
+        return updates + ([(first_row + i, row) for i, row in enumerate(appends)] if first_row else [])
+
+    def current_keys(self, row_numbers, labeler_col, url_col):
+        """`{Zeilennummer: (Labeler, URL)}`, wie die Zeilen gerade im Backend stehen (vor einem Überschreiben).
+
+        None heißt: keine Prüfung nötig, weil außer der App niemand die Zeilen umstellt.
+        """
+        return None
+
+    def read_progress(self, start_row, labeler_col, url_col):
+        """Liest (Zeilennummer, Labeler, URL) aller Zeilen ab `start_row`. Gibt `(zeilen, next_row)` zurück."""
+        raise NotImplementedError
+
+    def read_rows(self, start_row, limit=5000):
+        """Liest (Zeilennummer, Zeile) von höchstens `limit` Zeilen ab `start_row`. Gibt `(zeilen, next_row)` zurück."""
+        raise NotImplementedError
+
+    def read_all_rows(self):
+        """Alle Ergebniszeilen ohne Header (Listen in Header-Reihenfolge), z.B. für Backups und Exporte."""
+        raise NotImplementedError
+
+    def iter_rows(self, chunk_size=5000):
+        """Alle Ergebniszeilen ohne Header in Listen zu höchstens `chunk_size` Zeilen (für Exporte großer Tabellen)."""
+        rows = self.read_all_rows()
+        for start in range(0, len(rows), chunk_size): yield rows[start:start + chunk_size]
+
+    def compact(self, labeler_col, url_col, dry_run=False):
+        """Behält nur die letzte Zeile pro (Labeler, URL). Gibt {"before", "after", "reclaimed"} zurück.
+
+        Nur bei gestoppter App ausführen: Zeilennummern im Fortschritts-Index laufender Prozesse
+        werden dabei ungültig.
+        """
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+    def stats(self):
+        """API-Zähler (Aufrufe, gedrosselt, Retries, ...); leer, wenn das Backend keine hat."""
+        return {}
+
+
+class GoogleSheetsBackend(StorageBackend):
+    """Backend auf einem gspread-Worksheet (echt oder `FakeWorksheet`)."""
+
+    name = "gsheets"
+
+    def __init__(self, worksheet, header, sheet_name):
+        super().__init__(header)
+        self.worksheet = worksheet
+        self.sheet_name = sheet_name
+
+    def ensure_header(self):
+        # Nur Zeile 1 lesen (ein kleiner Request statt des ganzen Sheets)
+        worksheet = self.worksheet
+        first_row = worksheet.row_values(1)
+        if first_row == self.header: return False
+        from gspread import Cell
+        if first_row and any(c != '' for c in first_row) and len(first_row) != len(self.header):
+            worksheet.insert_row(self.header, 1, value_input_option='USER_ENTERED') # Zeile 1 sind Daten: Header davor
+        else:
+            # Leere Zeile 1 oder gleich breiter, veralteter Header: an Ort und Stelle überschreiben (keine Leerzeile nötig)
+            cell_list = [Cell(1, i + 1, value) for i, value in enumerate(self.header)]
+            worksheet.update_cells(cell_list, value_input_option='USER_ENTERED')
+        return True
+
+    def append_rows(self, rows):
+        response = self.worksheet.append_rows([list(r) for r in rows], value_input_option='USER_ENTERED')
+        updated_range = response.get("updates", {}).get("updatedRange") if isinstance(response, dict) else None
+        return _first_row_of_range(updated_range)
+
+    def update_rows(self, updates):
+        last_col = _column_letter(len(self.header) - 1)
+        self.worksheet.batch_update([{"range": f"A{n}:{last_col}{n}", "values": [list(r)]} for n, r in updates], value_input_option='USER_ENTERED')
+
+    def current_keys(self, row_numbers, labeler_col, url_col):
+        # Das Sheet ist von Hand editierbar: die Schlüsselspalten der Zielzeilen in einem Request nachlesen
+        first_col, last_col = min(labeler_col, url_col), max(labeler_col, url_col)
+        first, last = _column_letter(first_col), _column_letter(last_col)
+        try: blocks = self.worksheet.batch_get([f"{first}{n}:{last}{n}" for n in row_numbers])
+        except Exception as e:
+            if not is_grid_limit_error(e): raise
+            return {} # Das Sheet ist geschrumpft: keine Zielzeile gilt als bestätigt
+        return {n: row_key(block[0] if block else [], labeler_col - first_col, url_col - first_col) for n, block in zip(row_numbers, blocks)}
+
+    def read_progress(self, start_row, labeler_col, url_col):
+        lbl, url = _column_letter(labeler_col), _column_letter(url_col)
+        # Ohne Zeilen hinter den Daten (nach labeler_compact.py oder exakt gewachsenem Raster) liegt start_row außerhalb
+        try: labeler_values, url_values = self.worksheet.batch_get([f"{lbl}{start_row}:{lbl}", f"{url}{start_row}:{url}"])
+        except Exception as e:
+            if not is_grid_limit_error(e): raise
+            return [], start_row
+        n_rows = max(len(labeler_values), len(url_values))
+        rows = []
+        for offset in range(n_rows):
+            lbl_cell = labeler_values[offset] if offset < len(labeler_values) else []
+            url_cell = url_values[offset] if offset < len(url_values) else []
+            rows.append((start_row + offset, lbl_cell[0] if lbl_cell else "", url_cell[0] if url_cell else ""))
+        return rows, start_row + n_rows
+
+    def read_rows(self, start_row, limit=5000):
+        try: block = self.worksheet.get(f"A{start_row}:{_column_letter(len(self.header) - 1)}{start_row + limit - 1}")
+        except Exception as e:
+            if not is_grid_limit_error(e): raise
+            return [], start_row
+        return [(start_row + offset, list(row)) for offset, row in enumerate(block)], start_row + len(block)
+
+    def read_all_rows(self):
+        return self.worksheet.get_all_values()[1:]
+
+    def iter_rows(self, chunk_size=5000):
+        # Blockweise per Bereichsabfrage; ein komplett leerer Block gilt als Ende des Sheets
+        last_col, start = _column_letter(len(self.header) - 1), 2
+        while True:
+            try: block = self.worksheet.get(f"A{start}:{last_col}{start + chunk_size - 1}")
+            except Exception as e:
+                if not is_grid_limit_error(e): raise
+                return
+            if not block: return
+            yield [list(row) for row in block]
+            start += chunk_size
+
+    def compact(self, labeler_col, url_col, dry_run=False):
+        values = self.worksheet.get_all_values()
+        body = values[1:]
+        kept = latest_rows(body, labeler_col, url_col)
+        result = {"before": len(body), "after": len(kept), "reclaimed": len(body) - len(kept)}
+        if dry_run or not result["reclaimed"]: return result
+        width = len(self.header)
+        rows = [self.header] + [(list(r) + [""] * width)[:width] for r in kept]
+        # Ein einziger (atomarer) Struktur-Request: Raster auf die behaltenen Zeilen kürzen und die Werte RAW
+        # schreiben (als Text, so wie gelesen; USER_ENTERED würde z.B. Zeitstempel oder "=..." neu interpretieren).
+        # Scheitert er, bleibt das Sheet unverändert.
+        sheet_id = self.worksheet.id
+        cell = lambda value: {"userEnteredValue": {"stringValue": str(value)}} if value != "" else {}
+        self.worksheet.spreadsheet.batch_update({"requests": [
+            {"updateSheetProperties": {"properties": {"sheetId": sheet_id, "gridProperties": {"rowCount": len(rows)}}, "fields": "gridProperties.rowCount"}},
+            {"updateCells": {"range": {"sheetId": sheet_id, "startRowIndex": 0, "endRowIndex": len(rows), "startColumnIndex": 0, "endColumnIndex": width},
+                             "rows": [{"values": [cell(v) for v in row]} for row in rows], "fields": "userEnteredValue"}}]})
+        return result
+
+    def describe(self):
+        return self.sheet_name
+
+    def stats(self):
+        return {**(self.worksheet.stats() if hasattr(self.worksheet, "stats") else {}), "moved_rows": self.moved_rows}
+
+
+class SQLiteBackend(StorageBackend):
+    """Lokale Ergebnis-Tabelle mit einer Spalte pro Header-Feld; Zeile n im "Sheet" entspricht id = n - 1."""
+
+    name = "sqlite"
+
+    def __init__(self, path, header):
+        super().__init__(header)
+        self.path = path
+        db_dir = os.path.dirname(path)
+        if db_dir: os.makedirs(db_dir, exist_ok=True)
+        self._columns = ", ".join(f'"{col}"' for col in self.header)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY AUTOINCREMENT, {', '.join(f'{c} TEXT' for c in self._columns.split(', '))})")
+
+    def ensure_header(self):
+        return False # Schema statt Header-Zeile
+
+    def _padded(self, rows):
+        width = len(self.header)
+        return [tuple((list(r) + [""] * width)[:width]) for r in rows]
+
+    def append_rows(self, rows):
+        values = self._padded(rows)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE") # Schreibsperre: die neuen ids sind lückenlos ab seq + 1
+            try:
+                seq = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'results'").fetchone()
+                self._conn.executemany(f"INSERT INTO results ({self._columns}) VALUES ({', '.join('?' * len(self.header))})", values)
+                self._conn.execute("COMMIT")
+            except Exception: self._conn.execute("ROLLBACK"); raise
+        return (seq[0] if seq else 0) + 2 # id + 1 = Zeilennummer
+
+    def update_rows(self, updates):
+        assignments = ", ".join(f"{col} = ?" for col in self._columns.split(", "))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                values = self._padded(row for _, row in updates)
+                self._conn.executemany(f"UPDATE results SET {assignments} WHERE id = ?", [v + (n - 1,) for (n, _), v in zip(updates, values)])
+                self._conn.execute("COMMIT")
+            except Exception: self._conn.execute("ROLLBACK"); raise
+
+    def read_progress(self, start_row, labeler_col, url_col):
+        with self._lock:
+            rows = self._conn.execute(f'SELECT id, "{self.header[labeler_col]}", "{self.header[url_col]}" FROM results WHERE id >= ? ORDER BY id', (start_row - 1,)).fetchall()
+        return [(row_id + 1, lbl or "", url or "") for row_id, lbl, url in rows], (rows[-1][0] + 2 if rows else start_row)
+
+    def read_rows(self, start_row, limit=5000):
+        with self._lock: rows = self._conn.execute(f"SELECT id, {self._columns} FROM results WHERE id >= ? ORDER BY id LIMIT ?", (start_row - 1, limit)).fetchall()
+        return [(r[0] + 1, list(r[1:])) for r in rows], (rows[-1][0] + 2 if rows else start_row)
+
+    def read_all_rows(self):
+        with self._lock: return [list(r) for r in self._conn.execute(f"SELECT {self._columns} FROM results ORDER BY id")]
+
+    def iter_rows(self, chunk_size=5000):
+        last_id = -1
+        while True:
+            with self._lock: rows = self._conn.execute(f"SELECT id, {self._columns} FROM results WHERE id > ? ORDER BY id LIMIT ?", (last_id, chunk_size)).fetchall()
+            if not rows: return
+            last_id = rows[-1][0]
+            yield [list(r[1:]) for r in rows]
+
+    def compact(self, labeler_col, url_col, dry_run=False):
+        lbl, url = f'TRIM(COALESCE("{self.header[labeler_col]}", \'\'))', f'TRIM(COALESCE("{self.header[url_col]}", \'\'))'
+        superseded = f"{lbl} != '' AND {url} != '' AND id NOT IN (SELECT MAX(id) FROM results GROUP BY {lbl}, {url})"
+        with self._lock:
+            before = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            reclaimed = self._conn.execute(f"SELECT COUNT(*) FROM results WHERE {superseded}").fetchone()[0]
+            if not dry_run and reclaimed:
+                self._conn.execute(f"DELETE FROM results WHERE {superseded}")
+                self._conn.execute("VACUUM")
+        return {"before": before, "after": before - reclaimed, "reclaimed": reclaimed}
+
+    def describe(self):
+        return f"SQLite: {self.path}"
+
+
+class FakeWorksheet:
+    """Nachbau der benutzten gspread-Worksheet-Methoden im Speicher (für Last- und Offline-Tests).
+
+    `latency` (Sekunden) wird vor jedem Aufruf geschlafen, `quota_error_rate` ist die
+    Wahrscheinlichkeit, mit der ein Aufruf einen gspread APIError 429 wirft.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+    id = 0 # sheetId für Struktur-Requests
+
+    def __init__(self, rows=None, latency=0.0, quota_error_rate=0.0, seed=None):
+        self.rows = [list(r) for r in rows or []]
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, name):
+        """Benanntes, prozessweit geteiltes Fake-Worksheet (z.B. von einem Benchmark vorbefüllt)."""
+        with cls._shared_lock:
+            if name not in cls._shared: cls._shared[name] = cls()
+            return cls._shared[name]
+
+    def _api_call(self):
+        self.calls += 1
+        if self.latency: time.sleep(self.latency)
+        if self.quota_error_rate and self._rng.random() < self.quota_error_rate: raise self._api_error(429, "RESOURCE_EXHAUSTED", "Quota exceeded (FakeWorksheet)")
+
+    @staticmethod
+    def _api_error(code, status, message):
+        import gspread, requests
+        response = requests.Response(); response.status_code = code
+        response._content = json.dumps({"error": {"code": code, "message": message, "status": status}}).encode()
+        return gspread.exceptions.APIError(response)
+
+    @property
+    def spreadsheet(self):
+        return FakeSpreadsheet(self)
+
+    def get_all_values(self):
+        self._api_call()
+        with self._lock: return [list(r) for r in self.rows]
+
+    def row_values(self, row):
+        self._api_call()
+        with self._lock: return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def insert_row(self, values, index=1, value_input_option=None):
+        self._api_call()
+        with self._lock: self.rows.insert(index - 1, list(values))
+
+    def update_cells(self, cell_list, value_input_option=None):
+        self._api_call()
+        with self._lock:
+            for cell in cell_list:
+                while len(self.rows) < cell.row: self.rows.append([])
+                row = self.rows[cell.row - 1]
+                while len(row) < cell.col: row.append('')
+                row[cell.col - 1] = cell.value
+
+    def delete_rows(self, start_index, end_index=None):
+        self._api_call()
+        with self._lock: del self.rows[start_index - 1:(end_index or start_index)]
+
+    def append_row(self, values, value_input_option=None):
+        return self.append_rows([values], value_input_option)
+
+    def append_rows(self, values, value_input_option=None):
+        self._api_call()
+        with self._lock:
+            start = len(self.rows) + 1
+            self.rows.extend(list(v) for v in values)
+        return {"updates": {"updatedRange": f"Sheet1!A{start}:{_column_letter(len(values[0]) - 1) if values else 'A'}{start + len(values) - 1}"}}
+
+    def batch_update(self, data, value_input_option=None):
+        self._api_call()
+        with self._lock:
+            for entry in data: self._write_block(entry["range"], entry["values"])
+
+    def update(self, values, range_name="A1", value_input_option=None):
+        self._api_call()
+        with self._lock: self._write_block(range_name, values)
+
+    def resize(self, rows=None, cols=None):
+        self._api_call()
+        with self._lock:
+            if rows is not None: del self.rows[rows:]
+
+    def _write_block(self, a1_range, values):
+        from gspread.utils import a1_to_rowcol
+        start_row, start_col = a1_to_rowcol(a1_range.split("!")[-1].split(":")[0])
+        for offset, values_row in enumerate(values):
+            while len(self.rows) < start_row + offset: self.rows.append([])
+            row = self.rows[start_row + offset - 1]
+            while len(row) < start_col - 1 + len(values_row): row.append('')
+            row[start_col - 1:start_col - 1 + len(values_row)] = list(values_row)
+
+    def _block(self, a1_range):
+        from gspread.utils import a1_range_to_grid_range
+        grid = a1_range_to_grid_range(a1_range.split("!")[-1]) # Offene Bereiche ('B5:B') haben kein endRowIndex
+        if grid["startRowIndex"] >= len(self.rows): # Das Raster endet hier nach der letzten Zeile (wie nach resize)
+            raise self._api_error(400, "INVALID_ARGUMENT", f"Range ('Sheet1'!{a1_range}) exceeds grid limits. Max rows: {len(self.rows)}, max columns: 26")
+        block = [list(r[grid["startColumnIndex"]:grid.get("endColumnIndex")]) for r in self.rows[grid["startRowIndex"]:grid.get("endRowIndex")]]
+        while block and not any(v != '' for v in block[-1]): block.pop() # Wie die API: leere Zeilen am Ende fehlen
+        return block
+
+    def get(self, range_name, **kwargs):
+        self._api_call()
+        with self._lock: return self._block(range_name)
+
+    def batch_get(self, ranges, **kwargs):
+        self._api_call()
+        with self._lock: blocks = [self._block(a1) for a1 in ranges]
+        # Wie die API: leere Zellen am Zeilenende fehlen
+        return [[row[:max((i + 1 for i, v in enumerate(row) if v != ''), default=0)] for row in block] for block in blocks]
+
+
+class FakeSpreadsheet:
+    """`Spreadsheet.batch_update` (Struktur-Requests) über einem `FakeWorksheet`; wie bei der API gelten alle Requests atomar.
+
+    Unterstützt nur, was `compact` braucht: `updateSheetProperties` (rowCount) und `updateCells` (userEnteredValue).
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def batch_update(self, body):
+        worksheet = self.worksheet
+        worksheet._api_call()
+        with worksheet._lock:
+            rows = [list(r) for r in worksheet.rows]
+            for request in body["requests"]:
+                if "updateSheetProperties" in request:
+                    row_count = request["updateSheetProperties"]["properties"]["gridProperties"]["rowCount"]
+                    rows = rows[:row_count] + [[] for _ in range(row_count - len(rows))]
+                elif "updateCells" in request:
+                    grid, start = request["updateCells"]["range"], request["updateCells"]["range"]["startColumnIndex"]
+                    if grid["endRowIndex"] > len(rows): raise worksheet._api_error(400, "INVALID_ARGUMENT", f"Range exceeds grid limits. Max rows: {len(rows)}")
+                    for offset, cells in enumerate(request["updateCells"]["rows"]):
+                        row, values = rows[grid["startRowIndex"] + offset], [c.get("userEnteredValue", {}).get("stringValue", "") for c in cells["values"]]
+                        while len(row) < start + len(values): row.append('')
+                        row[start:start + len(values)] = values
+                else: raise worksheet._api_error(400, "INVALID_ARGUMENT", f"Request {sorted(request)} wird vom FakeWorksheet nicht unterstützt")
+            worksheet.rows = rows # Erst nach dem letzten Request: ein Fehler ändert nichts
+        return {"replies": [{} for _ in body["requests"]]}
+
+
+def connect_google_worksheet(credentials_dict, sheet_name):
+    """Öffnet das erste Worksheet des Sheets `sheet_name` mit einem Service-Account."""
+    import gspread
+    from google.oauth2.service_account import Credentials
+    creds = Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+    return gspread.authorize(creds).open(sheet_name).sheet1
+
+
+def wrap_quota_aware(worksheet, storage_config):
+    """Legt den Quota-Client (Rate-Limit, Retry, Coalescing) um ein Worksheet."""
+    from labeler_quota import QuotaAwareWorksheet
+    return QuotaAwareWorksheet(worksheet,
+                               reads_per_minute=int(storage_config.get("reads_per_minute", 60)),
+                               writes_per_minute=int(storage_config.get("writes_per_minute", 60)),
+                               max_retries=int(storage_config.get("max_retries", 5)))
+
+
+def make_backend(storage_config, google_config, header):
+    """Erzeugt das in `storage_config["backend"]` konfigurierte Backend (Standard: gsheets)."""
+    backend_name = storage_config.get("backend", "gsheets")
+    if backend_name == "gsheets":
+        worksheet = connect_google_worksheet(google_config["credentials_dict"], google_config["sheet_name"])
+        return GoogleSheetsBackend(wrap_quota_aware(worksheet, storage_config), header, google_config["sheet_name"])
+    if backend_name == "sqlite":
+        return SQLiteBackend(storage_config.get("sqlite_path", os.path.join(".labeler_state", "results.sqlite")), header)
+    if backend_name == "fake_gsheets":
+        fake = FakeWorksheet.shared(storage_config["fake_sheet"]) if storage_config.get("fake_sheet") else FakeWorksheet()
+        fake.latency = float(storage_config.get("fake_latency_ms", 0)) / 1000.0
+        fake.quota_error_rate = float(storage_config.get("fake_quota_error_rate", 0.0))
+        return GoogleSheetsBackend(wrap_quota_aware(fake, storage_config), header, "Fake Sheet (in-process)")
+    raise ValueError(f"Unbekanntes Storage-Backend '{backend_name}' (erlaubt: {', '.join(BACKEND_NAMES)})")
@@ -0,0 +1,278 @@
+# URL-Handling für die Input-Datei: Tweet-Status-IDs, Zusammenfassen von Varianten und URL-Tabelle
+#
+# `.../status/<id>/photo/1`, `.../status/<id>/photo/2` und `...?s=20` sind derselbe Tweet.
+# Beim Laden wird pro Status-ID nur ein Work-Item erzeugt; der Varianten-Index führt jede
+# ID auf alle Original-URLs aus der Datei zurück (für den Export).
+#
+# Große Input-Dateien werden gestreamt (chunkweise gelesen, mit 64-Bit-Hashes dedupliziert) und
+# als memory-mapped URL-Tabelle auf Platte abgelegt, die sich alle Sessions eines Prozesses teilen.
+# Der Cache-Schlüssel besteht aus Pfad, mtime und Größe der Datei (plus `KEY_SCHEME`) – unveränderte
+# Dateien werden nie erneut geparst.
+import codecs
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from array import array
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+URL_PATTERN = re.compile(r"^https?://\S+$")
+
+KEY_SCHEME = 2 # Version der Item-Schlüssel; geht in den Cache-Schlüssel ein, damit alte Tabellen neu gebaut werden
+STATUS_ID_PATTERN = re.compile(r"^https?://(?:www\.)?(?:twitter|x)\.com/[^/?#]+/status/(\d+)", re.IGNORECASE)
+
+
+def tweet_status_id(url):
+    """Status-ID eines Tweet-Links oder None, wenn die URL kein Tweet ist."""
+    if not isinstance(url, str): return None
+    match = STATUS_ID_PATTERN.match(url.strip())
+    return match.group(1) if match else None
+
+
+def item_key(url):
+    """Schlüssel eines Work-Items: Status-ID bei Tweets, sonst die URL selbst (Query und Fragment bleiben, `?id=1` ≠ `?id=2`)."""
+    status_id = tweet_status_id(url)
+    return status_id if status_id else url.strip()
+
+
+def write_variant_index(path, variants):
+    """Schreibt den Varianten-Index als CSV (item_key, original_url) – nur Schlüssel mit mehreren URLs."""
+    index_dir = os.path.dirname(path)
+    if index_dir: os.makedirs(index_dir, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f); writer.writerow(["item_key", "original_url"])
+        for key, originals in variants.items():
+            if len(originals) > 1: writer.writerows([key, url] for url in originals)
+
+
+def read_variant_index(path):
+    """Liest den Varianten-Index zurück (dict item_key -> Liste der Original-URLs)."""
+    variants = {}
+    if not os.path.exists(path): return variants
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f): variants.setdefault(row["item_key"], []).append(row["original_url"])
+    return variants
+
+
+def key_hash(key):
+    """64-Bit-Hash eines Item-Schlüssels (kompakter als der String selbst im Dedup-Set)."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def input_cache_key(file_path):
+    """Cache-Schlüssel aus absolutem Pfad, mtime und Größe der Input-Datei (und der Schlüssel-Version)."""
+    stat = os.stat(file_path)
+    raw = f"{os.path.abspath(file_path)}|{stat.st_mtime_ns}|{stat.st_size}|{KEY_SCHEME}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def detect_encoding(file_path, block_size=1 << 20):
+    """'utf-8', wenn die ganze Datei gültiges UTF-8 ist, sonst 'latin-1' (blockweise geprüft)."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""): decoder.decode(block)
+            decoder.decode(b"", final=True)
+        return "utf-8"
+    except UnicodeDecodeError:
+        logger.warning("'%s' ist kein gültiges UTF-8, lese als latin-1.", file_path)
+        return "latin-1"
+
+
+def iter_url_chunks(file_path, chunk_size=65536):
+    """Liefert gültige URLs (erste Spalte, getrimmt, Regex-geprüft) in Listen zu `chunk_size`."""
+    with open(file_path, newline="", encoding=detect_encoding(file_path)) as f:
+        values = (row[0] for row in csv.reader(f) if row)
+        while True:
+            chunk = [v.strip() for v in itertools.islice(values, chunk_size)]
+            if not chunk: return
+            yield [v for v in chunk if v and v != "nan" and URL_PATTERN.match(v)]
+
+
+class SortedHashRuns:
+    """Menge von 64-Bit-Hashes als wenige sortierte uint64-Arrays (8 Byte pro Hash statt ~70 im Python-`set`).
+
+    Neue Hashes kommen als eigener Lauf dazu; gleich große Läufe werden zusammengeführt (wie bei
+    einem LSM-Baum), so bleiben es O(log n) Läufe und jeder Hash wird O(log n)-mal kopiert.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, hashes):
+        """Bool-Array: welche der `hashes` (uint64) schon in der Menge sind."""
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            pos = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[pos] == hashes
+        return found
+
+    def add(self, hashes):
+        """Fügt neue, untereinander verschiedene Hashes hinzu (Aufrufer prüft vorher mit `contains`)."""
+        run = np.sort(np.asarray(hashes, dtype=np.uint64))
+        if not len(run): return
+        while self.runs and len(self.runs[-1]) <= len(run): run = np.sort(np.concatenate([self.runs.pop(), run]))
+        self.runs.append(run)
+
+
+def prune_url_tables(tables_dir, keep_dir, source, stale_seconds=3600):
+    """Löscht ältere Tabellen derselben Input-Datei (samt `prelabels/`) und liegengebliebene Bau-Verzeichnisse.
+
+    Tabellen anderer Input-Dateien bleiben stehen (Export oder Agreement können sie gerade nutzen).
+    """
+    removed = 0
+    for name in os.listdir(tables_dir):
+        path = os.path.join(tables_dir, name)
+        if path == keep_dir or not os.path.isdir(path): continue
+        if name.startswith("building-"): stale = time.time() - os.path.getmtime(path) > stale_seconds
+        else:
+            try:
+                with open(os.path.join(path, "meta.json"), encoding="utf-8") as f: stale = json.load(f).get("source") == source
+            except (OSError, ValueError): stale = False
+        if stale: shutil.rmtree(path, ignore_errors=True); removed += 1
+    return removed
+
+
+class UrlTable:
+    """Unveränderliche, memory-mapped URL-Tabelle (ein Work-Item pro Zeile).
+
+    Auf Platte: `data.bin` (aneinandergehängte UTF-8-URLs), `offsets.npy` (int64, n+1 Einträge),
+    `hashes.npy`/`order.npy` (sortierte Schlüssel-Hashes für `index_of`), `variants.csv`
+    (Varianten-Index) und `meta.json`.
+    """
+
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+        with open(os.path.join(table_dir, "meta.json"), encoding="utf-8") as f: self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(table_dir, "offsets.npy"), mmap_mode="r")
+        self._sorted_hashes = np.load(os.path.join(table_dir, "hashes.npy"), mmap_mode="r")
+        self._order = np.load(os.path.join(table_dir, "order.npy"), mmap_mode="r")
+        data_path = os.path.join(table_dir, "data.bin")
+        self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if os.path.getsize(data_path) else np.zeros(0, dtype=np.uint8)
+        self.collapsed = self.meta["collapsed"]
+        self.variants_path = os.path.join(table_dir, "variants.csv")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0: index += len(self)
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def index_of(self, url):
+        """Tabellenindex des Items zu `url` (auch für Varianten), sonst None."""
+        h = np.uint64(key_hash(item_key(url)))
+        pos = int(np.searchsorted(self._sorted_hashes, h))
+        if pos < len(self._sorted_hashes) and self._sorted_hashes[pos] == h: return int(self._order[pos])
+        return None
+
+
+def build_url_table(file_path, tables_dir, chunk_size=65536):
+    """Baut die URL-Tabelle zu `file_path` (oder öffnet die bereits gebaute) und gibt sie zurück."""
+    table_dir = os.path.join(tables_dir, input_cache_key(file_path))
+    if os.path.exists(os.path.join(table_dir, "meta.json")): return UrlTable(table_dir)
+    os.makedirs(tables_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="building-", dir=tables_dir)
+    seen, hashes, offsets, duplicate_hashes = SortedHashRuns(), array("Q"), array("q", [0]), array("Q")
+    duplicates_path = os.path.join(tmp_dir, "duplicates.txt") # Duplikate auf Platte statt in einer Liste
+    with open(os.path.join(tmp_dir, "data.bin"), "wb") as data, open(duplicates_path, "w", encoding="utf-8") as duplicates:
+        for chunk in iter_url_chunks(file_path, chunk_size):
+            if not chunk: continue
+            chunk_hashes = np.fromiter((key_hash(item_key(url)) for url in chunk), dtype=np.uint64, count=len(chunk))
+            unique, first = np.unique(chunk_hashes, return_index=True)
+            is_new = np.zeros(len(chunk), dtype=bool)
+            is_new[first] = ~seen.contains(unique)
+            seen.add(unique[is_new[first]])
+            for url, new in zip(chunk, is_new.tolist()):
+                if not new: duplicates.write(url + "\n"); duplicate_hashes.append(key_hash(url)); continue
+                encoded = url.encode("utf-8"); data.write(encoded); offsets.append(offsets[-1] + len(encoded))
+            hashes.extend(chunk_hashes[is_new].tolist())
+    del seen
+    hash_array = np.frombuffer(hashes, dtype=np.uint64)
+    order = np.argsort(hash_array, kind="stable").astype(np.int64)
+    np.save(os.path.join(tmp_dir, "offsets.npy"), np.frombuffer(offsets, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, "hashes.npy"), hash_array[order])
+    np.save(os.path.join(tmp_dir, "order.npy"), order)
+    del hash_array, order
+    meta = {"source": os.path.abspath(file_path), "items": len(offsets) - 1, "collapsed": len(duplicate_hashes)}
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f: json.dump(meta, f)
+    # Varianten-Index direkt aus der Duplikat-Datei schreiben: pro Schlüssel der Repräsentant, dann
+    # jede weitere verschiedene URL einmal (gleiche URLs erkennt der 64-Bit-Hash der URL selbst)
+    table = UrlTable(tmp_dir)
+    first_seen = np.zeros(len(duplicate_hashes), dtype=bool)
+    first_seen[np.unique(np.frombuffer(duplicate_hashes, dtype=np.uint64), return_index=True)[1]] = True
+    del duplicate_hashes
+    written = Bitmap(len(table)) # Items, deren Repräsentant schon im Index steht
+    with open(duplicates_path, encoding="utf-8") as duplicates, open(table.variants_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f); writer.writerow(["item_key", "original_url"])
+        for url, first in zip(duplicates, first_seen.tolist()):
+            url = url.rstrip("\n")
+            if not first: continue
+            index = table.index_of(url); rep = table[index]
+            if url == rep: continue
+            if index not in written: writer.writerow([item_key(rep), rep]); written.add(index)
+            writer.writerow([item_key(rep), url])
+    os.remove(duplicates_path)
+    del table
+    try: os.replace(tmp_dir, table_dir)
+    except OSError: shutil.rmtree(tmp_dir, ignore_errors=True) # Ein anderer Prozess war schneller
+    else: prune_url_tables(tables_dir, table_dir, meta["source"])
+    logger.info("URL-Tabelle gebaut: %d Items, %d Duplikate zusammengefasst (%s).", meta["items"], meta["collapsed"], table_dir)
+    return UrlTable(table_dir)
+
+
+class Bitmap:
+    """Kompaktes Bit-Array über die Indizes der URL-Tabelle (1 Bit pro Item)."""
+
+    def __init__(self, size):
+        self.size = size
+        self.bits = np.zeros((size + 7) // 8, dtype=np.uint8)
+
+    def add(self, index):
+        self.bits[index >> 3] |= np.uint8(1 << (index & 7))
+
+    def __contains__(self, index):
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits, bitorder="little")[:self.size].sum())
+
+    def to_bool_array(self):
+        return np.unpackbits(self.bits, bitorder="little")[:self.size].astype(bool)
+
+
+def labeler_seed(labeler_id):
+    """Seed für die Reihenfolge eines Labelers (SHA-256 des Namens, wie bisher)."""
+    return int(hashlib.sha256(labeler_id.encode('utf-8')).hexdigest(), 16)
+
+
+def build_session_order(table, processed_urls, seed):
+    """Erstellt die Session-Reihenfolge als int32-Permutation über die URL-Tabelle.
+
+    Gibt `(order, done)` zurück: die gemischten Indizes der noch offenen Items und ein Bitmap der
+    bereits erledigten Items. Das Mischen entspricht `random.seed(seed); random.shuffle(liste)` auf
+    der Liste der offenen URLs in Datei-Reihenfolge, die Reihenfolge bleibt also wie bisher.
+    """
+    done = Bitmap(len(table))
+    for url in processed_urls:
+        index = table.index_of(url)
+        if index is not None: done.add(index)
+    remaining = np.flatnonzero(~done.to_bool_array()).tolist()
+    random.Random(seed).shuffle(remaining)
+    return np.array(remaining, dtype=np.int32), done
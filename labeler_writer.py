@@ -0,0 +1,194 @@
+# Write-Behind-Queue für Speichervorgänge des Labelers
+#
+# Jeder Klick auf "Speichern & Weiter" landet zuerst in einem lokalen SQLite-Journal
+# (dauerhaft, übersteht einen Prozessabsturz) und wird von einem Hintergrund-Thread
+# gebündelt ins Sheet geschrieben (append_rows bzw. Upsert). Die Klicks kehren sofort zurück.
+#
+# Mehrere App-Prozesse dürfen sich ein Journal teilen (gleicher local_state_dir): ein Writer
+# beansprucht seinen Batch vor dem Schreiben (owner + Ablaufzeit), so schreibt ihn kein anderer
+# doppelt. Stirbt ein Prozess, laufen seine Ansprüche ab und ein anderer übernimmt die Zeilen.
+# Vorübergehende Fehler (Quota, 5xx, Netzwerk, gesperrte Datei) werden mit Backoff wiederholt;
+# Zeilen, die dauerhaft scheitern, landen in der Tabelle `failed` und blockieren den Rest nicht.
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def is_transient(error):
+    """True für Fehler, bei denen ein späterer Versuch gelingen kann (sonst gilt der Batch als nicht schreibbar)."""
+    if isinstance(error, (sqlite3.OperationalError, TimeoutError, ConnectionError)): return True
+    if "gspread" in sys.modules: # Nur dann kann es ein Sheets-Fehler sein
+        from labeler_quota import is_retryable
+        return is_retryable(error)
+    return False
+
+
+class WriteBehindQueue:
+    """Lokales Journal + Hintergrund-Writer, der Zeilen in Batches an `flush_fn` übergibt.
+
+    `flush_fn(rows)` bekommt eine Liste von Zeilen (Listen von Strings) und muss bei einem
+    Fehler eine Exception werfen. Bei vorübergehenden Fehlern (`is_transient`) bleiben die Zeilen
+    im Journal und werden später erneut versucht; bei anderen wird der Batch halbiert, bis die
+    schuldige Zeile gefunden ist, die dann nach `failed` wandert. Zeilen werden erst nach
+    erfolgreichem Flush aus dem Journal gelöscht (at-least-once: stirbt der Prozess genau zwischen
+    Flush und Löschen, kann eine Zeile doppelt im Sheet landen).
+    """
+
+    def __init__(self, journal_path, flush_fn, batch_size=100, flush_interval=2.0, max_backoff=60.0, claim_seconds=300.0, is_transient=is_transient):
+        self.journal_path = journal_path
+        self.flush_fn = flush_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.claim_seconds = claim_seconds
+        self.is_transient = is_transient
+        self.owner = uuid.uuid4().hex # Dieser Writer im Journal (pro Prozess)
+        self.last_error = None
+        self.flushed_rows = self.flush_failures = self.retries = self.dead_lettered = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._drained = threading.Event() # Gesetzt, wenn der Writer nichts mehr zu schreiben hat
+        self._stopped = threading.Event()
+        journal_dir = os.path.dirname(journal_path)
+        if journal_dir: os.makedirs(journal_dir, exist_ok=True)
+        self._conn = sqlite3.connect(journal_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pending (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, created REAL NOT NULL, owner TEXT, claimed_until REAL)")
+        columns = {name for _, name, *_ in self._conn.execute("PRAGMA table_info(pending)")}
+        if "owner" not in columns: # Journal aus einer älteren Version
+            self._conn.execute("ALTER TABLE pending ADD COLUMN owner TEXT"); self._conn.execute("ALTER TABLE pending ADD COLUMN claimed_until REAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS failed (id INTEGER PRIMARY KEY, row TEXT NOT NULL, created REAL NOT NULL, error TEXT NOT NULL, failed_at REAL NOT NULL)")
+        self._pending = self._count("pending")
+        self._thread = threading.Thread(target=self._run, name="labeler-write-behind", daemon=True)
+        self._thread.start()
+
+    def _count(self, table):
+        with self._lock: return self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def _transaction(self, statements):
+        """Führt `(sql, params)`-Paare in einer Schreibtransaktion aus (Aufrufer hält den Lock)."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            results = [self._conn.execute(sql, params) for sql, params in statements]
+            self._conn.execute("COMMIT")
+        except Exception: self._conn.execute("ROLLBACK"); raise
+        return results
+
+    # --- API für die App ---
+    def enqueue(self, row):
+        """Schreibt eine Zeile dauerhaft ins Journal und weckt den Writer. Kehrt sofort zurück."""
+        return self.enqueue_many([row])
+
+    def enqueue_many(self, rows):
+        rows = [list(r) for r in rows]
+        if not rows: return 0
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("INSERT INTO pending (row, created) VALUES (?, ?)", [(json.dumps(r, ensure_ascii=False), now) for r in rows])
+            self._pending += len(rows); self._drained.clear()
+        self._wakeup.set()
+        return len(rows)
+
+    def pending_count(self):
+        """Zeilen im Journal (auch die, die gerade ein anderer Prozess schreibt)."""
+        return self._pending
+
+    def pending_rows(self):
+        """Alle noch nicht ins Sheet geschriebenen Zeilen (älteste zuerst)."""
+        with self._lock:
+            return [json.loads(r) for (r,) in self._conn.execute("SELECT row FROM pending ORDER BY id")]
+
+    def failed_count(self):
+        """Zeilen, die dauerhaft nicht geschrieben werden konnten (Tabelle `failed`)."""
+        return self._count("failed")
+
+    def retry_failed(self):
+        """Stellt alle Zeilen aus `failed` wieder ins Journal (z.B. nach behobenem Berechtigungsfehler). Gibt ihre Zahl zurück."""
+        with self._lock:
+            moved = self._transaction([("INSERT INTO pending (row, created) SELECT row, created FROM failed ORDER BY id", ()),
+                                       ("DELETE FROM failed", ())])[0].rowcount
+            self._pending += moved; self._drained.clear()
+        self._wakeup.set()
+        return moved
+
+    def flush(self, timeout=30.0):
+        """Wartet, bis der Writer alles Schreibbare geschrieben hat (oder `timeout` abläuft). Gibt True zurück, wenn ja."""
+        self._wakeup.set()
+        return self._drained.wait(timeout)
+
+    def close(self, timeout=10.0):
+        self.flush(timeout)
+        self._stopped.set(); self._wakeup.set()
+        self._thread.join(timeout)
+        # Offene Ansprüche freigeben, damit ein anderer Prozess sofort übernehmen kann
+        with self._lock: self._conn.execute("UPDATE pending SET owner = NULL, claimed_until = NULL WHERE owner = ?", (self.owner,))
+
+    # --- Writer-Thread ---
+    def _claim_batch(self):
+        """Beansprucht die ältesten freien (oder verwaisten) Zeilen für diesen Writer. Leer -> `_drained` wird gesetzt."""
+        now = time.time()
+        with self._lock:
+            self._transaction([("UPDATE pending SET owner = ?, claimed_until = ? WHERE id IN (SELECT id FROM pending "
+                                "WHERE owner IS NULL OR owner = ? OR claimed_until < ? ORDER BY id LIMIT ?)",
+                                (self.owner, now + self.claim_seconds, self.owner, now, self.batch_size))])
+            batch = self._conn.execute("SELECT id, row FROM pending WHERE owner = ? ORDER BY id LIMIT ?", (self.owner, self.batch_size)).fetchall()
+            self._pending = self._conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+            if not batch: self._drained.set()
+        return batch
+
+    def _done(self, batch):
+        with self._lock:
+            deleted = self._conn.execute(f"DELETE FROM pending WHERE id IN ({','.join('?' * len(batch))})", [i for i, _ in batch]).rowcount
+            self._pending -= deleted
+        self.flushed_rows += len(batch)
+
+    def _dead_letter(self, entry, error):
+        row_id, row = entry
+        now = time.time()
+        with self._lock:
+            self._transaction([("INSERT OR REPLACE INTO failed (id, row, created, error, failed_at) SELECT id, row, created, ?, ? FROM pending WHERE id = ?", (error, now, row_id)),
+                               ("DELETE FROM pending WHERE id = ?", (row_id,))])
+            self._pending -= 1
+        self.dead_lettered += 1
+        logger.error("Zeile %s dauerhaft nicht schreibbar (%s), nach 'failed' verschoben.", row, error)
+
+    def _write(self, batch):
+        """Schreibt einen beanspruchten Batch. Nicht schreibbare Zeilen werden per Halbierung isoliert.
+
+        Wirft nur vorübergehende Fehler weiter (der Rest des Batches bleibt dann beansprucht).
+        """
+        try: self.flush_fn([json.loads(r) for _, r in batch])
+        except Exception as e:
+            self.flush_failures += 1
+            if self.is_transient(e): raise
+            if len(batch) == 1: self._dead_letter(batch[0], f"{type(e).__name__}: {e}"); return
+            middle = len(batch) // 2
+            self._write(batch[:middle]); self._write(batch[middle:])
+            return
+        self._done(batch)
+
+    def _run(self):
+        backoff = min(1.0, self.max_backoff)
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while not self._stopped.is_set():
+                try: batch = self._claim_batch()
+                except sqlite3.OperationalError as e: # Journal gerade von einem anderen Prozess gesperrt
+                    self.last_error = f"{type(e).__name__}: {e}"; self._stopped.wait(backoff); continue
+                if not batch: break
+                try: self._write(batch)
+                except Exception as e:
+                    self.last_error = f"{type(e).__name__}: {e}"; self.retries += 1
+                    logger.warning("Write-Behind Flush fehlgeschlagen (%d Zeilen), neuer Versuch in %.0fs: %s", len(batch), backoff, e)
+                    self._stopped.wait(backoff); backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                self.last_error = None; backoff = min(1.0, self.max_backoff)
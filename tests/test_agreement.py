@@ -0,0 +1,98 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from labeler_agreement import AgreementTracker, cohen_kappa_pairs, fleiss_kappa, krippendorff_alpha
+from labeler_codebook import ALL_CATEGORIES_KEYS
+from labeler_storage import HEADER, SQLiteBackend
+
+A, B = ALL_CATEGORIES_KEYS[:2]
+TS = "2025-01-01 12:00:00 CET+0100"
+
+
+class GatedStorage:
+    """Leitet an ein Backend weiter; `read_rows` wartet, solange `gate` nicht gesetzt ist."""
+
+    def __init__(self, storage):
+        self.storage, self.gate = storage, threading.Event()
+        self.gate.set()
+
+    def read_rows(self, start_row, limit=5000):
+        assert self.gate.wait(5)
+        return self.storage.read_rows(start_row, limit)
+
+
+def test_background_rebuild_serves_the_last_snapshot_until_it_is_done(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER)
+    backend.append_rows([[TS, "anna", "https://x.com/u/status/1", A, ""], [TS, "ben", "https://x.com/u/status/1", A, ""]])
+    storage = GatedStorage(backend)
+    tracker = AgreementTracker(storage, min_refresh_interval=3600)
+    assert tracker.refresh(force=True) == 2
+    assert tracker.hotspots() == []
+
+    backend.update_rows([(3, [TS, "ben", "https://x.com/u/status/1", B, ""])]) # Korrektur an Ort und Stelle
+    storage.gate.clear()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert tracker.refresh(rebuild=True, executor=executor) == 0 # Kehrt sofort zurück, ohne zu lesen
+        assert tracker.rebuilding and not tracker.start_rebuild(executor)
+        assert tracker.hotspots() == [] and tracker.rows_seen == 2 # Letzter Stand bleibt sichtbar
+        storage.gate.set()
+        tracker._rebuild.result(timeout=5)
+    assert not tracker.rebuilding and tracker.rebuild_error is None
+    assert [h["url"] for h in tracker.hotspots()] == ["https://x.com/u/status/1"] and tracker.rows_seen == 2
+
+    backend.append_rows([[TS, "cem", "https://x.com/u/status/1", B, ""]])
+    assert tracker.refresh(force=True) == 1 # Danach geht es inkrementell weiter
+
+
+def test_failed_background_rebuild_keeps_the_snapshot(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER)
+    backend.append_rows([[TS, "anna", "https://x.com/u/status/1", A, ""]])
+    tracker = AgreementTracker(backend, min_refresh_interval=0)
+    tracker.refresh()
+    backend.read_rows = lambda start_row, limit=5000: (_ for _ in ()).throw(OSError("weg"))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        tracker.start_rebuild(executor)
+        tracker._rebuild.exception(timeout=5)
+    assert isinstance(tracker.rebuild_error, OSError)
+    assert tracker.rows_seen == 1 and tracker.labelers == ["anna"]
+
+
+def test_kappas_match_known_values():
+    # Zwei Labeler, 50 Items: ja/ja 20, a ja/b nein 5, a nein/b ja 10, nein/nein 15 -> Cohen 0.4,
+    # Scott/Fleiss (bei zwei Labelern identisch) 0.195 / 0.495 = 0.394, Krippendorff 1 - 99 * 15 / (55 * 45) = 0.4
+    a = [1] * 20 + [1] * 5 + [0] * 10 + [0] * 15
+    b = [1] * 20 + [0] * 5 + [1] * 10 + [0] * 15
+    positives = (np.array(a) + np.array(b))[:, None]
+    n_labels = np.full(50, 2)
+    np.testing.assert_allclose(fleiss_kappa(n_labels, positives), [0.195 / 0.495])
+    np.testing.assert_allclose(krippendorff_alpha(n_labels, positives), [0.4])
+    n11, n10, n00 = (np.zeros((1, 2, 2), dtype=np.int64) for _ in range(3))
+    n11[0, 0, 1] = n11[0, 1, 0] = 20; n00[0, 0, 1] = n00[0, 1, 0] = 15
+    n10[0, 0, 1], n10[0, 1, 0] = 5, 10 # a ja & b nein, b ja & a nein
+    cohen, overlap = cohen_kappa_pairs(n11, n10, n00)
+    assert cohen[0, 0, 1] == pytest.approx(0.4) and cohen[0, 1, 0] == pytest.approx(0.4) and overlap[0, 0, 1] == 50
+
+
+def test_fleiss_kappa_with_three_raters():
+    # Drei Labeler, 4 Items mit 3, 2, 1, 0 Ja-Stimmen: P_o = (1 + 1/3 + 1/3 + 1) / 4 = 2/3, p_ja = 0.5 -> (2/3 - 0.5) / 0.5 = 1/3
+    np.testing.assert_allclose(fleiss_kappa(np.full(4, 3), np.array([[3], [2], [1], [0]])), [1 / 3])
+    # Items mit weniger als zwei Labels zählen nicht; ohne solche Items gibt es keinen Wert
+    np.testing.assert_allclose(fleiss_kappa(np.array([3, 3, 1]), np.array([[3], [0], [1]])), [1.0])
+    assert np.isnan(fleiss_kappa(np.array([1, 0]), np.array([[1], [0]]))).all()
+
+
+def test_tracker_reports_the_same_values_from_stored_rows(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER)
+    a = [A] * 25 + [""] * 25
+    b = [A] * 20 + [""] * 5 + [A] * 10 + [""] * 15
+    backend.append_rows([[TS, labeler, f"https://x.com/u/status/{i}", categories[i], ""] for labeler, categories in (("anna", a), ("ben", b)) for i in range(50)])
+    tracker = AgreementTracker(backend)
+    tracker.refresh(force=True)
+    summary = {row["subkategorie"]: row for row in tracker.category_summary()}
+    first = next(iter(summary.values())) # A ist die erste Subkategorie
+    assert first["fleiss_kappa"] == round(0.195 / 0.495, 3) and first["cohen_kappa_mittel"] == 0.4 and first["krippendorff_alpha"] == 0.4
+    assert first["items_mehrfach"] == 50
+    assert tracker.pairwise_cohen()[0]["gemeinsame_items"] == 50
@@ -0,0 +1,19 @@
+from labeler_embed import SQLiteEmbedCache
+
+
+def test_replacing_an_entry_does_not_grow_the_cache(tmp_path):
+    cache = SQLiteEmbedCache(str(tmp_path / "embed_cache.sqlite"), max_entries=3)
+    for i in range(3): cache.put(f"k{i}", "<p>fehler</p>", False)
+    for _ in range(5): cache.put("k0", "<blockquote>ok</blockquote>", True) # Fehler durch Erfolg ersetzt
+    assert cache.stats()["entries"] == 3 and cache.stats()["evictions"] == 0
+    assert cache.get("k0") == ("<blockquote>ok</blockquote>", True)
+    assert all(cache.contains(f"k{i}") for i in range(3))
+
+
+def test_eviction_drops_least_recently_used_entries(tmp_path):
+    cache = SQLiteEmbedCache(str(tmp_path / "embed_cache.sqlite"), max_entries=10)
+    for i in range(11): cache.put(f"k{i}", "<blockquote/>", True)
+    assert cache.stats()["entries"] == 9 and cache.stats()["evictions"] == 2
+    assert not cache.contains("k0") and not cache.contains("k1") and cache.contains("k10")
+    reopened = SQLiteEmbedCache(str(tmp_path / "embed_cache.sqlite"), max_entries=10)
+    assert reopened.stats()["entries"] == 9
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import labeler_ingest
+from labeler_codebook import ALL_CATEGORIES_KEYS
+from labeler_ingest import ingest
+from labeler_storage import HEADER, FakeWorksheet, GoogleSheetsBackend, SQLiteBackend
+
+A, B, C = ALL_CATEGORIES_KEYS[:3]
+TS = "2025-01-01 12:00:00 CET+0100"
+
+
+def write_jsonl(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for labeler, url, categories in records: f.write(json.dumps({"labeler": labeler, "url": url, "categories": categories}) + "\n")
+    return str(path)
+
+
+def labels(storage):
+    return sorted((row[1], row[2], row[3]) for row in storage.read_all_rows())
+
+
+def run(storage, tmp_path, input_path, **kwargs):
+    return ingest(storage, input_path, str(tmp_path / "state" / "in.checkpoint.json"), str(tmp_path / "state" / "in.rejects.csv"), **kwargs)
+
+
+def sheets_backend():
+    backend = GoogleSheetsBackend(FakeWorksheet(), HEADER, "fake")
+    backend.ensure_header()
+    return backend
+
+
+@pytest.mark.parametrize("make_storage", [lambda tmp_path: SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER), lambda tmp_path: sheets_backend()])
+@pytest.mark.parametrize("mode", ["skip", "upsert"])
+def test_last_record_per_labeler_and_tweet_wins(tmp_path, make_storage, mode):
+    storage = make_storage(tmp_path)
+    records = [("anna", "https://x.com/u/status/1", A), ("anna", "https://x.com/u/status/2", A),
+               ("anna", "https://twitter.com/u/status/1/photo/1", B), ("ben", "https://x.com/u/status/1", A),
+               ("anna", "https://x.com/u/status/2", C)]
+    counts = run(storage, tmp_path, write_jsonl(tmp_path / "in.jsonl", records), mode=mode, batch_size=2)
+    assert counts["written"] == 3 and counts["duplicates"] == 2
+    assert labels(storage) == [("anna", "https://twitter.com/u/status/1/photo/1", B), ("anna", "https://x.com/u/status/2", C), ("ben", "https://x.com/u/status/1", A)]
+
+
+def test_upsert_matches_stored_variants_of_the_same_tweet(tmp_path):
+    storage = sheets_backend()
+    storage.append_rows([[TS, "anna", "https://x.com/u/status/1/photo/1", A, ""]])
+    counts = run(storage, tmp_path, write_jsonl(tmp_path / "in.jsonl", [("anna", "https://twitter.com/u/status/1", C)]), mode="upsert")
+    assert counts["updated"] == 1
+    assert labels(storage) == [("anna", "https://twitter.com/u/status/1", C)]
+
+
+def test_skip_mode_keeps_existing_rows(tmp_path):
+    storage = SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER)
+    storage.append_rows([[TS, "anna", "https://x.com/u/status/1", A, ""]])
+    counts = run(storage, tmp_path, write_jsonl(tmp_path / "in.jsonl", [("anna", "https://x.com/u/status/1?s=20", C), ("anna", "https://x.com/u/status/3", B)]))
+    assert counts["duplicates"] == 1 and counts["written"] == 1
+    assert labels(storage) == [("anna", "https://x.com/u/status/1", A), ("anna", "https://x.com/u/status/3", B)]
+
+
+def test_resume_continues_after_the_checkpoint_without_duplicates(tmp_path, monkeypatch):
+    storage = SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER)
+    records = [("anna", f"https://x.com/u/status/{i}", A) for i in range(1, 7)] + [("anna", "https://x.com/u/status/2", C), ("anna", "bogus", A)]
+    input_path = write_jsonl(tmp_path / "in.jsonl", records)
+
+    save_checkpoint, saves = labeler_ingest.save_checkpoint, []
+    def crash_on_second_checkpoint(path, checkpoint):
+        saves.append(checkpoint["counts"]["records"])
+        if len(saves) == 2: raise KeyboardInterrupt # Abbruch zwischen Batch 2 und seinem Checkpoint
+        save_checkpoint(path, checkpoint)
+    monkeypatch.setattr(labeler_ingest, "save_checkpoint", crash_on_second_checkpoint)
+    with pytest.raises(KeyboardInterrupt): run(storage, tmp_path, input_path, batch_size=3)
+    monkeypatch.setattr(labeler_ingest, "save_checkpoint", save_checkpoint)
+
+    counts = run(storage, tmp_path, input_path, batch_size=3, resume=True)
+    assert counts["records"] == 8 and counts["rejected"] == 1
+    rows = labels(storage)
+    assert len(rows) == 6 # Keine doppelten Zeilen trotz Abbruch nach dem Schreiben
+    assert ("anna", "https://x.com/u/status/2", C) in rows # Die Korrektur über den Checkpoint hinweg gewinnt
+    assert run(storage, tmp_path, input_path, resume=True) == counts # Abgeschlossen: nichts mehr zu tun
+
+
+def test_resume_rejects_a_changed_input(tmp_path):
+    storage = SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER)
+    input_path = write_jsonl(tmp_path / "in.jsonl", [("anna", "https://x.com/u/status/1", A)])
+    run(storage, tmp_path, input_path)
+    write_jsonl(tmp_path / "in.jsonl", [("anna", "https://x.com/u/status/1", A), ("anna", "https://x.com/u/status/2", A)])
+    with pytest.raises(ValueError): run(storage, tmp_path, input_path, resume=True)
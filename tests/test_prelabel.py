@@ -0,0 +1,47 @@
+import numpy as np
+
+from labeler_codebook import ALL_CATEGORIES_KEYS, CATEGORY_BITS
+from labeler_embed import SQLiteEmbedCache
+from labeler_prelabel import build_prelabels, decision_margins, fetch_missing, load_prelabels, suggestion_masks
+from labeler_urls import build_url_table
+
+HEALTH_TWEET = ("<blockquote class=\"twitter-tweet\"><p lang=\"en\">Mental health matters: therapy, anxiety and depression support "
+                "for everyone</p>&mdash; u</blockquote>")
+
+
+def test_margins_follow_the_decision_including_the_suggestion_cap():
+    scores = np.array([[0.9, 0.8, 0.7, 0.0], # Dritter Platz über der Schwelle, aber durch die Obergrenze nicht gewählt
+                       [0.5, 0.25, 0.1, 0.0], # Obergrenze greift nicht, knappste Entscheidung an der Schwelle
+                       [0.1, 0.0, 0.0, 0.0]], dtype=np.float32)
+    keys = ALL_CATEGORIES_KEYS[:4]
+    full = np.zeros((3, len(ALL_CATEGORIES_KEYS)), dtype=np.float32); full[:, :4] = scores
+    assert suggestion_masks(full, 0.2, 2).tolist() == [CATEGORY_BITS[keys[0]] | CATEGORY_BITS[keys[1]], CATEGORY_BITS[keys[0]] | CATEGORY_BITS[keys[1]], 0]
+    np.testing.assert_allclose(decision_margins(full, 0.2, 2), [0.1, 0.05, 0.1], atol=1e-6)
+    # Ohne Obergrenze zählt nur die Schwelle: 0.7 liegt 0.5 darüber, 0.0 liegt 0.2 darunter
+    np.testing.assert_allclose(decision_margins(full, 0.2, len(ALL_CATEGORIES_KEYS)), [0.2, 0.05, 0.1], atol=1e-6)
+
+
+def test_fetched_texts_survive_eviction_from_the_app_cache(tmp_path):
+    input_path = tmp_path / "in.csv"
+    input_path.write_text("url\nhttps://x.com/u/status/1\nhttps://x.com/u/status/2\nhttps://example.com/a\n", encoding="utf-8")
+    table = build_url_table(str(input_path), str(tmp_path / "url_tables"))
+    cache_path, text_path = str(tmp_path / "embed_cache.sqlite"), str(tmp_path / "prelabel_texts.sqlite")
+    cache = SQLiteEmbedCache(cache_path, max_entries=10)
+    cache.put("https://x.com/u/status/2", HEALTH_TWEET, True) # Schon von der App gecached: wird übernommen
+    calls = []
+    def fetch(url):
+        calls.append(url)
+        return (HEALTH_TWEET, True) if "/status/" in url else None
+    assert fetch_missing(table, text_path, cache_path, fetch) == 2 # status/1 und der Nicht-Tweet
+    assert calls == ["https://x.com/u/status/1", "https://example.com/a"]
+    assert cache.stats()["entries"] == 1 # Der App-Cache bleibt unberührt
+
+    for i in range(20): cache.put(f"k{i}", "<p/>", True) # Die App verdrängt ältere Einträge
+    assert not cache.contains("https://x.com/u/status/2")
+    calls.clear()
+    assert fetch_missing(table, text_path, cache_path, fetch) == 1 and calls == ["https://example.com/a"]
+
+    meta = build_prelabels(table, cache_path, str(tmp_path / "prelabels"), threshold=0.05, workers=1, text_path=text_path)
+    assert meta["with_text"] == 2
+    prelabels = load_prelabels(str(tmp_path / "prelabels"), len(table))
+    assert prelabels.suggestions(0) == prelabels.suggestions(1) == ["Mental Health"] and prelabels.suggestions(2) == []
@@ -0,0 +1,68 @@
+import json
+
+import gspread
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from labeler_quota import QuotaAwareWorksheet
+
+
+def api_error(code):
+    response = requests.Response(); response.status_code = code
+    response._content = json.dumps({"error": {"code": code, "message": "x", "status": "X"}}).encode()
+    return gspread.exceptions.APIError(response)
+
+
+def connection_error(reason):
+    return requests.exceptions.ConnectionError(MaxRetryError(None, "https://sheets.googleapis.com", reason))
+
+
+class Flaky:
+    """Worksheet, dessen Methoden erst die Fehler aus `errors` werfen und dann gelingen."""
+
+    def __init__(self, errors):
+        self.errors, self.calls = list(errors), []
+
+    def _method(self, name):
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            if self.errors: raise self.errors.pop(0)
+            return name
+        return call
+
+    def __getattr__(self, name):
+        return self._method(name)
+
+
+def wrap(errors):
+    inner = Flaky(errors)
+    return inner, QuotaAwareWorksheet(inner, reads_per_minute=10**6, writes_per_minute=10**6, base_delay=0.0)
+
+
+@pytest.mark.parametrize("error", [api_error(500), api_error(503), requests.exceptions.ReadTimeout("slow"), connection_error(ProtocolError("reset"))])
+def test_append_is_not_retried_when_it_may_have_been_applied(error):
+    inner, sheet = wrap([error])
+    with pytest.raises(type(error)): sheet.append_rows([["a"]])
+    assert inner.calls == ["append_rows"]
+
+
+@pytest.mark.parametrize("error", [api_error(429), requests.exceptions.ConnectTimeout("no route"), connection_error(NewConnectionError(None, "refused"))])
+def test_append_is_retried_when_nothing_was_sent(error):
+    inner, sheet = wrap([error])
+    assert sheet.append_rows([["a"]]) == "append_rows"
+    assert inner.calls == ["append_rows", "append_rows"]
+
+
+def test_idempotent_writes_and_reads_keep_the_full_retry_policy():
+    inner, sheet = wrap([api_error(503), requests.exceptions.ReadTimeout("slow")])
+    assert sheet.batch_update([]) == "batch_update"
+    inner.errors = [api_error(500)]
+    assert sheet.get("A1:B2") == "get"
+    assert sheet.stats()["retried"] == 3
+
+
+def test_client_errors_are_not_retried():
+    inner, sheet = wrap([api_error(400)])
+    with pytest.raises(gspread.exceptions.APIError): sheet.update(values=[[1]], range_name="A1")
+    assert inner.calls == ["update"]
@@ -0,0 +1,80 @@
+import time
+
+import numpy as np
+import pytest
+
+import labeler_scheduler
+from labeler_scheduler import WorkScheduler
+from labeler_urls import Bitmap
+
+N_ITEMS, CHUNK = 1000, 100
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.setattr(labeler_scheduler, "SCAN_CHUNK", CHUNK)
+    return WorkScheduler(N_ITEMS, str(tmp_path / "leases.sqlite"), redundancy=3)
+
+
+def scanned(scheduler, call):
+    before = scheduler.chunks_scanned
+    result = call()
+    return result, scheduler.chunks_scanned - before
+
+
+def test_scan_stops_when_the_lowest_level_only_holds_own_items(scheduler):
+    # Items 0..499 hat nur anna gelabelt (Stufe 1), die übrigen ben und cem (Stufe 2):
+    # die globale Minimalstufe 1 enthält für anna nichts mehr, Stufe 2 ist ihr Optimum.
+    for item in range(500): scheduler.record_label("anna", item)
+    for item in range(500, N_ITEMS): scheduler.record_label("ben", item); scheduler.record_label("cem", item)
+    order = np.arange(N_ITEMS, dtype=np.int32)[::-1].copy()
+    item, chunks = scanned(scheduler, lambda: scheduler.lease("anna", order))
+    assert item == N_ITEMS - 1 and chunks == 1
+    peeked, chunks = scanned(scheduler, lambda: scheduler.peek("anna", order, 5))
+    assert peeked == list(range(N_ITEMS - 2, N_ITEMS - 7, -1)) and chunks == 1
+
+
+def test_scan_stops_when_the_lowest_level_only_holds_excluded_items(scheduler):
+    for item in range(100, N_ITEMS): scheduler.record_label("ben", item)
+    order = np.arange(N_ITEMS, dtype=np.int32)[::-1].copy()
+    exclude = Bitmap(N_ITEMS)
+    for item in range(100): exclude.add(item) # Alle Items auf Stufe 0 in dieser Sitzung schon vergeben
+    for excluded in (exclude, set(range(100))):
+        item, chunks = scanned(scheduler, lambda: scheduler.peek("anna", order, 1, exclude=excluded))
+        assert item == [N_ITEMS - 1] and chunks == 1
+
+
+def test_scan_still_prefers_the_least_labelled_items(scheduler):
+    for item in range(N_ITEMS - 1): scheduler.record_label("ben", item)
+    order = np.arange(N_ITEMS, dtype=np.int32)
+    item, chunks = scanned(scheduler, lambda: scheduler.lease("anna", order))
+    assert item == N_ITEMS - 1 and chunks == N_ITEMS // CHUNK
+    # Nach der Lease liegt alles auf Stufe 1, der nächste Scan endet im ersten Chunk
+    item, chunks = scanned(scheduler, lambda: scheduler.lease("cem", order))
+    assert item == 0 and chunks == 1
+
+
+def test_expired_leases_return_items_to_the_pool(tmp_path):
+    order = np.arange(3, dtype=np.int32)
+    scheduler = WorkScheduler(3, str(tmp_path / "leases.sqlite"), redundancy=1, lease_seconds=0.05)
+    assert [scheduler.lease(labeler, order) for labeler in ("anna", "ben", "cem")] == [0, 1, 2]
+    assert scheduler.lease("dora", order) is None # k = 1: alles vergeben
+    time.sleep(0.1)
+    assert scheduler.lease("dora", order) == 0 and scheduler.stats()["active_leases"] == 1
+    scheduler.record_label("dora", 0)
+    assert scheduler.stats()["active_leases"] == 0 and scheduler.lease("anna", order) == 1
+
+
+def test_leases_survive_a_restart_until_they_expire(tmp_path):
+    order = np.arange(4, dtype=np.int32)
+    path = str(tmp_path / "leases.sqlite")
+    scheduler = WorkScheduler(4, path, redundancy=1, lease_seconds=60)
+    assert scheduler.lease("anna", order) == 0
+    scheduler.lease_seconds = 0.05
+    assert scheduler.lease("ben", order) == 1
+    time.sleep(0.1)
+    restarted = WorkScheduler(4, path, redundancy=1, lease_seconds=60)
+    assert restarted.stats()["active_leases"] == 1 # Die abgelaufene Lease von ben ist weg
+    assert restarted.lease("cem", order) == 1
+    restarted.release("anna", 0)
+    assert restarted.lease("cem", order) == 0
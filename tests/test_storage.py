@@ -0,0 +1,98 @@
+import pytest
+
+from labeler_codebook import ALL_CATEGORIES_KEYS
+from labeler_storage import COL_LBL, COL_URL, HEADER, FakeWorksheet, GoogleSheetsBackend, SQLiteBackend
+
+A, B, C = ALL_CATEGORIES_KEYS[:3]
+TS = "2025-01-01 12:00:00 CET+0100"
+LBL, URL = HEADER.index(COL_LBL), HEADER.index(COL_URL)
+
+
+def row(labeler, url, categories, comment=""):
+    return [TS, labeler, url, categories, comment]
+
+
+def sheets(tmp_path):
+    backend = GoogleSheetsBackend(FakeWorksheet(), HEADER, "fake")
+    backend.ensure_header()
+    return backend
+
+
+def sqlite(tmp_path):
+    return SQLiteBackend(str(tmp_path / "results.sqlite"), HEADER)
+
+
+both = pytest.mark.parametrize("make_backend", [sheets, sqlite], ids=["fake_gsheets", "sqlite"])
+
+
+def upsert(backend, rows, row_numbers):
+    return backend.upsert_rows(rows, LBL, URL, lambda labeler, url: row_numbers.get((labeler, url)))
+
+
+@both
+def test_correction_overwrites_the_row_in_place(tmp_path, make_backend):
+    backend = make_backend(tmp_path)
+    first = backend.append_rows([row("anna", "https://x.com/u/status/1", A), row("ben", "https://x.com/u/status/1", A)])
+    written = upsert(backend, [row("anna", "https://x.com/u/status/1", B, "korrigiert")], {("anna", "https://x.com/u/status/1"): first})
+    assert written == [(first, row("anna", "https://x.com/u/status/1", B, "korrigiert"))]
+    assert backend.read_all_rows() == [row("anna", "https://x.com/u/status/1", B, "korrigiert"), row("ben", "https://x.com/u/status/1", A)]
+    assert backend.moved_rows == 0
+
+
+def test_moved_row_falls_back_to_append():
+    backend = sheets(None)
+    backend.append_rows([row("anna", "https://x.com/u/status/1", A), row("ben", "https://x.com/u/status/2", A)])
+    worksheet = backend.worksheet
+    worksheet.rows[1:3] = [worksheet.rows[2], worksheet.rows[1]] # Von Hand sortiert: die Zeilen haben getauscht
+    written = upsert(backend, [row("anna", "https://x.com/u/status/1", C)], {("anna", "https://x.com/u/status/1"): 2})
+    assert written == [(4, row("anna", "https://x.com/u/status/1", C))]
+    assert backend.read_all_rows() == [row("ben", "https://x.com/u/status/2", A), row("anna", "https://x.com/u/status/1", A), row("anna", "https://x.com/u/status/1", C)]
+    assert backend.moved_rows == 1 and backend.stats()["moved_rows"] == 1
+
+    del worksheet.rows[2:] # Das Sheet ist geschrumpft: die Zielzeile liegt hinter dem Raster
+    upsert(backend, [row("ben", "https://x.com/u/status/2", B)], {("ben", "https://x.com/u/status/2"): 5})
+    assert backend.read_all_rows() == [row("ben", "https://x.com/u/status/2", A), row("ben", "https://x.com/u/status/2", B)]
+    assert backend.moved_rows == 2
+
+
+@both
+def test_compaction_keeps_the_latest_row_per_labeler_and_url(tmp_path, make_backend):
+    backend = make_backend(tmp_path)
+    backend.append_rows([row("anna", "https://x.com/u/status/1", A), row("ben", "https://x.com/u/status/1", "=1+1"),
+                         row("anna", "https://x.com/u/status/1", B), row("", "", ""), row("anna", "https://x.com/u/status/2", "0012"),
+                         row("anna", "https://x.com/u/status/1", C, "letzte")])
+    assert backend.compact(LBL, URL, dry_run=True) == {"before": 6, "after": 4, "reclaimed": 2}
+    assert backend.compact(LBL, URL) == {"before": 6, "after": 4, "reclaimed": 2}
+    # Zeilen ohne Schlüssel bleiben; Werte bleiben Text (RAW): keine Formeln, keine Zahlen
+    assert backend.read_all_rows() == [row("ben", "https://x.com/u/status/1", "=1+1"), row("", "", ""), row("anna", "https://x.com/u/status/2", "0012"),
+                                       row("anna", "https://x.com/u/status/1", C, "letzte")]
+    assert backend.compact(LBL, URL)["reclaimed"] == 0
+
+
+def test_sheets_compaction_is_one_atomic_request():
+    class FailingWrites(FakeWorksheet):
+        def _api_call(self):
+            super()._api_call()
+            if self.fail and self.calls > 1: raise self._api_error(503, "UNAVAILABLE", "Backend error")
+    backend = GoogleSheetsBackend(FailingWrites(), HEADER, "fake")
+    backend.worksheet.fail = False
+    backend.ensure_header()
+    backend.append_rows([row("anna", "https://x.com/u/status/1", A), row("anna", "https://x.com/u/status/1", B)])
+    before = [list(r) for r in backend.worksheet.rows]
+    backend.worksheet.fail, backend.worksheet.calls = True, 0
+    with pytest.raises(Exception): backend.compact(LBL, URL)
+    assert backend.worksheet.rows == before # Weder gekürzt noch halb überschrieben
+    backend.worksheet.fail = False
+    calls = backend.worksheet.calls
+    backend.compact(LBL, URL)
+    assert backend.worksheet.calls - calls == 2 # get_all_values + ein batch_update
+    assert backend.worksheet.rows == [HEADER, row("anna", "https://x.com/u/status/1", B)]
+
+
+def test_sqlite_rolls_back_a_failed_write(tmp_path):
+    backend = sqlite(tmp_path)
+    backend.append_rows([row("anna", "https://x.com/u/status/1", A)])
+    with pytest.raises(Exception): backend.append_rows([row("anna", "https://x.com/u/status/2", A), row("anna", {"kein": "text"}, A)])
+    with pytest.raises(Exception): backend.update_rows([(2, row("anna", "https://x.com/u/status/1", B)), (2, row("anna", object(), B))])
+    assert backend.read_all_rows() == [row("anna", "https://x.com/u/status/1", A)]
+    assert backend.append_rows([row("ben", "https://x.com/u/status/1", A)]) == 3 # Zeilennummern bleiben lückenlos
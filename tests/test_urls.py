@@ -0,0 +1,51 @@
+import json
+import os
+
+import numpy as np
+
+from labeler_urls import SortedHashRuns, build_url_table, read_variant_index
+
+
+def write_input(path, urls):
+    path.write_text("url\n" + "\n".join(urls) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_variants_of_a_tweet_collapse_into_one_item(tmp_path):
+    urls = ["https://x.com/u/status/1/photo/1", "https://example.com/a?id=1", "https://twitter.com/u/status/1/photo/2",
+            "https://x.com/u/status/2", "https://example.com/a?id=2", "https://x.com/u/status/1/photo/1",
+            "https://x.com/u/status/1?s=20", "kein link", "https://x.com/u/status/2"]
+    table = build_url_table(write_input(tmp_path / "in.csv", urls), str(tmp_path / "url_tables"), chunk_size=2)
+    assert list(table) == ["https://x.com/u/status/1/photo/1", "https://example.com/a?id=1", "https://x.com/u/status/2", "https://example.com/a?id=2"]
+    assert table.collapsed == 4
+    # Repräsentant zuerst, jede weitere Variante einmal; exakte Wiederholungen ergeben keinen Eintrag
+    assert read_variant_index(table.variants_path) == {"1": ["https://x.com/u/status/1/photo/1", "https://twitter.com/u/status/1/photo/2", "https://x.com/u/status/1?s=20"]}
+    assert table.index_of("https://www.x.com/U/status/1/video/1") == 0 and table.index_of("https://example.com/a?id=2") == 3
+    assert table.index_of("https://x.com/u/status/3") is None
+
+
+def test_a_changed_input_replaces_the_old_table_of_that_file(tmp_path):
+    tables_dir = str(tmp_path / "url_tables")
+    other = build_url_table(write_input(tmp_path / "other.csv", ["https://x.com/u/status/9"]), tables_dir)
+    input_path = write_input(tmp_path / "in.csv", ["https://x.com/u/status/1"])
+    old = build_url_table(input_path, tables_dir)
+    os.makedirs(os.path.join(old.table_dir, "prelabels"))
+    stat = os.stat(input_path)
+    write_input(tmp_path / "in.csv", ["https://x.com/u/status/1", "https://x.com/u/status/2"])
+    os.utime(input_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    new = build_url_table(input_path, tables_dir)
+    assert len(new) == 2 and not os.path.exists(old.table_dir)
+    assert sorted(os.listdir(tables_dir)) == sorted([os.path.basename(new.table_dir), os.path.basename(other.table_dir)])
+    with open(os.path.join(new.table_dir, "meta.json"), encoding="utf-8") as f: assert json.load(f)["items"] == 2
+
+
+def test_sorted_hash_runs_membership():
+    runs, rng, added = SortedHashRuns(), np.random.default_rng(1), np.zeros(0, dtype=np.uint64)
+    for size in (5, 3, 17, 1, 64, 2):
+        batch = np.unique(rng.integers(0, 2**63, size, dtype=np.uint64))
+        batch = batch[~runs.contains(batch)]
+        runs.add(batch); added = np.concatenate([added, batch])
+    assert len(runs) == len(added) and len(runs.runs) <= 4
+    assert runs.contains(added).all()
+    assert not runs.contains(np.array([1, 2, 3], dtype=np.uint64)).any()
+    assert SortedHashRuns().contains(np.array([7], dtype=np.uint64)).tolist() == [False]
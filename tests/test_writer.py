@@ -0,0 +1,89 @@
+import sqlite3
+import threading
+import time
+
+from labeler_writer import WriteBehindQueue
+
+
+class Sink:
+    """flush_fn, die Zeilen sammelt; `fail(row)` entscheidet pro Zeile über einen Fehler."""
+
+    def __init__(self, fail=None):
+        self.rows, self.calls, self.fail = [], 0, fail
+        self.lock = threading.Lock()
+
+    def __call__(self, rows):
+        with self.lock:
+            self.calls += 1
+            for row in rows:
+                if self.fail:
+                    error = self.fail(row, self.calls)
+                    if error: raise error
+            self.rows.extend(rows)
+
+
+def test_rows_survive_a_crash_and_are_flushed_by_the_next_process(tmp_path):
+    journal = str(tmp_path / "journal.sqlite")
+    down = Sink(fail=lambda row, call: ConnectionError("offline"))
+    queue = WriteBehindQueue(journal, down, flush_interval=0.01, max_backoff=0.05, claim_seconds=0.2)
+    queue.enqueue_many([["a", "1"], ["b", "2"]])
+    assert not queue.flush(timeout=0.3) # Ohne Verbindung bleibt alles im Journal
+    queue._stopped.set(); queue._thread.join(1) # "Absturz": kein close(), Ansprüche bleiben stehen
+    time.sleep(0.3) # ... bis sie ablaufen
+
+    sink = Sink()
+    restarted = WriteBehindQueue(journal, sink, flush_interval=0.01)
+    assert restarted.pending_count() == 2
+    assert restarted.flush(timeout=5)
+    assert sink.rows == [["a", "1"], ["b", "2"]]
+    assert restarted.pending_count() == 0
+    restarted.close()
+
+
+def test_permanent_failure_is_dead_lettered_and_does_not_block_other_rows(tmp_path):
+    sink = Sink(fail=lambda row, call: ValueError("bad row") if row[0] == "bad" else None)
+    queue = WriteBehindQueue(str(tmp_path / "journal.sqlite"), sink, flush_interval=0.01)
+    queue.enqueue_many([["ok1"], ["bad"], ["ok2"], ["ok3"]])
+    assert queue.flush(timeout=5)
+    assert sorted(sink.rows) == [["ok1"], ["ok2"], ["ok3"]]
+    assert queue.failed_count() == 1 and queue.dead_lettered == 1
+    assert queue.flush_failures == 3 and queue.retries == 0 # Batch, Hälfte mit "bad", "bad" allein
+    queue.enqueue(["ok4"])
+    assert queue.flush(timeout=5) and ["ok4"] in sink.rows
+
+    sink.fail = None
+    assert queue.retry_failed() == 1
+    assert queue.flush(timeout=5) and ["bad"] in sink.rows and queue.failed_count() == 0
+    queue.close()
+
+
+def test_transient_failures_are_retried(tmp_path):
+    sink = Sink(fail=lambda row, call: TimeoutError("slow") if call < 3 else None)
+    queue = WriteBehindQueue(str(tmp_path / "journal.sqlite"), sink, flush_interval=0.01, max_backoff=0.02)
+    queue.enqueue(["x"])
+    assert queue.flush(timeout=5)
+    assert sink.rows == [["x"]] and queue.retries == queue.flush_failures == 2 and queue.failed_count() == 0
+    queue.close()
+
+
+def test_two_writers_on_one_journal_write_each_row_once(tmp_path):
+    journal = str(tmp_path / "journal.sqlite")
+    sink = Sink()
+    slow = lambda rows: (time.sleep(0.01), sink(rows))
+    first = WriteBehindQueue(journal, slow, batch_size=7, flush_interval=0.01)
+    second = WriteBehindQueue(journal, slow, batch_size=7, flush_interval=0.01)
+    for i in range(200): (first if i % 2 else second).enqueue([str(i)])
+    deadline = time.monotonic() + 10
+    while (first.pending_count() or second.pending_count()) and time.monotonic() < deadline: first.flush(0.2); second.flush(0.2)
+    first.close(); second.close()
+    assert sorted(int(r[0]) for r in sink.rows) == list(range(200))
+    assert sqlite3.connect(journal).execute("SELECT COUNT(*) FROM pending").fetchone()[0] == 0
+
+
+def test_flush_returns_as_soon_as_the_journal_drains(tmp_path):
+    queue = WriteBehindQueue(str(tmp_path / "journal.sqlite"), Sink(), flush_interval=60.0) # Ohne Wecken liefe der Writer erst in 60 s
+    queue.enqueue(["x"])
+    start = time.monotonic()
+    assert queue.flush(timeout=5)
+    assert time.monotonic() - start < 1.0
+    queue.close()